@@ -54,6 +54,8 @@ class CustomUser(AbstractBaseUser):
 
 class CourseEnrollment(models.Model):
     """Model for course enrollments"""
+    STATS_FIELDS = ('course_id', 'is_active')
+
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, verbose_name="Пользователь")
     course = models.ForeignKey('courses.Courses', on_delete=models.CASCADE, verbose_name="Курс")
     enrolled_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата записи")
@@ -66,4 +68,11 @@ class CourseEnrollment(models.Model):
         ordering = ['-enrolled_at']
     
     def __str__(self):
-        return f"{self.user.email} - {self.course.name}"
\ No newline at end of file
+        return f"{self.user.email} - {self.course.name}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what the course statistics count, a save then applies the difference
+        instance._loaded_stats = tuple(instance.__dict__.get(field) for field in cls.STATS_FIELDS)
+        return instance
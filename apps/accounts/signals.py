@@ -1,7 +1,7 @@
 from django.db.models.signals import post_save
 from django.dispatch import receiver
-from django.core.mail import send_mail
 from django.conf import settings
+from apps.jobs.mail import queue_template_email
 from django.contrib.auth import get_user_model
 import secrets
 import string
@@ -25,31 +25,14 @@ def send_user_credentials_email(sender, instance, created, **kwargs):
             instance.set_password(password)
             instance.save()
         
-        # Prepare email content in Russian
-        subject = 'Ваши данные для входа в Profactive'
-        
-        message = f'''
-Здравствуйте, {instance.first_name} {instance.last_name}!
-
-Администратор создал для вас аккаунт в системе Profactive.
-
-Ваши данные для входа:
-Email: {instance.email}
-Пароль: {password}
-
-Теперь вы можете войти в систему и просматривать ваши курсы.
-
-С уважением,
-Команда Profactive
-        '''
-        
+        # The password is erased from the spooled message once it is sent
         try:
-            send_mail(
-                subject=subject,
-                message=message,
-                from_email=settings.EMAIL_HOST_USER,
-                recipient_list=[instance.email],
-                fail_silently=False,
-            )
+            queue_template_email('user_credentials', {
+                'first_name': instance.first_name,
+                'last_name': instance.last_name,
+                'email': instance.email,
+                'password': password,
+                'login_url': settings.SITE_URL + settings.LOGIN_URL,
+            }, [instance.email], idempotency_key=f'user:{instance.pk}:credentials-email', sensitive=True)
         except Exception as e:
-            print(f"Error sending user credentials email: {e}")
+            print(f"Error queueing user credentials email: {e}")
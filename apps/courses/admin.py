@@ -1,9 +1,10 @@
 from django.contrib import admin
 from django import forms
 from django.utils.html import format_html
+from django.db.models import Count, DurationField, OuterRef, Subquery, Sum
 from .models import (
     Categories, MainCategory, SubCategory, Courses, CourseChapter, CourseChapterVideo, CourseChapterMaterials, CourseReview,
-    CourseQuiz, QuizQuestion, QuizAttempt, QuizCertificate)
+    CourseQuiz, QuizQuestion, QuizAttempt, QuizCertificate, CourseStats, VideoTranscode)
 
 
 class CourseChapterVideoInline(admin.TabularInline):
@@ -56,15 +57,17 @@ class CourseChapterMaterialsInline(admin.TabularInline):
 
 @admin.register(MainCategory)
 class MainCategoryAdmin(admin.ModelAdmin):
-    list_display = ['name', 'icon_preview', 'created_at', 'subcategories_count']
+    list_display = ['name', 'icon_preview', 'created_at', 'subcategories_count', 'total_courses_count']
     list_filter = ['created_at']
     search_fields = ['name']
     ordering = ['name']
-    readonly_fields = ['created_at']
-    fields = ['name', 'icon', 'created_at']
+    readonly_fields = ['created_at', 'total_courses_count']
+    fields = ['name', 'icon', 'created_at', 'total_courses_count']
 
     def get_queryset(self, request):
-        return super().get_queryset(request).filter(parent__isnull=True)
+        return super().get_queryset(request).filter(parent__isnull=True).annotate(
+            subcategories_total=Count('categories')
+        )
 
     def icon_preview(self, obj):
         if obj.icon:
@@ -74,18 +77,19 @@ class MainCategoryAdmin(admin.ModelAdmin):
     icon_preview.short_description = "Превью иконки"
 
     def subcategories_count(self, obj):
-        return obj.categories_set.filter(parent=obj).count()
+        return obj.subcategories_total
     subcategories_count.short_description = "Количество подкатегорий"
+    subcategories_count.admin_order_field = 'subcategories_total'
 
 
 @admin.register(SubCategory)
 class SubCategoryAdmin(admin.ModelAdmin):
-    list_display = ['name', 'parent', 'created_at']
+    list_display = ['name', 'parent', 'courses_count', 'created_at']
     list_filter = ['parent', 'created_at']
     search_fields = ['name']
     ordering = ['name']
-    readonly_fields = ['created_at']
-    fields = ['name', 'parent', 'created_at']
+    readonly_fields = ['created_at', 'courses_count']
+    fields = ['name', 'parent', 'created_at', 'courses_count']
 
     def get_queryset(self, request):
         return super().get_queryset(request).filter(parent__isnull=False)
@@ -98,11 +102,36 @@ class SubCategoryAdmin(admin.ModelAdmin):
 
 @admin.register(Courses)
 class CoursesAdmin(admin.ModelAdmin):
-    list_display = ['name', 'author', 'category', 'is_popular', 'created_at']
+    list_display = ['name', 'author', 'category', 'is_popular', 'lessons_count', 'total_duration', 'average_rating', 'orders_count', 'created_at']
     list_filter = ['category', 'is_popular', 'created_at']
     search_fields = ['name', 'author', 'description']
     ordering = ['-created_at']
+    list_select_related = ['category', 'stats']
     
+    def lessons_count(self, obj):
+        return obj.stats.lessons_count if hasattr(obj, 'stats') else 0
+    lessons_count.short_description = "Уроков"
+    lessons_count.admin_order_field = 'stats__lessons_count'
+
+    def total_duration(self, obj):
+        if not hasattr(obj, 'stats'):
+            return "00:00"
+        return f"{obj.stats.total_duration_hours:02d}:{obj.stats.total_duration_minutes:02d}"
+    total_duration.short_description = "Общая длительность"
+    total_duration.admin_order_field = 'stats__total_duration'
+
+    def average_rating(self, obj):
+        if hasattr(obj, 'stats') and obj.stats.average_rating is not None:
+            return f"{obj.stats.average_rating} ({obj.stats.reviews_count})"
+        return "—"
+    average_rating.short_description = "Рейтинг"
+    average_rating.admin_order_field = 'stats__average_rating'
+
+    def orders_count(self, obj):
+        return obj.stats.orders_count if hasattr(obj, 'stats') else 0
+    orders_count.short_description = "Заказов"
+    orders_count.admin_order_field = 'stats__orders_count'
+
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
         if db_field.name == "category":
             # Show only sub-categories (categories that have a parent)
@@ -117,10 +146,23 @@ class CourseChapterAdmin(admin.ModelAdmin):
     search_fields = ['title', 'course__name', 'description']
     ordering = ['-created_at']
     readonly_fields = ['created_at']
+    list_select_related = ['course']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            materials_total=Count('coursechaptermaterials'),
+            # Subquery: a second join would multiply the sum by the number of materials
+            active_videos_duration=Subquery(
+                CourseChapterVideo.objects.filter(chapter=OuterRef('pk'), is_activate=True)
+                .values('chapter').annotate(total=Sum('video_time')).values('total'),
+                output_field=DurationField(),
+            ),
+        )
 
     def materials_count(self, obj):
-        return obj.coursechaptermaterials_set.count()
+        return obj.materials_total
     materials_count.short_description = "Количество материалов"
+    materials_count.admin_order_field = 'materials_total'
 
     def total_duration(self, obj):
         total_seconds = obj.get_total_duration()
@@ -132,11 +174,12 @@ class CourseChapterAdmin(admin.ModelAdmin):
 
 @admin.register(CourseChapterVideo)
 class CourseChapterVideoAdmin(admin.ModelAdmin):
-    list_display = ['chapter', 'title', 'is_activate', 'is_free']
-    list_filter = ['chapter__course', 'is_activate', 'is_free']
+    list_display = ['chapter', 'title', 'video_time', 'transcode_status', 'is_activate', 'is_free']
+    list_filter = ['chapter__course', 'is_activate', 'is_free', 'transcode__status']
     search_fields = ['title', 'chapter__title', 'chapter__course__name']
     ordering = ['chapter']
     readonly_fields = ['created_at']
+    actions = ['enqueue_transcode']
     
     fieldsets = (
         ('Основная информация', {
@@ -153,13 +196,25 @@ class CourseChapterVideoAdmin(admin.ModelAdmin):
     )
 
     def get_queryset(self, request):
-        return super().get_queryset(request).select_related('chapter__course')
+        return super().get_queryset(request).select_related('chapter__course', 'transcode')
     
     def formfield_for_duration_field(self, db_field, request, **kwargs):
         if db_field.name == 'video_time':
             kwargs['widget'] = forms.TextInput(attrs={'placeholder': 'HH:MM:SS (например: 01:30:00)'})
         return super().formfield_for_duration_field(db_field, request, **kwargs)
 
+    def transcode_status(self, obj):
+        try:
+            return obj.transcode.get_status_display()
+        except VideoTranscode.DoesNotExist:
+            return '-'
+    transcode_status.short_description = "HLS"
+
+    def enqueue_transcode(self, request, queryset):
+        jobs = VideoTranscode.enqueue(queryset)
+        self.message_user(request, f'В очередь транскодирования поставлено {len(jobs)} видео')
+    enqueue_transcode.short_description = "Перекодировать в HLS"
+
 
 @admin.register(CourseChapterMaterials)
 class CourseChapterMaterialsAdmin(admin.ModelAdmin):
@@ -237,6 +292,26 @@ class CourseReviewAdmin(admin.ModelAdmin):
     comment_preview.short_description = "Комментарий"
 
 
+def regrade_quizzes(quiz_ids):
+    """Re-score completed attempts of the given quizzes, update certificates and affected order progress"""
+    from apps.order.models import CourseOrder, OrderProgress
+    
+    # Answer keys may have been changed by bulk updates that bypass signals
+    for quiz_id in quiz_ids:
+        CourseQuiz.bump_questions_version(quiz_id)
+    
+    attempts = QuizAttempt.objects.filter(quiz_id__in=quiz_ids, is_completed=True)
+    changed = QuizAttempt.rescore(attempts)
+    if changed:
+        QuizCertificate.sync_with_attempts(changed)
+        orders = CourseOrder.objects.filter(
+            user_id__in={attempt.user_id for attempt in changed},
+            course__coursequiz__id__in={attempt.quiz_id for attempt in changed},
+        )
+        OrderProgress.refresh_for_orders(orders)
+    return changed
+
+
 class QuizQuestionInline(admin.TabularInline):
     model = QuizQuestion
     extra = 1
@@ -257,6 +332,7 @@ class CourseQuizAdmin(admin.ModelAdmin):
     ordering = ['-created_at']
     readonly_fields = ['created_at', 'updated_at']
     inlines = [QuizQuestionInline]
+    actions = ['regrade_attempts']
     
     fieldsets = (
         ('Основная информация', {
@@ -270,6 +346,17 @@ class CourseQuizAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
+    
+    def regrade_attempts(self, request, queryset):
+        changed = regrade_quizzes(list(queryset.values_list('id', flat=True)))
+        self.message_user(request, f"Пересчитано попыток: {len(changed)}")
+    regrade_attempts.short_description = "Пересчитать результаты попыток"
+    
+    def save_formset(self, request, form, formset, change):
+        super().save_formset(request, form, formset, change)
+        # Corrected answers in the inline re-grade existing attempts
+        if formset.model is QuizQuestion and any('correct_answer' in f.changed_data for f in formset.forms):
+            regrade_quizzes([form.instance.id])
 
 
 @admin.register(QuizQuestion)
@@ -302,6 +389,11 @@ class QuizQuestionAdmin(admin.ModelAdmin):
     def question_preview(self, obj):
         return obj.question_text[:50] + "..." if len(obj.question_text) > 50 else obj.question_text
     question_preview.short_description = "Вопрос"
+    
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change and 'correct_answer' in form.changed_data:
+            regrade_quizzes([obj.quiz_id])
 
 
 @admin.register(QuizAttempt)
@@ -311,7 +403,7 @@ class QuizAttemptAdmin(admin.ModelAdmin):
     list_filter = ['quiz', 'is_passed', 'is_completed', 'started_at']
     search_fields = ['user__email', 'quiz__title', 'quiz__course__name']
     ordering = ['-started_at']
-    readonly_fields = ['started_at', 'completed_at', 'score', 'percentage', 'is_passed', 'time_taken']
+    readonly_fields = ['started_at', 'completed_at', 'score', 'percentage', 'is_passed', 'time_taken', 'question_ids', 'question_seed']
     
     fieldsets = (
         ('Основная информация', {
@@ -325,7 +417,7 @@ class QuizAttemptAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
         ('Ответы', {
-            'fields': ('answers',),
+            'fields': ('answers', 'question_ids', 'question_seed'),
             'classes': ('collapse',)
         }),
     )
@@ -391,3 +483,42 @@ class QuizCertificateAdmin(admin.ModelAdmin):
         
         super().save_model(request, obj, form, change)
 
+
+@admin.register(CourseStats)
+class CourseStatsAdmin(admin.ModelAdmin):
+    list_display = ['course', 'chapters_count', 'lessons_count', 'materials_count', 'total_duration', 'average_rating', 'reviews_count', 'enrollments_count', 'orders_count', 'updated_at']
+    search_fields = ['course__name']
+    readonly_fields = ['course', 'chapters_count', 'lessons_count', 'materials_count', 'total_duration', 'reviews_count', 'average_rating', 'enrollments_count', 'orders_count', 'updated_at']
+    ordering = ['-orders_count']
+    list_select_related = ['course']
+    actions = ['refresh_stats']
+
+    def has_add_permission(self, request):
+        return False
+
+    def refresh_stats(self, request, queryset):
+        stats = CourseStats.refresh_for_courses(queryset.values_list('course_id', flat=True))
+        self.message_user(request, f'Обновлена статистика {len(stats)} курсов')
+    refresh_stats.short_description = "Пересчитать статистику"
+
+
+@admin.register(VideoTranscode)
+class VideoTranscodeAdmin(admin.ModelAdmin):
+    list_display = ['video', 'status', 'attempts', 'renditions_display', 'duration', 'created_at', 'finished_at']
+    list_filter = ['status']
+    search_fields = ['video__title', 'video__chapter__course__name', 'source_name']
+    readonly_fields = ['video', 'source_name', 'status', 'attempts', 'error', 'playlist', 'poster', 'renditions', 'duration', 'created_at', 'started_at', 'finished_at']
+    list_select_related = ['video']
+    actions = ['requeue']
+
+    def has_add_permission(self, request):
+        return False
+
+    def renditions_display(self, obj):
+        return ', '.join(rendition['name'] for rendition in obj.renditions) or '-'
+    renditions_display.short_description = "Качества"
+
+    def requeue(self, request, queryset):
+        jobs = VideoTranscode.enqueue(CourseChapterVideo.objects.filter(transcode__in=queryset))
+        self.message_user(request, f'Повторно поставлено в очередь {len(jobs)} видео')
+    requeue.short_description = "Поставить в очередь заново"
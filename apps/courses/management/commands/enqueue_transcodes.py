@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from apps.courses.models import CourseChapterVideo, VideoTranscode
+
+
+class Command(BaseCommand):
+    help = 'Queue HLS transcoding of videos that were never transcoded (backfill); run_jobs does the work'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--failed', action='store_true', help='Also re-queue videos whose transcoding failed')
+
+    def handle(self, *args, **options):
+        missing = CourseChapterVideo.objects.filter(transcode__isnull=True)
+        if options['failed']:
+            missing |= CourseChapterVideo.objects.filter(transcode__status=VideoTranscode.STATUS_FAILED)
+        jobs = VideoTranscode.enqueue(missing.exclude(video_file=''))
+        self.stdout.write(self.style.SUCCESS(f'Queued {len(jobs)} videos'))
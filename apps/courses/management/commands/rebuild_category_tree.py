@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from apps.courses.models import Categories
+
+
+class Command(BaseCommand):
+    help = 'Recompute category paths and denormalized course counts'
+
+    def handle(self, *args, **options):
+        total = Categories.rebuild_tree()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {total} categories'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from apps.courses.models import Courses, CourseStats
+
+
+class Command(BaseCommand):
+    help = 'Recompute denormalized statistics for all courses'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Courses recomputed per batch')
+        parser.add_argument('--course', type=int, action='append', dest='course_ids', help='Rebuild only the given course id (repeatable)')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        courses = Courses.objects.order_by('id')
+        if options['course_ids']:
+            courses = courses.filter(id__in=options['course_ids'])
+        course_ids = list(courses.values_list('id', flat=True))
+
+        total = 0
+        for start in range(0, len(course_ids), batch_size):
+            total += len(CourseStats.refresh_for_courses(course_ids[start:start + batch_size]))
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt statistics for {total} courses'))
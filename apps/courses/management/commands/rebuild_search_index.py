@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from apps.courses import search
+from apps.courses.models import Courses
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text course search index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Courses indexed per batch')
+
+    def handle(self, *args, **options):
+        if not search.is_indexed():
+            self.stdout.write(self.style.WARNING('This database has no search index, icontains filters are used instead'))
+            return
+        search.create_index()
+        total = search.rebuild_index(Courses.objects.all(), batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {total} courses'))
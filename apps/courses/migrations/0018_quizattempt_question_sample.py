@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-17 13:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0017_remove_option_d'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quizattempt',
+            name='question_ids',
+            field=models.JSONField(blank=True, default=list, verbose_name='Выданные вопросы'),
+        ),
+        migrations.AddField(
+            model_name='quizattempt',
+            name='question_seed',
+            field=models.BigIntegerField(blank=True, null=True, verbose_name='Seed выборки вопросов'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.6 on 2026-10-17 14:10
+
+from django.db import migrations
+
+from apps.courses import search
+
+
+def create_search_index(apps, schema_editor):
+    """Create the full-text table and index existing courses"""
+    search.create_index()
+    search.rebuild_index(apps.get_model('courses', 'Courses').objects.all())
+
+
+def drop_search_index(apps, schema_editor):
+    search.drop_index()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0018_quizattempt_question_sample'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-17 13:06
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0019_course_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='courses',
+            index=models.Index(fields=['-created_at', '-id'], name='courses_created_id_idx'),
+        ),
+    ]
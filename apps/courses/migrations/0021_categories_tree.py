@@ -0,0 +1,62 @@
+# Generated by Django 5.2.6 on 2026-10-17 13:07
+
+from django.db import migrations, models
+
+
+def build_tree(apps, schema_editor):
+    """Fill materialized paths, depths and course counts for existing categories"""
+    Categories = apps.get_model('courses', 'Categories')
+    Courses = apps.get_model('courses', 'Courses')
+
+    categories = {category.pk: category for category in Categories.objects.all()}
+    direct_counts = dict(
+        Courses.objects.values('category_id').annotate(count=models.Count('id')).values_list('category_id', 'count')
+    )
+
+    for category in categories.values():
+        ids = [category.pk]
+        parent = categories.get(category.parent_id)
+        while parent is not None and parent.pk not in ids:
+            ids.append(parent.pk)
+            parent = categories.get(parent.parent_id)
+        category.path = '/' + '/'.join(str(pk) for pk in reversed(ids)) + '/'
+        category.depth = len(ids) - 1
+        category.courses_count = direct_counts.get(category.pk, 0)
+    for category in categories.values():
+        for ancestor_id in category.path.strip('/').split('/'):
+            categories[int(ancestor_id)].total_courses_count += category.courses_count
+
+    Categories.objects.bulk_update(
+        categories.values(), ['path', 'depth', 'courses_count', 'total_courses_count'], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0020_courses_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='categories',
+            name='courses_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Курсов в категории'),
+        ),
+        migrations.AddField(
+            model_name='categories',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Уровень вложенности'),
+        ),
+        migrations.AddField(
+            model_name='categories',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255, verbose_name='Путь в дереве'),
+        ),
+        migrations.AddField(
+            model_name='categories',
+            name='total_courses_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Курсов с подкатегориями'),
+        ),
+        migrations.RunPython(build_tree, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-17 13:09
+
+import datetime
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0021_categories_tree'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chapters_count', models.PositiveIntegerField(default=0, verbose_name='Количество глав')),
+                ('lessons_count', models.PositiveIntegerField(default=0, verbose_name='Количество уроков')),
+                ('materials_count', models.PositiveIntegerField(default=0, verbose_name='Количество материалов')),
+                ('total_duration', models.DurationField(default=datetime.timedelta(0), verbose_name='Общая длительность')),
+                ('reviews_count', models.PositiveIntegerField(default=0, verbose_name='Количество отзывов')),
+                ('average_rating', models.DecimalField(blank=True, decimal_places=2, max_digits=3, null=True, verbose_name='Средний рейтинг')),
+                ('enrollments_count', models.PositiveIntegerField(default=0, verbose_name='Количество записей')),
+                ('orders_count', models.PositiveIntegerField(default=0, verbose_name='Количество заказов')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+                ('course', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='courses.courses', verbose_name='Курс')),
+            ],
+            options={
+                'verbose_name': 'Статистика курса',
+                'verbose_name_plural': '12. Статистика курсов',
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.6 on 2026-10-17 13:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0022_coursestats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VideoTranscode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_name', models.CharField(max_length=255, verbose_name='Исходный файл')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('processing', 'Обрабатывается'), ('ready', 'Готово'), ('failed', 'Ошибка')], db_index=True, default='pending', max_length=20, verbose_name='Статус')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Попыток')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('playlist', models.CharField(blank=True, max_length=255, verbose_name='HLS плейлист')),
+                ('poster', models.CharField(blank=True, max_length=255, verbose_name='Постер')),
+                ('renditions', models.JSONField(blank=True, default=list, verbose_name='Качества')),
+                ('duration', models.DurationField(blank=True, null=True, verbose_name='Длительность')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Начало обработки')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Окончание обработки')),
+                ('video', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='transcode', to='courses.coursechaptervideo', verbose_name='Видео')),
+            ],
+            options={
+                'verbose_name': 'Транскодирование видео',
+                'verbose_name_plural': '13. Транскодирование видео',
+                'ordering': ['created_at'],
+            },
+        ),
+    ]
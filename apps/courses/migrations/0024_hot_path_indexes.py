@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-17 13:27
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0023_videotranscode'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='quizattempt',
+            index=models.Index(fields=['user', 'quiz', '-started_at'], name='courses_attempt_latest_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 13:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0024_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coursequiz',
+            name='questions_version',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Версия вопросов'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-17 16:20
+
+from django.db import migrations, models
+
+
+def fill_ratings_sum(apps, schema_editor):
+    CourseStats = apps.get_model('courses', 'CourseStats')
+    CourseReview = apps.get_model('courses', 'CourseReview')
+    sums = CourseReview.objects.filter(is_active=True).values('course_id').annotate(total=models.Sum('rating'))
+    for row in sums:
+        CourseStats.objects.filter(course_id=row['course_id']).update(ratings_sum=row['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0025_quiz_questions_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coursestats',
+            name='ratings_sum',
+            field=models.PositiveIntegerField(default=0, verbose_name='Сумма оценок'),
+        ),
+        migrations.RunPython(fill_ratings_sum, migrations.RunPython.noop),
+    ]
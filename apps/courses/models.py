@@ -1,14 +1,38 @@
-from django.db import models
+import random
+import secrets
+from django.db import models, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Cast, Concat, Greatest, Substr
 from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+from django.utils.connection import ConnectionProxy
 from django.core.exceptions import ValidationError
+from . import signed_media
 from datetime import timedelta
+from decimal import Decimal
 from apps.accounts.models import CustomUser
+from apps.jobs.queue import enqueue_on_commit
+from config.cache_backends import is_shared
+
+
+# Quiz questions and answer keys are cached next to other query results
+cache = ConnectionProxy(caches, 'querysets')
 
 
 class Categories(models.Model):
+    # The descendants map is invalidated by signals, which only reach the cache of the
+    # saving process: it is cached only when every worker shares the backend (file, Redis)
+    TREE_CACHE_KEY = 'categories:descendants'
+    TREE_CACHE_TIMEOUT = 60 * 60
+
     name = models.CharField(max_length=100, verbose_name="Название категории")
     icon = models.ImageField(upload_to='category_icons/', null=True, blank=True, verbose_name="Иконка категории")
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, verbose_name="Родительская категория")
+    path = models.CharField(max_length=255, default='', db_index=True, editable=False, verbose_name="Путь в дереве")
+    depth = models.PositiveSmallIntegerField(default=0, editable=False, verbose_name="Уровень вложенности")
+    courses_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Курсов в категории")
+    total_courses_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Курсов с подкатегориями")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
 
     class Meta:
@@ -18,22 +42,128 @@ class Categories(models.Model):
 
     def __str__(self):
         return self.name
-    
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored parent so save() can tell when the node was moved
+        instance._loaded_parent_id = instance.__dict__.get('parent_id')
+        return instance
+
+    def save(self, *args, **kwargs):
+        moved = self._state.adding or self.parent_id != getattr(self, '_loaded_parent_id', None)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if moved:
+                self.move_subtree()
+        self._loaded_parent_id = self.parent_id
+
+    @staticmethod
+    def path_ids(path):
+        """Ids of the nodes on a path, root first: '/1/5/' -> [1, 5]"""
+        return [int(pk) for pk in path.strip('/').split('/') if pk]
+
+    def get_ancestor_ids(self, include_self=True):
+        ids = self.path_ids(self.path)
+        return ids if include_self else ids[:-1]
+
+    def move_subtree(self):
+        """Rewrite path and depth of this node and its descendants, and move its course count to the new ancestors"""
+        parent_path = Categories.objects.filter(pk=self.parent_id).values_list('path', flat=True).first() if self.parent_id else None
+        new_path = f'{parent_path or "/"}{self.pk}/'
+        old_path = self.path
+        if old_path == new_path:
+            return
+        new_depth = new_path.count('/') - 2
+
+        if old_path:
+            old_ancestor_ids = self.path_ids(old_path)[:-1]
+            Categories.objects.filter(path__startswith=old_path).update(
+                path=Concat(Value(new_path), Substr('path', len(old_path) + 1)),
+                depth=F('depth') + (new_depth - self.depth),
+            )
+            if self.total_courses_count:
+                Categories.objects.filter(pk__in=old_ancestor_ids).update(
+                    total_courses_count=F('total_courses_count') - self.total_courses_count
+                )
+                Categories.objects.filter(pk__in=self.path_ids(new_path)[:-1]).update(
+                    total_courses_count=F('total_courses_count') + self.total_courses_count
+                )
+        else:
+            Categories.objects.filter(pk=self.pk).update(path=new_path, depth=new_depth)
+
+        self.path = new_path
+        self.depth = new_depth
+
+    @classmethod
+    def adjust_courses_count(cls, category_id, delta):
+        """Add `delta` courses to a category and to the totals of all its ancestors"""
+        path = cls.objects.filter(pk=category_id).values_list('path', flat=True).first()
+        if not path:
+            return
+        cls.objects.filter(pk=category_id).update(courses_count=F('courses_count') + delta)
+        cls.objects.filter(pk__in=cls.path_ids(path)).update(total_courses_count=F('total_courses_count') + delta)
+
+    @classmethod
+    def rebuild_tree(cls):
+        """Recompute paths, depths and course counts of every category"""
+        categories = {category.pk: category for category in cls.objects.all()}
+        direct_counts = dict(
+            Courses.objects.values('category_id').annotate(count=models.Count('id')).values_list('category_id', 'count')
+        )
+
+        def build_path(category):
+            ids = [category.pk]
+            parent = categories.get(category.parent_id)
+            while parent is not None and parent.pk not in ids:
+                ids.append(parent.pk)
+                parent = categories.get(parent.parent_id)
+            return '/' + '/'.join(str(pk) for pk in reversed(ids)) + '/'
+
+        for category in categories.values():
+            category.path = build_path(category)
+            category.depth = category.path.count('/') - 2
+            category.courses_count = direct_counts.get(category.pk, 0)
+            category.total_courses_count = 0
+        for category in categories.values():
+            for ancestor_id in cls.path_ids(category.path):
+                categories[ancestor_id].total_courses_count += category.courses_count
+
+        cls.objects.bulk_update(
+            categories.values(), ['path', 'depth', 'courses_count', 'total_courses_count'], batch_size=500
+        )
+        cls.invalidate_tree_cache()
+        return len(categories)
+
+    @classmethod
+    def invalidate_tree_cache(cls):
+        cache.delete(cls.TREE_CACHE_KEY)
+
+    @classmethod
+    def get_descendants_map(cls):
+        """{category id: [its id and the ids of all its descendants]}, cached until the tree changes"""
+        shared = is_shared(caches['querysets'])
+        descendants = cache.get(cls.TREE_CACHE_KEY) if shared else None
+        if descendants is None:
+            descendants = {}
+            for pk, path in cls.objects.values_list('pk', 'path'):
+                for ancestor_id in cls.path_ids(path):
+                    descendants.setdefault(ancestor_id, []).append(pk)
+            if shared:
+                cache.set(cls.TREE_CACHE_KEY, descendants, cls.TREE_CACHE_TIMEOUT)
+        return descendants
+
+    @classmethod
+    def get_descendant_ids_for(cls, category_id):
+        return cls.get_descendants_map().get(int(category_id), [])
+
+    def get_descendant_ids(self):
+        """Ids of this category and all its subcategories at any depth"""
+        return self.get_descendant_ids_for(self.pk)
+
     def get_total_courses_count(self):
         """Get total count of courses in this category and all its subcategories"""
-        # Get all subcategories recursively
-        def get_all_subcategories(category):
-            subcategories = Categories.objects.filter(parent=category)
-            all_subcategories = list(subcategories)
-            for subcategory in subcategories:
-                all_subcategories.extend(get_all_subcategories(subcategory))
-            return all_subcategories
-        
-        # Get all categories (current + all subcategories)
-        all_categories = [self] + get_all_subcategories(self)
-        
-        # Count courses in all these categories
-        return Courses.objects.filter(category__in=all_categories).count()
+        return self.total_courses_count
 
 
 class MainCategory(Categories):
@@ -66,12 +196,25 @@ class Courses(models.Model):
         verbose_name = "Курс"
         verbose_name_plural = "03. Курсы"
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of the catalogue walks (-created_at, -id)
+            models.Index(fields=['-created_at', '-id'], name='courses_created_id_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored category so the category counters can follow a move
+        instance._loaded_category_id = instance.__dict__.get('category_id')
+        return instance
+
 
 class CourseChapter(models.Model):
+    STATS_FIELDS = ('course_id',)
+
     course = models.ForeignKey(Courses, on_delete=models.CASCADE, verbose_name="Курс")
     title = models.CharField(max_length=200, verbose_name="Название главы")
     description = models.TextField(blank=True, null=True, verbose_name="Описание главы")
@@ -87,16 +230,28 @@ class CourseChapter(models.Model):
     def __str__(self):
         return f"{self.course.name} - {self.title}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what the course statistics count, a save then applies the difference
+        instance._loaded_stats = tuple(instance.__dict__.get(field) for field in cls.STATS_FIELDS)
+        return instance
+
     def get_total_duration(self):
-        """Get total duration of all materials in this chapter"""
-        total_seconds = sum(
-            material.video_time.total_seconds() 
-            for material in self.coursechaptervideo_set.filter(is_activate=True)
-        )
-        return total_seconds
+        """Get total duration (seconds) of all active videos in this chapter"""
+        if hasattr(self, 'active_videos_duration'):
+            # Annotated by list views to avoid a query per chapter
+            duration = self.active_videos_duration
+        else:
+            duration = self.coursechaptervideo_set.filter(is_activate=True).aggregate(
+                total=models.Sum('video_time')
+            )['total']
+        return duration.total_seconds() if duration else 0
 
 
 class CourseChapterVideo(models.Model):
+    STATS_FIELDS = ('chapter_id', 'is_activate', 'video_time')
+
     chapter = models.ForeignKey(CourseChapter, on_delete=models.CASCADE, verbose_name="Глава")
     title = models.CharField(max_length=200, verbose_name="Название материала")
     description = models.TextField(blank=True, null=True, verbose_name="Описание материала")
@@ -115,11 +270,38 @@ class CourseChapterVideo(models.Model):
     def __str__(self):
         return f"{self.chapter.title} - {self.title}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored file to detect re-uploads that need transcoding
+        if 'video_file' in field_names:
+            instance._loaded_video_file = values[field_names.index('video_file')]
+        # and what the course statistics count, a save then applies the difference
+        instance._loaded_stats = tuple(instance.__dict__.get(field) for field in cls.STATS_FIELDS)
+        return instance
+
     def get_file_url(self):
-        """Get the video file URL if available"""
-        if self.video_file:
-            return self.video_file.url
-        return None
+        """Get a short-lived signed URL of the video file if available"""
+        return signed_media.media_url(self.video_file)
+
+    def get_transcode(self):
+        """Finished transcoding of the current file, or None"""
+        try:
+            transcode = self.transcode
+        except VideoTranscode.DoesNotExist:
+            return None
+        if transcode.status != VideoTranscode.STATUS_READY or transcode.source_name != self.video_file.name:
+            return None
+        return transcode
+
+    def get_hls_url(self):
+        """Signed URL of the HLS master playlist once the video is transcoded"""
+        transcode = self.get_transcode()
+        return signed_media.signed_hls_url(transcode.playlist) if transcode else None
+
+    def get_poster_url(self):
+        transcode = self.get_transcode()
+        return signed_media.signed_url(transcode.poster) if transcode and transcode.poster else None
 
 
 class CourseChapterMaterials(models.Model):
@@ -127,6 +309,7 @@ class CourseChapterMaterials(models.Model):
         ('document', 'Документ'),
         ('image', 'Изображение'),
     ]
+    STATS_FIELDS = ('chapter_id', 'is_activate')
     
     chapter = models.ForeignKey(CourseChapter, on_delete=models.CASCADE, verbose_name="Глава")
     title = models.CharField(max_length=200, verbose_name="Название материала")
@@ -162,6 +345,13 @@ class CourseChapterMaterials(models.Model):
     def __str__(self):
         return f"{self.chapter.title} - {self.title}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what the course statistics count, a save then applies the difference
+        instance._loaded_stats = tuple(instance.__dict__.get(field) for field in cls.STATS_FIELDS)
+        return instance
+
     def clean(self):
         """Validate that appropriate fields are filled based on material type"""
         super().clean()
@@ -186,16 +376,17 @@ class CourseChapterMaterials(models.Model):
                 })
 
     def get_file_url(self):
-        """Get the appropriate file URL based on material type"""
+        """Get the appropriate file URL based on material type (signed, see signed_media)"""
         if self.material_type == 'document' and self.document_file:
-            return self.document_file.url
+            return signed_media.media_url(self.document_file)
         elif self.material_type == 'image' and self.image_file:
-            return self.image_file.url
+            return signed_media.media_url(self.image_file)
         return None
 
 
 class CourseReview(models.Model):
     """Course review model for user comments"""
+    STATS_FIELDS = ('course_id', 'is_active', 'rating')
     RATING_CHOICES = [
         (1, '1 звезда'),
         (2, '2 звезды'),
@@ -223,6 +414,13 @@ class CourseReview(models.Model):
     def __str__(self):
         return f"{self.course.name} - {self.first_name} {self.last_name}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what the course statistics count, a save then applies the difference
+        instance._loaded_stats = tuple(instance.__dict__.get(field) for field in cls.STATS_FIELDS)
+        return instance
+
 
 class CourseQuiz(models.Model):
     """Quiz model for courses"""
@@ -233,6 +431,8 @@ class CourseQuiz(models.Model):
     passing_score = models.PositiveIntegerField(default=70, verbose_name="Проходной балл (%)")
     time_limit = models.PositiveIntegerField(default=30, verbose_name="Время на прохождение (минуты)")
     questions_count = models.PositiveIntegerField(default=10, verbose_name="Количество вопросов")
+    # Bumped on every question change, keys the cached question sets in all processes
+    questions_version = models.PositiveIntegerField(default=0, editable=False, verbose_name="Версия вопросов")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
 
@@ -244,11 +444,77 @@ class CourseQuiz(models.Model):
     def __str__(self):
         return f"{self.course.name} - {self.title}"
 
-    def get_random_questions(self, count=None):
-        """Get random questions for the quiz"""
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what order progress depends on, so only real changes refresh the snapshots
+        instance._loaded_course_id = instance.__dict__.get('course_id')
+        instance._loaded_is_active = instance.__dict__.get('is_active')
+        return instance
+
+    QUESTIONS_CACHE_TIMEOUT = 60 * 60 * 24
+
+    def get_random_questions(self, count=None, seed=None):
+        """Draw `count` (default questions_count) active questions from the cached question list.
+
+        Sampling runs in memory over the id-ordered list, so the same seed always
+        draws the same questions in the same order.
+        """
         if count is None:
             count = self.questions_count
-        return self.quizquestion_set.filter(is_active=True).order_by('id')
+        questions = sorted((question for question in self.get_questions() if question.is_active), key=lambda question: question.id)
+        if not count or count >= len(questions):
+            count = len(questions)
+        return random.Random(seed).sample(questions, count)
+
+    @classmethod
+    def bump_questions_version(cls, quiz_id):
+        """Invalidate cached questions and answer keys of a quiz"""
+        cls.objects.filter(id=quiz_id).update(questions_version=F('questions_version') + 1)
+
+    @classmethod
+    def get_questions_for(cls, quiz_ids):
+        """Cached question lists for several quizzes: {quiz id: [QuizQuestion, ...]}.
+
+        Entries are keyed by the questions_version column that QuizQuestion save/delete
+        bumps. The version is read from the database (one primary key lookup), so an
+        edit is seen by every worker even with a per-process cache, while the question
+        rows themselves are only loaded once per version.
+        """
+        quiz_ids = list(quiz_ids)
+        # The creation time tells apart a recreated quiz that got a reused id
+        versions = {
+            quiz_id: f'{created_at.timestamp()}:{version}'
+            for quiz_id, version, created_at in cls.objects.filter(id__in=quiz_ids).values_list(
+                'id', 'questions_version', 'created_at',
+            )
+        }
+        question_keys = {
+            quiz_id: f'quiz:{quiz_id}:questions:{versions[quiz_id]}'
+            for quiz_id in quiz_ids if quiz_id in versions
+        }
+        cached = cache.get_many(question_keys.values())
+        questions = {quiz_id: cached[key] for quiz_id, key in question_keys.items() if key in cached}
+
+        missing = [quiz_id for quiz_id in question_keys if quiz_id not in questions]
+        for quiz_id in quiz_ids:
+            questions.setdefault(quiz_id, [])
+        if missing:
+            for question in QuizQuestion.objects.filter(quiz_id__in=missing):
+                questions[question.quiz_id].append(question)
+            cache.set_many(
+                {question_keys[quiz_id]: questions[quiz_id] for quiz_id in missing},
+                cls.QUESTIONS_CACHE_TIMEOUT,
+            )
+        return questions
+
+    def get_questions(self):
+        """All questions of the quiz (active and inactive), served from the cache"""
+        return self.get_questions_for([self.id])[self.id]
+
+    def get_answer_key(self):
+        """Map of question id to correct answer for all questions of the quiz"""
+        return {question.id: question.correct_answer for question in self.get_questions()}
 
 
 class QuizQuestion(models.Model):
@@ -275,6 +541,13 @@ class QuizQuestion(models.Model):
     def __str__(self):
         return f"{self.quiz.title} - {self.question_text[:50]}..."
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the quiz so moving the question invalidates both quizzes
+        instance._loaded_quiz_id = instance.__dict__.get('quiz_id')
+        return instance
+
 
 class QuizAttempt(models.Model):
     """Quiz attempt model to track user attempts"""
@@ -287,6 +560,8 @@ class QuizAttempt(models.Model):
     is_passed = models.BooleanField(default=False, verbose_name="Пройден")
     is_completed = models.BooleanField(default=False, verbose_name="Завершен")
     answers = models.JSONField(default=dict, verbose_name="Ответы пользователя")
+    question_ids = models.JSONField(default=list, blank=True, verbose_name="Выданные вопросы")
+    question_seed = models.BigIntegerField(null=True, blank=True, verbose_name="Seed выборки вопросов")
     time_taken = models.PositiveIntegerField(default=0, verbose_name="Время прохождения (секунды)")
 
     class Meta:
@@ -294,33 +569,88 @@ class QuizAttempt(models.Model):
         verbose_name_plural = "10. Попытки прохождения тестов"
         ordering = ['-started_at']
         # Removed unique_together to allow multiple attempts
+        indexes = [
+            # Latest attempt of a user for a quiz
+            models.Index(fields=['user', 'quiz', '-started_at'], name='courses_attempt_latest_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.email} - {self.quiz.title} - {self.percentage}%"
 
-    def calculate_score(self):
-        """Calculate score based on answers"""
-        if not self.answers:
-            return 0, 0.0
-        
+    SCORE_FIELDS = ['score', 'percentage', 'is_passed']
+
+    @staticmethod
+    def new_question_seed():
+        """Random seed stored with the attempt so the drawn questions can be reproduced"""
+        return secrets.randbits(62)
+
+    def get_served_questions(self):
+        """Questions drawn for this attempt in the order they were served"""
+        questions = {question.id: question for question in self.quiz.get_questions()}
+        return [questions[question_id] for question_id in self.question_ids if question_id in questions]
+
+    def apply_score(self, answer_key, passing_score):
+        """Set score fields from an answer key ({question id: correct answer}) without saving"""
         correct_answers = 0
-        total_questions = len(self.answers)
+        answers = self.answers
+        total_questions = len(answers)
+        if self.question_ids:
+            # Only served questions count, unanswered ones count as wrong
+            served = {str(question_id) for question_id in self.question_ids}
+            answers = {question_id: answer for question_id, answer in answers.items() if question_id in served}
+            total_questions = len(served)
         
-        for question_id, user_answer in self.answers.items():
+        for question_id, user_answer in answers.items():
             try:
-                question = QuizQuestion.objects.get(id=question_id)
-                if user_answer == question.correct_answer:
+                if user_answer == answer_key.get(int(question_id)):
                     correct_answers += 1
-            except QuizQuestion.DoesNotExist:
+            except (TypeError, ValueError):
                 continue
         
         self.score = correct_answers
         self.percentage = (correct_answers / total_questions * 100) if total_questions > 0 else 0
-        self.is_passed = self.percentage >= self.quiz.passing_score
-        self.save()
+        self.is_passed = self.percentage >= passing_score
+        return self.score, self.percentage
+
+    def calculate_score(self, save=True):
+        """Calculate score based on answers"""
+        if not self.answers:
+            return 0, 0.0
+        
+        self.apply_score(self.quiz.get_answer_key(), self.quiz.passing_score)
+        if save:
+            self.save(update_fields=self.SCORE_FIELDS)
         
         return self.score, self.percentage
 
+    @classmethod
+    def rescore(cls, attempts):
+        """Re-grade many completed attempts at once, e.g. after a correct answer was fixed.
+
+        Loads the answer keys of all involved quizzes in one query and writes only
+        the attempts whose result changed. Returns the list of updated attempts.
+        """
+        attempts = [attempt for attempt in attempts if attempt.answers]
+        if not attempts:
+            return []
+        
+        quiz_ids = {attempt.quiz_id for attempt in attempts}
+        answer_keys = {
+            quiz_id: {question.id: question.correct_answer for question in questions}
+            for quiz_id, questions in CourseQuiz.get_questions_for(quiz_ids).items()
+        }
+        passing_scores = dict(CourseQuiz.objects.filter(id__in=quiz_ids).values_list('id', 'passing_score'))
+        
+        changed = []
+        for attempt in attempts:
+            before = (attempt.score, attempt.percentage, attempt.is_passed)
+            attempt.apply_score(answer_keys[attempt.quiz_id], passing_scores[attempt.quiz_id])
+            if (attempt.score, attempt.percentage, attempt.is_passed) != before:
+                changed.append(attempt)
+        
+        cls.objects.bulk_update(changed, cls.SCORE_FIELDS, batch_size=500)
+        return changed
+
 
 class QuizCertificate(models.Model):
     """Certificate model for passed quizzes"""
@@ -340,10 +670,14 @@ class QuizCertificate(models.Model):
     def __str__(self):
         return f"{self.user.email} - {self.quiz.title} - {self.certificate_number}"
 
+    @staticmethod
+    def generate_number():
+        import uuid
+        return f"CERT-{uuid.uuid4().hex[:8].upper()}"
+
     def save(self, *args, **kwargs):
         if not self.certificate_number:
-            import uuid
-            self.certificate_number = f"CERT-{uuid.uuid4().hex[:8].upper()}"
+            self.certificate_number = self.generate_number()
         
         # Prevent modification of user, quiz, and attempt fields for existing certificates
         if self.pk:
@@ -358,3 +692,264 @@ class QuizCertificate(models.Model):
         
         super().save(*args, **kwargs)
 
+    @classmethod
+    def sync_with_attempts(cls, attempts):
+        """Issue or revoke certificates after the given attempts were re-graded.
+
+        A passing attempt gets its user a certificate (or re-activates the existing one),
+        a user left without any passing attempt of the quiz loses it.
+        """
+        passed = {}
+        for attempt in attempts:
+            if attempt.is_passed:
+                passed.setdefault((attempt.user_id, attempt.quiz_id), attempt)
+        failed = {(attempt.user_id, attempt.quiz_id) for attempt in attempts if not attempt.is_passed} - set(passed)
+        if failed:
+            still_passed = set(QuizAttempt.objects.filter(
+                user_id__in={user_id for user_id, _ in failed},
+                quiz_id__in={quiz_id for _, quiz_id in failed},
+                is_completed=True,
+                is_passed=True,
+            ).values_list('user_id', 'quiz_id'))
+            failed -= still_passed
+
+        pairs = set(passed) | failed
+        if not pairs:
+            return
+        certificates = {
+            (certificate.user_id, certificate.quiz_id): certificate
+            for certificate in cls.objects.filter(
+                user_id__in={user_id for user_id, _ in pairs}, quiz_id__in={quiz_id for _, quiz_id in pairs},
+            )
+        }
+        revoked = [certificates[key].id for key in failed if key in certificates and certificates[key].is_active]
+        restored = [certificates[key].id for key in passed if key in certificates and not certificates[key].is_active]
+        issued = [
+            cls(user_id=user_id, quiz_id=quiz_id, attempt=attempt, certificate_number=cls.generate_number())
+            for (user_id, quiz_id), attempt in passed.items() if (user_id, quiz_id) not in certificates
+        ]
+        with transaction.atomic():
+            if revoked:
+                cls.objects.filter(id__in=revoked).update(is_active=False)
+            if restored:
+                cls.objects.filter(id__in=restored).update(is_active=True)
+            cls.objects.bulk_create(issued)
+
+
+
+class CourseStats(models.Model):
+    """Denormalized course statistics, kept current by signals with F() deltas (see apps/courses/signals.py)
+    and recomputed in bulk by `manage.py rebuild_course_stats`"""
+    course = models.OneToOneField(Courses, on_delete=models.CASCADE, related_name='stats', verbose_name="Курс")
+    chapters_count = models.PositiveIntegerField(default=0, verbose_name="Количество глав")
+    lessons_count = models.PositiveIntegerField(default=0, verbose_name="Количество уроков")
+    materials_count = models.PositiveIntegerField(default=0, verbose_name="Количество материалов")
+    total_duration = models.DurationField(default=timedelta(0), verbose_name="Общая длительность")
+    reviews_count = models.PositiveIntegerField(default=0, verbose_name="Количество отзывов")
+    ratings_sum = models.PositiveIntegerField(default=0, verbose_name="Сумма оценок")
+    average_rating = models.DecimalField(max_digits=3, decimal_places=2, null=True, blank=True, verbose_name="Средний рейтинг")
+    enrollments_count = models.PositiveIntegerField(default=0, verbose_name="Количество записей")
+    orders_count = models.PositiveIntegerField(default=0, verbose_name="Количество заказов")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
+
+    UPDATE_FIELDS = [
+        'chapters_count', 'lessons_count', 'materials_count', 'total_duration', 'reviews_count', 'ratings_sum',
+        'average_rating', 'enrollments_count', 'orders_count', 'updated_at',
+    ]
+
+    class Meta:
+        verbose_name = "Статистика курса"
+        verbose_name_plural = "12. Статистика курсов"
+
+    def __str__(self):
+        return f"Статистика: {self.course.name}"
+
+    @property
+    def total_duration_hours(self):
+        return int(self.total_duration.total_seconds() // 3600)
+
+    @property
+    def total_duration_minutes(self):
+        return int((self.total_duration.total_seconds() % 3600) // 60)
+
+    @classmethod
+    def build_for_courses(cls, course_ids):
+        """Compute unsaved statistics for the given courses with a fixed number of queries"""
+        from apps.accounts.models import CourseEnrollment
+        from apps.order.models import CourseOrder
+
+        course_ids = list(Courses.objects.filter(id__in=course_ids).values_list('id', flat=True))
+        if not course_ids:
+            return []
+
+        def grouped(queryset, course_field, **aggregates):
+            rows = queryset.values(course_field).annotate(**aggregates)
+            return {row[course_field]: row for row in rows}
+
+        count = models.Count('id')
+        chapters = grouped(CourseChapter.objects.filter(course_id__in=course_ids), 'course_id', count=count)
+        videos = grouped(
+            CourseChapterVideo.objects.filter(chapter__course_id__in=course_ids, is_activate=True),
+            'chapter__course_id', count=count, duration=models.Sum('video_time'),
+        )
+        materials = grouped(
+            CourseChapterMaterials.objects.filter(chapter__course_id__in=course_ids, is_activate=True),
+            'chapter__course_id', count=count,
+        )
+        reviews = grouped(
+            CourseReview.objects.filter(course_id__in=course_ids, is_active=True),
+            'course_id', count=count, ratings_sum=models.Sum('rating'),
+        )
+        enrollments = grouped(CourseEnrollment.objects.filter(course_id__in=course_ids, is_active=True), 'course_id', count=count)
+        orders = grouped(CourseOrder.objects.filter(course_id__in=course_ids), 'course_id', count=count)
+
+        stats = []
+        for course_id in course_ids:
+            reviews_count = reviews.get(course_id, {}).get('count', 0)
+            ratings_sum = reviews.get(course_id, {}).get('ratings_sum') or 0
+            stats.append(cls(
+                course_id=course_id,
+                chapters_count=chapters.get(course_id, {}).get('count', 0),
+                lessons_count=videos.get(course_id, {}).get('count', 0),
+                materials_count=materials.get(course_id, {}).get('count', 0),
+                total_duration=videos.get(course_id, {}).get('duration') or timedelta(0),
+                reviews_count=reviews_count,
+                ratings_sum=ratings_sum,
+                average_rating=round(Decimal(ratings_sum) / reviews_count, 2) if reviews_count else None,
+                enrollments_count=enrollments.get(course_id, {}).get('count', 0),
+                orders_count=orders.get(course_id, {}).get('count', 0),
+            ))
+        return stats
+
+    @classmethod
+    def refresh_for_courses(cls, course_ids):
+        """Recompute and persist statistics for the given courses"""
+        stats = cls.build_for_courses(course_ids)
+        if stats:
+            cls.objects.bulk_create(stats, update_conflicts=True, unique_fields=['course'], update_fields=cls.UPDATE_FIELDS)
+        return stats
+
+    @classmethod
+    def add(cls, course_id, deltas, create_missing=True):
+        """Apply {field: change} to the stored row of a course with F() expressions.
+
+        A missing row is built from scratch instead (it already includes the change),
+        unless `create_missing` is False.
+        """
+        updates = {}
+        for field, delta in deltas.items():
+            # Counters never go below zero, even if they drifted before a rebuild
+            updates[field] = Greatest(F(field) + delta, 0) if isinstance(delta, int) else F(field) + delta
+        if 'reviews_count' in deltas or 'ratings_sum' in deltas:
+            reviews_count = deltas.get('reviews_count', 0)
+            updates['average_rating'] = models.Case(
+                models.When(
+                    reviews_count__gt=-reviews_count,
+                    then=Cast(F('ratings_sum') + deltas.get('ratings_sum', 0), models.FloatField())
+                    / (F('reviews_count') + reviews_count),
+                ),
+                default=None,
+                output_field=models.DecimalField(max_digits=3, decimal_places=2),
+            )
+        updates['updated_at'] = timezone.now()
+        if not cls.objects.filter(course_id=course_id).update(**updates) and create_missing:
+            cls.refresh_for_courses([course_id])
+
+    @classmethod
+    def get_for_course(cls, course):
+        """Return the stored statistics, building them on first access"""
+        try:
+            return course.stats
+        except cls.DoesNotExist:
+            cls.refresh_for_courses([course.id])
+            return cls.objects.get(course=course)
+
+
+class VideoTranscode(models.Model):
+    """HLS renditions and poster of a chapter video, produced by the courses.transcode_video job"""
+    STATUS_PENDING = 'pending'
+    STATUS_PROCESSING = 'processing'
+    STATUS_READY = 'ready'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'В очереди'),
+        (STATUS_PROCESSING, 'Обрабатывается'),
+        (STATUS_READY, 'Готово'),
+        (STATUS_FAILED, 'Ошибка'),
+    ]
+    MAX_ATTEMPTS = 3
+    # Longer than probing, encoding and the poster grab together: a transcoding still
+    # processing after this long was abandoned by a dead worker
+    STALE_AFTER = timedelta(seconds=settings.VIDEO_TRANSCODE_TIMEOUT + 10 * 60)
+
+    video = models.OneToOneField(CourseChapterVideo, on_delete=models.CASCADE, related_name='transcode', verbose_name="Видео")
+    source_name = models.CharField(max_length=255, verbose_name="Исходный файл")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING, db_index=True, verbose_name="Статус")
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="Попыток")
+    error = models.TextField(blank=True, verbose_name="Ошибка")
+    playlist = models.CharField(max_length=255, blank=True, verbose_name="HLS плейлист")
+    poster = models.CharField(max_length=255, blank=True, verbose_name="Постер")
+    renditions = models.JSONField(default=list, blank=True, verbose_name="Качества")
+    duration = models.DurationField(null=True, blank=True, verbose_name="Длительность")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="Начало обработки")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Окончание обработки")
+
+    class Meta:
+        verbose_name = "Транскодирование видео"
+        verbose_name_plural = "13. Транскодирование видео"
+        ordering = ['created_at']
+
+    def __str__(self):
+        return f"{self.video.title} ({self.get_status_display()})"
+
+    @classmethod
+    def enqueue(cls, videos):
+        """Queue (or re-queue) transcoding of the current file of each video"""
+        jobs = [
+            cls(video=video, source_name=video.video_file.name, status=cls.STATUS_PENDING, attempts=0, error='')
+            for video in videos if video.video_file
+        ]
+        if jobs:
+            cls.objects.bulk_create(
+                jobs, update_conflicts=True, unique_fields=['video'],
+                update_fields=['source_name', 'status', 'attempts', 'error'],
+            )
+        for job in jobs:
+            enqueue_on_commit('courses.transcode_video', {'video_id': job.video.pk, 'source_name': job.source_name})
+        return jobs
+
+    @classmethod
+    def start(cls, video_id, source_name):
+        """Take the pending (or abandoned) transcoding of this file, None when it is no longer wanted:
+        the video was re-uploaded or deleted, or a duplicate job already did the work"""
+        now = timezone.now()
+        claimable = models.Q(status=cls.STATUS_PENDING) | models.Q(
+            status=cls.STATUS_PROCESSING, started_at__lt=now - cls.STALE_AFTER
+        )
+        # Another worker may win the race for the same row
+        started = cls.objects.filter(claimable, video_id=video_id, source_name=source_name).update(
+            status=cls.STATUS_PROCESSING, attempts=F('attempts') + 1, started_at=now, finished_at=None,
+        )
+        return cls.objects.select_related('video').get(video_id=video_id) if started else None
+
+    def _finish(self, **fields):
+        """Store the outcome unless the video was re-queued (re-uploaded) meanwhile"""
+        fields['finished_at'] = timezone.now()
+        updated = type(self).objects.filter(
+            pk=self.pk, status=self.STATUS_PROCESSING, source_name=self.source_name
+        ).update(**fields)
+        for name, value in fields.items():
+            setattr(self, name, value)
+        return bool(updated)
+
+    def mark_ready(self, playlist, poster, renditions, duration):
+        return self._finish(
+            status=self.STATUS_READY, playlist=playlist, poster=poster, renditions=renditions,
+            duration=duration, error='',
+        )
+
+    def mark_failed(self, error):
+        """Wait for the retry of the job, or give up after MAX_ATTEMPTS"""
+        status = self.STATUS_FAILED if self.attempts >= self.MAX_ATTEMPTS else self.STATUS_PENDING
+        return self._finish(status=status, error=error)
@@ -0,0 +1,82 @@
+"""Cursor pagination for course listings.
+
+Listings are ordered by (-created_at, -id); the next page is fetched with
+`created_at < last.created_at OR (created_at = last.created_at AND id < last.id)`,
+so each page costs the same regardless of how deep the user scrolled and new
+courses do not shift pages already shown. Search results are ordered by rank,
+which has no stable key, so they use an offset cursor instead.
+
+Cursors are signed so a tampered or stale token falls back to the first page.
+"""
+from django.core import signing
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+COURSES_PER_PAGE = 12
+CURSOR_SALT = 'courses.pagination.cursor'
+
+
+class CursorPage:
+    def __init__(self, object_list, next_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def encode_cursor(payload):
+    return signing.dumps(payload, salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(token):
+    if not token:
+        return None
+    try:
+        return signing.loads(token, salt=CURSOR_SALT)
+    except signing.BadSignature:
+        return None
+
+
+def paginate_courses(queryset, cursor=None, per_page=COURSES_PER_PAGE, ranked=False):
+    """Return a CursorPage of `queryset` starting after `cursor`.
+
+    Pass ranked=True when the queryset is already ordered by relevance.
+    """
+    payload = decode_cursor(cursor) or {}
+
+    if ranked:
+        offset = payload.get('offset', 0) if isinstance(payload.get('offset'), int) else 0
+        rows = list(queryset[offset:offset + per_page + 1])
+        next_cursor = encode_cursor({'offset': offset + per_page}) if len(rows) > per_page else None
+        return CursorPage(rows[:per_page], next_cursor)
+
+    queryset = queryset.order_by('-created_at', '-id')
+    created_at = parse_datetime(payload['created_at']) if isinstance(payload.get('created_at'), str) else None
+    if created_at is not None and isinstance(payload.get('id'), int):
+        queryset = queryset.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=payload['id'])
+        )
+
+    rows = list(queryset[:per_page + 1])
+    next_cursor = None
+    if len(rows) > per_page:
+        last = rows[per_page - 1]
+        next_cursor = encode_cursor({'created_at': last.created_at.isoformat(), 'id': last.id})
+    return CursorPage(rows[:per_page], next_cursor)
+
+
+def next_page_query(request, page):
+    """Query string for the next page, keeping the current filters"""
+    if not page.has_next:
+        return ''
+    params = request.GET.copy()
+    params['cursor'] = page.next_cursor
+    return params.urlencode()
@@ -0,0 +1,176 @@
+"""Full-text search over courses.
+
+SQLite uses an FTS5 table (`courses_search`) holding normalized, lightly stemmed
+name/description/author text, ranked with bm25. PostgreSQL uses a table with a
+weighted `tsvector` built by the 'russian' configuration and ranked with ts_rank.
+Other backends fall back to icontains filters. The index is kept up to date by
+the Courses signals and can be rebuilt with `manage.py rebuild_search_index`.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, When
+
+SEARCH_TABLE = 'courses_search'
+SEARCH_RESULTS_LIMIT = 500
+
+# bm25 column weights: name, description, author
+BM25_WEIGHTS = (10.0, 1.0, 5.0)
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+CYRILLIC_RE = re.compile(r'[а-я]')
+MIN_STEM_LENGTH = 3
+
+# Inflectional endings, longest first. Stripping them maps "курсы", "курсов" and
+# "курсами" to "курс"; it is deliberately lighter than a full Snowball stemmer
+# because queries are matched by prefix anyway.
+RUSSIAN_ENDINGS = sorted([
+    'ивши', 'ывши', 'ившись', 'ывшись', 'ями', 'ами', 'иями', 'ией', 'иях', 'ием',
+    'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ой', 'ей', 'ий', 'ый', 'ая', 'яя',
+    'ое', 'ее', 'ые', 'ие', 'ую', 'юю', 'ом', 'ем', 'ам', 'ям', 'ах', 'ях', 'ов',
+    'ев', 'ия', 'ию', 'ии', 'ться', 'тся', 'ать', 'ять', 'еть', 'ить', 'ешь', 'ете',
+    'ет', 'ют', 'ут', 'ит', 'ат', 'ят', 'ость', 'а', 'я', 'о', 'е', 'ы', 'и', 'у',
+    'ю', 'ь', 'й',
+], key=len, reverse=True)
+
+
+def normalize(text):
+    """Lower-case, fold ё into е and split into words"""
+    return WORD_RE.findall((text or '').lower().replace('ё', 'е'))
+
+
+def stem(word):
+    """Strip a Russian inflectional ending, keeping at least MIN_STEM_LENGTH letters"""
+    if not CYRILLIC_RE.search(word):
+        return word
+    for ending in RUSSIAN_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM_LENGTH:
+            return word[:-len(ending)]
+    return word
+
+
+def stem_text(text):
+    return ' '.join(stem(word) for word in normalize(text))
+
+
+def is_indexed():
+    return connection.vendor in ('sqlite', 'postgresql')
+
+
+def create_index(schema_editor=None):
+    """Create the search table for the current database (no-op on other backends)"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+                "name, description, author, tokenize = 'unicode61 remove_diacritics 2')"
+            )
+        elif connection.vendor == 'postgresql':
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ('
+                'course_id bigint PRIMARY KEY, document tsvector NOT NULL)'
+            )
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_document_idx ON {SEARCH_TABLE} USING gin (document)'
+            )
+
+
+def drop_index(schema_editor=None):
+    if is_indexed():
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+
+def index_courses(courses):
+    """Insert or replace index entries for the given courses"""
+    courses = list(courses)
+    if not courses or not is_indexed():
+        return
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.executemany(
+                f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [(course.pk,) for course in courses]
+            )
+            cursor.executemany(
+                f'INSERT INTO {SEARCH_TABLE} (rowid, name, description, author) VALUES (%s, %s, %s, %s)',
+                [
+                    (course.pk, stem_text(course.name), stem_text(course.description), stem_text(course.author))
+                    for course in courses
+                ],
+            )
+        else:
+            cursor.executemany(
+                f'INSERT INTO {SEARCH_TABLE} (course_id, document) VALUES (%s, '
+                "setweight(to_tsvector('russian', %s), 'A') || "
+                "setweight(to_tsvector('russian', %s), 'B') || "
+                "setweight(to_tsvector('russian', %s), 'C')) "
+                'ON CONFLICT (course_id) DO UPDATE SET document = EXCLUDED.document',
+                [
+                    (course.pk, ' '.join(normalize(course.name)), ' '.join(normalize(course.author)),
+                     ' '.join(normalize(course.description)))
+                    for course in courses
+                ],
+            )
+
+
+def remove_courses(course_ids):
+    if not course_ids or not is_indexed():
+        return
+    column = 'rowid' if connection.vendor == 'sqlite' else 'course_id'
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {SEARCH_TABLE} WHERE {column} = %s', [(pk,) for pk in course_ids])
+
+
+def rebuild_index(queryset, batch_size=500):
+    """Replace the whole index with the courses from `queryset`"""
+    if not is_indexed():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+    total = 0
+    batch = []
+    for course in queryset.only('id', 'name', 'description', 'author').iterator(chunk_size=batch_size):
+        batch.append(course)
+        if len(batch) >= batch_size:
+            index_courses(batch)
+            total += len(batch)
+            batch = []
+    index_courses(batch)
+    return total + len(batch)
+
+
+def search_course_ids(query, limit=SEARCH_RESULTS_LIMIT):
+    """Ids of matching courses, best match first. Every word must match (by prefix)."""
+    words = normalize(query)
+    if not words:
+        return []
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            match = ' '.join(f'"{stem(word)}"*' for word in words)
+            weights = ', '.join(str(weight) for weight in BM25_WEIGHTS)
+            cursor.execute(
+                f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s '
+                f'ORDER BY bm25({SEARCH_TABLE}, {weights}) LIMIT %s',
+                [match, limit],
+            )
+        else:
+            tsquery = ' & '.join(f'{word}:*' for word in words)
+            cursor.execute(
+                f"SELECT course_id FROM {SEARCH_TABLE}, to_tsquery('russian', %s) query "
+                'WHERE document @@ query ORDER BY ts_rank(document, query) DESC, course_id LIMIT %s',
+                [tsquery, limit],
+            )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_courses(queryset, query):
+    """Filter `queryset` to courses matching `query`, ordered by relevance"""
+    if not is_indexed():
+        return queryset.filter(
+            Q(name__icontains=query) | Q(description__icontains=query) | Q(author__icontains=query)
+        )
+    course_ids = search_course_ids(query)
+    if not course_ids:
+        return queryset.none()
+    rank = Case(*[When(id=pk, then=position) for position, pk in enumerate(course_ids)], output_field=IntegerField())
+    return queryset.filter(id__in=course_ids).annotate(search_rank=rank).order_by('search_rank')
@@ -0,0 +1,169 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from apps.accounts.models import CourseEnrollment
+from . import search, transcoding
+from .models import (
+    Categories, Courses, CourseChapter, CourseChapterVideo, CourseChapterMaterials, CourseReview, CourseQuiz,
+    CourseStats, QuizQuestion, VideoTranscode,
+)
+
+
+@receiver(post_save, sender=QuizQuestion)
+@receiver(post_delete, sender=QuizQuestion)
+def invalidate_quiz_questions(sender, instance, **kwargs):
+    """Bump the quiz questions version so cached question sets and answer keys are rebuilt"""
+    CourseQuiz.bump_questions_version(instance.quiz_id)
+    loaded_quiz_id = getattr(instance, '_loaded_quiz_id', instance.quiz_id)
+    if loaded_quiz_id != instance.quiz_id:
+        # Moved to another quiz: the previous quiz loses the question
+        CourseQuiz.bump_questions_version(loaded_quiz_id)
+    instance._loaded_quiz_id = instance.quiz_id
+
+
+@receiver(post_save, sender=Courses)
+def update_category_counts(sender, instance, created, **kwargs):
+    """Keep denormalized course counts of the category and its ancestors in sync"""
+    if not created and not hasattr(instance, '_loaded_category_id'):
+        # Saved without being loaded first, the previous category is unknown
+        return
+    loaded_category_id = None if created else instance._loaded_category_id
+    if loaded_category_id == instance.category_id:
+        return
+    if loaded_category_id is not None:
+        Categories.adjust_courses_count(loaded_category_id, -1)
+    Categories.adjust_courses_count(instance.category_id, 1)
+    instance._loaded_category_id = instance.category_id
+
+
+@receiver(post_delete, sender=Courses)
+def decrease_category_counts(sender, instance, **kwargs):
+    Categories.adjust_courses_count(instance.category_id, -1)
+
+
+@receiver(post_save, sender=Categories)
+@receiver(post_delete, sender=Categories)
+def invalidate_category_tree(sender, **kwargs):
+    """Descendant sets are cached per tree, any change to a category rebuilds them"""
+    Categories.invalidate_tree_cache()
+
+
+@receiver(post_save, sender=Courses)
+def index_course(sender, instance, **kwargs):
+    """Keep the full-text search index in sync with the course"""
+    search.index_courses([instance])
+
+
+@receiver(post_delete, sender=Courses)
+def unindex_course(sender, instance, **kwargs):
+    search.remove_courses([instance.pk])
+
+
+# What a row adds to the statistics of its course, from its STATS_FIELDS values.
+# Videos and materials belong to a chapter, their first value is resolved to its course.
+STATS_CONTRIBUTIONS = {
+    CourseChapter: lambda: {'chapters_count': 1},
+    CourseChapterVideo: lambda is_active, video_time: (
+        {'lessons_count': 1, 'total_duration': video_time} if is_active else {}
+    ),
+    CourseChapterMaterials: lambda is_active: {'materials_count': 1} if is_active else {},
+    CourseReview: lambda is_active, rating: {'reviews_count': 1, 'ratings_sum': rating} if is_active else {},
+    CourseEnrollment: lambda is_active: {'enrollments_count': 1} if is_active else {},
+}
+CHAPTER_CONTENT = (CourseChapterVideo, CourseChapterMaterials)
+
+
+def get_chapter_content_stats(chapter_id):
+    """Statistics the active videos and materials of a chapter add to its course"""
+    videos = CourseChapterVideo.objects.filter(chapter_id=chapter_id, is_activate=True).aggregate(
+        count=Count('id'), duration=Sum('video_time'),
+    )
+    return {
+        'lessons_count': videos['count'],
+        'total_duration': videos['duration'] or timedelta(0),
+        'materials_count': CourseChapterMaterials.objects.filter(chapter_id=chapter_id, is_activate=True).count(),
+    }
+
+
+def update_course_stats_for_row(instance, contribution, created=False, deleted=False):
+    """Apply the difference a saved or deleted row makes to the statistics of its course(s) as F() deltas"""
+    current = tuple(getattr(instance, field) for field in instance.STATS_FIELDS)
+    loaded = None if created else current if deleted else getattr(instance, '_loaded_stats', None)
+    instance._loaded_stats = None if deleted else current
+    if not created and (loaded is None or None in loaded):
+        # Saved without being loaded first (or with deferred fields): the previous state is unknown
+        CourseStats.refresh_for_courses([current[0]] if type(instance) not in CHAPTER_CONTENT else list(
+            CourseChapter.objects.filter(pk=current[0]).values_list('course_id', flat=True)
+        ))
+        return
+    if loaded == current and not (created or deleted):
+        return
+
+    states = [(-1, loaded)] if loaded else []
+    if not deleted:
+        states.append((1, current))
+    if type(instance) in CHAPTER_CONTENT:
+        chapter_courses = dict(CourseChapter.objects.filter(
+            pk__in={state[0] for _, state in states}
+        ).values_list('id', 'course_id'))
+        states = [(sign, (chapter_courses.get(state[0]),) + state[1:]) for sign, state in states]
+
+    deltas = {}
+    for sign, (course_id, *values) in states:
+        course_deltas = deltas.setdefault(course_id, {})
+        stats = contribution(*values)
+        if isinstance(instance, CourseChapter) and len(states) == 2 and states[0][1] != states[1][1]:
+            # A chapter moved to another course takes its lessons and materials along
+            stats = {**stats, **get_chapter_content_stats(instance.pk)}
+        for field, value in stats.items():
+            course_deltas[field] = course_deltas.get(field, value * 0) + value * sign
+
+    for course_id, course_deltas in deltas.items():
+        course_deltas = {field: value for field, value in course_deltas.items() if value}
+        if course_id and course_deltas:
+            # A deletion may be part of deleting the course itself: never build a row for it
+            CourseStats.add(course_id, course_deltas, create_missing=not deleted)
+
+
+@receiver(post_save, sender=Courses)
+def create_course_stats(sender, instance, created, **kwargs):
+    """A new course has no content yet: an empty row"""
+    if created:
+        CourseStats.objects.get_or_create(course=instance)
+
+
+@receiver(post_save, sender=CourseChapter)
+@receiver(post_delete, sender=CourseChapter)
+@receiver(post_save, sender=CourseChapterVideo)
+@receiver(post_delete, sender=CourseChapterVideo)
+@receiver(post_save, sender=CourseChapterMaterials)
+@receiver(post_delete, sender=CourseChapterMaterials)
+@receiver(post_save, sender=CourseReview)
+@receiver(post_delete, sender=CourseReview)
+@receiver(post_save, sender=CourseEnrollment)
+@receiver(post_delete, sender=CourseEnrollment)
+def update_course_stats(sender, instance, created=False, **kwargs):
+    """Chapters, lessons, materials, reviews and enrollments change the statistics of their course"""
+    update_course_stats_for_row(
+        instance, STATS_CONTRIBUTIONS[sender], created=created, deleted=kwargs['signal'] is post_delete,
+    )
+
+
+@receiver(post_save, sender=CourseChapterVideo)
+def enqueue_video_transcode(sender, instance, created, **kwargs):
+    """Queue HLS transcoding for new uploads and replaced files"""
+    name = instance.video_file.name if instance.video_file else None
+    if not created and getattr(instance, '_loaded_video_file', None) == name:
+        return
+    instance._loaded_video_file = name
+    if name:
+        VideoTranscode.enqueue([instance])
+
+
+@receiver(post_delete, sender=CourseChapterVideo)
+def remove_video_renditions(sender, instance, **kwargs):
+    video_id = instance.pk
+    transaction.on_commit(lambda: transcoding.remove_output(video_id))
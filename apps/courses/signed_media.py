@@ -0,0 +1,101 @@
+"""Short-lived signed links for paid media.
+
+Files under PROTECTED_MEDIA_PREFIXES are not reachable through /media/. Templates get
+links to the media gateway instead, carrying an expiry timestamp and an HMAC of
+(path, expiry) keyed with SECRET_KEY. The gateway only recomputes the HMAC, so range
+requests for the same video cost no database queries. Whoever could render the link
+(order owner, staff) was authorized when the page was built.
+
+HLS renditions are many small files referenced by relative URLs from their playlists,
+so they get a directory-scoped link instead: the signature covers the rendition
+directory (`course_videos/hls/<video id>/`) and travels in the path, which every
+relative segment URL inherits.
+
+Expiry is rounded up to MEDIA_URL_EXPIRY_STEP so a page rendered twice within the
+step reuses the same URL and the browser cache keeps working.
+"""
+import posixpath
+import time
+
+from django.conf import settings
+from django.urls import reverse
+from django.utils.crypto import constant_time_compare, salted_hmac
+from django.utils.http import urlencode
+
+SIGNATURE_SALT = 'apps.courses.signed_media'
+HLS_ROOT = 'course_videos/hls/'
+
+
+def normalize(name):
+    """Storage name as serve() resolves it: dot segments and repeated slashes collapsed"""
+    return posixpath.normpath(name).lstrip('/')
+
+
+def is_protected(name):
+    # "./course_videos/x" or "x/../course_videos/x" reach the same file as "course_videos/x"
+    name = normalize(name) + '/'
+    return any(name.startswith(prefix) for prefix in settings.PROTECTED_MEDIA_PREFIXES)
+
+
+def get_signature(name, expires):
+    return salted_hmac(SIGNATURE_SALT, f'{name}:{expires}', algorithm='sha256').hexdigest()
+
+
+def get_expiry(ttl=None):
+    ttl = settings.MEDIA_URL_TTL if ttl is None else ttl
+    step = settings.MEDIA_URL_EXPIRY_STEP
+    return (int(time.time()) + ttl + step - 1) // step * step
+
+
+def signed_url(name, ttl=None):
+    """Gateway URL for a storage name, valid for `ttl` seconds (MEDIA_URL_TTL by default)"""
+    expires = get_expiry(ttl)
+    query = urlencode({'expires': expires, 'signature': get_signature(name, expires)})
+    return f"{reverse('media_gateway', args=[name])}?{query}"
+
+
+def verify(name, expires, signature):
+    """Stateless check of a gateway link"""
+    try:
+        expires = int(expires)
+    except (TypeError, ValueError):
+        return False
+    if expires < time.time():
+        return False
+    return constant_time_compare(get_signature(name, expires), signature or '')
+
+
+def get_hls_scope(name):
+    """Directory of the video's renditions a scoped signature covers, None outside HLS_ROOT"""
+    if posixpath.normpath(name) != name or not name.startswith(HLS_ROOT):
+        # Dot segments could leave the signed directory
+        return None
+    parts = name[len(HLS_ROOT):].split('/')
+    if len(parts) < 2 or not parts[0]:
+        return None
+    return HLS_ROOT + parts[0] + '/'
+
+
+def signed_hls_url(name, ttl=None):
+    """Gateway URL for an HLS playlist whose relative segment URLs stay signed"""
+    scope = get_hls_scope(name)
+    if scope is None:
+        return None
+    expires = get_expiry(ttl)
+    return reverse('media_gateway_scoped', kwargs={
+        'expires': expires, 'signature': get_signature(scope, expires), 'path': name,
+    })
+
+
+def verify_scoped(name, expires, signature):
+    scope = get_hls_scope(name)
+    return scope is not None and verify(scope, expires, signature)
+
+
+def media_url(file_field):
+    """URL to use in templates: signed for protected files, the plain media URL otherwise"""
+    if not file_field:
+        return None
+    if is_protected(file_field.name):
+        return signed_url(file_field.name)
+    return file_field.url
@@ -0,0 +1,150 @@
+"""Serving media files with HTTP range support.
+
+`serve_file` answers conditional (ETag / Last-Modified) and Range / If-Range
+requests for a file on local storage:
+
+* full responses go through FileResponse, which lets the WSGI server use
+  sendfile (wsgi.file_wrapper);
+* partial (206) responses are streamed from a read-only memory map in
+  MEDIA_STREAM_CHUNK_SIZE slices;
+* with MEDIA_STREAM_OFFLOAD = 'x-accel' (nginx) or 'x-sendfile' (Apache,
+  lighttpd) the view only checks access and hands the transfer, including
+  ranges, to the fronting proxy.
+"""
+import mimetypes
+import mmap
+import os
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def get_validators(stat):
+    """Strong ETag and Last-Modified value derived from size and mtime"""
+    etag = quote_etag(f'{stat.st_mtime_ns:x}-{stat.st_size:x}')
+    return etag, int(stat.st_mtime)
+
+
+def etag_matches(header, etag):
+    return any(candidate.strip() in (etag, '*') for candidate in header.split(','))
+
+
+def parse_range(header, size):
+    """Return (start, end) inclusive for a single satisfiable byte range, None to serve the whole
+    file (no/invalid/unsupported header) or False when a valid range cannot be satisfied"""
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        # Missing, malformed or multi-range headers are ignored (RFC 9110 allows a 200)
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        # "bytes=5-2" is syntactically invalid, not unsatisfiable: ignore it
+        return None
+    if start >= size:
+        return False
+    end = min(int(last), size - 1) if last else size - 1
+    return start, end
+
+
+def iter_mmap(path, start, end, chunk_size):
+    """Yield bytes [start, end] of the file from a read-only memory map"""
+    with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        position = start
+        while position <= end:
+            stop = min(position + chunk_size, end + 1)
+            yield mapped[position:stop]
+            position = stop
+
+
+def offload_response(name, path, content_type):
+    """Let nginx (X-Accel-Redirect) or Apache/lighttpd (X-Sendfile) send the file"""
+    response = HttpResponse(content_type=content_type)
+    if settings.MEDIA_STREAM_OFFLOAD == 'x-accel':
+        response['X-Accel-Redirect'] = settings.MEDIA_STREAM_ACCEL_PREFIX.rstrip('/') + '/' + name.lstrip('/')
+    else:
+        response['X-Sendfile'] = path
+    return response
+
+
+def serve_file(request, name, content_type=None):
+    """Serve a file from the default storage by name (or a FieldFile) honouring
+    Range, If-Range and conditional headers"""
+    name = getattr(name, 'name', name)
+    if not name:
+        raise Http404("Файл не найден")
+    try:
+        path = default_storage.path(name)
+    except (NotImplementedError, SuspiciousFileOperation):
+        raise Http404("Файл не найден")
+    content_type = content_type or mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+    if settings.MEDIA_STREAM_OFFLOAD:
+        if not os.path.isfile(path):
+            raise Http404("Файл не найден")
+        return offload_response(name, path, content_type)
+
+    if not os.path.isfile(path):
+        raise Http404("Файл не найден")
+    stat = os.stat(path)
+
+    size = stat.st_size
+    etag, last_modified = get_validators(stat)
+
+    # Conditional GET
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    if (if_none_match and etag_matches(if_none_match, etag)) or (
+        not if_none_match and if_modified_since is not None and last_modified <= if_modified_since
+    ):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    byte_range = parse_range(request.META.get('HTTP_RANGE'), size) if size else None
+
+    # If-Range: only honour the range when the validator matches exactly (RFC 9110 13.1.5),
+    # otherwise ignore the Range header altogether, including an unsatisfiable one
+    if_range = request.META.get('HTTP_IF_RANGE', '').strip()
+    if byte_range is not None and if_range:
+        if if_range.startswith(('"', 'W/')):
+            # Strong comparison: a weak tag never matches
+            current = if_range == etag
+        else:
+            current = parse_http_date_safe(if_range) == last_modified
+        if not current:
+            byte_range = None
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+    elif byte_range is None:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            iter_mmap(path, start, end, settings.MEDIA_STREAM_CHUNK_SIZE), status=206, content_type=content_type
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'private, max-age=3600'
+    return response
@@ -0,0 +1,20 @@
+from apps.jobs.queue import task
+from . import transcoding
+from .models import VideoTranscode
+
+
+@task(
+    'courses.transcode_video', max_attempts=VideoTranscode.MAX_ATTEMPTS,
+    lock_timeout=VideoTranscode.STALE_AFTER.total_seconds(),
+)
+def transcode_video(video_id, source_name):
+    """Background entry point for transcoding.transcode"""
+    job = VideoTranscode.start(video_id, source_name)
+    if job is None:
+        return
+    try:
+        transcoding.transcode(job)
+    except Exception as e:
+        job.mark_failed(str(e))
+        # The queue retries the job with backoff
+        raise
@@ -0,0 +1,803 @@
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from urllib.parse import parse_qs
+
+from django.core import signing
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F, Value
+from django.db.models.functions import Concat, Substr
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date, parse_http_date
+
+from apps.accounts.models import CourseEnrollment, CustomUser
+from apps.jobs.models import DeadLetter, Job
+from apps.order.models import CourseOrder, OrderProgress
+from . import pagination, search, signed_media, streaming
+from .admin import regrade_quizzes
+from .models import (
+    Categories, Courses, CourseChapter, CourseChapterMaterials, CourseChapterVideo, CourseQuiz, CourseReview, CourseStats,
+    QuizAttempt, QuizCertificate, QuizQuestion, VideoTranscode,
+)
+
+
+def create_course(email='author@example.com', **kwargs):
+    user = kwargs.pop('user', None) or CustomUser.objects.create_user(email=email, password='secret')
+    category = kwargs.pop('category', None) or Categories.objects.create(name='Категория')
+    return Courses.objects.create(
+        name=kwargs.pop('name', 'Курс'), description=kwargs.pop('description', 'Описание'), image='courses/course.jpg',
+        author=kwargs.pop('author', 'Автор'), user=user, category=category, **kwargs,
+    )
+
+
+def create_quiz(course, questions=3, **kwargs):
+    quiz = CourseQuiz.objects.create(course=course, title='Тест', **kwargs)
+    for index in range(questions):
+        QuizQuestion.objects.create(
+            quiz=quiz, question_text=f'Вопрос {index}', option_a='a', option_b='b', option_c='c', correct_answer='A',
+        )
+    return quiz
+
+
+class SignedMediaTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        for name in ('course_videos/paid.mp4', 'course_videos/hls/7/master.m3u8', 'course_videos/hls/8/master.m3u8', 'courses/cover.jpg'):
+            os.makedirs(os.path.dirname(os.path.join(self.media_root, name)), exist_ok=True)
+            with open(os.path.join(self.media_root, name), 'wb') as file:
+                file.write(b'bytes of ' + name.encode())
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_protected_files_are_not_public(self):
+        self.assertEqual(self.client.get('/media/courses/cover.jpg').status_code, 200)
+        for path in (
+            '/media/course_videos/paid.mp4',
+            '/media/./course_videos/paid.mp4',
+            '/media/%2e/course_videos/paid.mp4',
+            '/media/x/../course_videos/paid.mp4',
+            '/media//course_videos/paid.mp4',
+            '/media/course_videos//paid.mp4',
+        ):
+            self.assertEqual(self.client.get(path).status_code, 404, path)
+
+    def test_signed_link(self):
+        url = signed_media.signed_url('course_videos/paid.mp4')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'bytes of course_videos/paid.mp4')
+
+        # The signature covers the path and the expiry
+        self.assertEqual(self.client.get(url.replace('paid.mp4', 'other.mp4')).status_code, 403)
+        expires = signed_media.get_expiry()
+        self.assertEqual(self.client.get(url.replace(f'expires={expires}', f'expires={expires + 1}')).status_code, 403)
+        self.assertEqual(self.client.get('/secure-media/course_videos/paid.mp4').status_code, 403)
+
+    def test_expired_link(self):
+        expires = int(time.time()) - 1
+        signature = signed_media.get_signature('course_videos/paid.mp4', expires)
+        self.assertFalse(signed_media.verify('course_videos/paid.mp4', expires, signature))
+        self.assertTrue(signed_media.verify('course_videos/paid.mp4', expires + 60, signed_media.get_signature('course_videos/paid.mp4', expires + 60)))
+        self.assertFalse(signed_media.verify('course_videos/paid.mp4', 'soon', signature))
+
+    def test_hls_scope(self):
+        url = signed_media.signed_hls_url('course_videos/hls/7/master.m3u8')
+        self.assertEqual(self.client.get(url).status_code, 200)
+        # Segments of the same rendition directory share the signature, other videos do not
+        self.assertTrue(signed_media.verify_scoped('course_videos/hls/7/720p/segment_001.ts', *url.split('/')[2:4]))
+        self.assertEqual(self.client.get(url.replace('/hls/7/', '/hls/8/')).status_code, 403)
+        self.assertIsNone(signed_media.get_hls_scope('course_videos/hls/7/../8/master.m3u8'))
+        self.assertIsNone(signed_media.signed_hls_url('course_videos/paid.mp4'))
+
+
+class StreamingTest(TestCase):
+    CONTENT = bytes(range(100))
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        os.makedirs(os.path.join(media_root, 'course_videos'))
+        with open(os.path.join(media_root, 'course_videos/lesson.mp4'), 'wb') as file:
+            file.write(self.CONTENT)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.url = signed_media.signed_url('course_videos/lesson.mp4')
+
+    def get(self, **headers):
+        response = self.client.get(self.url, headers=headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_parse_range(self):
+        for header, expected in (
+            ('bytes=0-9', (0, 9)),
+            ('bytes=90-', (90, 99)),
+            ('bytes=90-500', (90, 99)),
+            ('bytes=-10', (90, 99)),
+            ('bytes=-500', (0, 99)),
+            # Invalid or unsupported: the whole file
+            (None, None), ('bytes=5-2', None), ('bytes=-', None), ('items=0-5', None), ('bytes=0-1,5-6', None),
+            # Valid but unsatisfiable
+            ('bytes=100-', False), ('bytes=100-200', False), ('bytes=-0', False),
+        ):
+            self.assertEqual(streaming.parse_range(header, 100), expected, header)
+
+    def test_full_and_partial_responses(self):
+        response, body = self.get()
+        self.assertEqual((response.status_code, body), (200, self.CONTENT))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+        response, body = self.get(range='bytes=10-19')
+        self.assertEqual((response.status_code, body), (206, self.CONTENT[10:20]))
+        self.assertEqual((response['Content-Range'], response['Content-Length']), ('bytes 10-19/100', '10'))
+
+        response, body = self.get(range='bytes=5-2')
+        self.assertEqual((response.status_code, body), (200, self.CONTENT))
+
+        response, _ = self.get(range='bytes=200-')
+        self.assertEqual((response.status_code, response['Content-Range']), (416, 'bytes */100'))
+
+    def test_validators(self):
+        response, _ = self.get()
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        self.assertEqual(self.get(if_none_match=etag)[0].status_code, 304)
+        self.assertEqual(self.get(if_modified_since=last_modified)[0].status_code, 304)
+        self.assertEqual(self.get(if_none_match='"other"', if_modified_since=last_modified)[0].status_code, 200)
+
+        # If-Range: the range is served only while the client's copy is current
+        self.assertEqual(self.get(range='bytes=0-9', if_range=etag)[0].status_code, 206)
+        self.assertEqual(self.get(range='bytes=0-9', if_range=last_modified)[0].status_code, 206)
+        response, body = self.get(range='bytes=0-9', if_range='"stale"')
+        self.assertEqual((response.status_code, body), (200, self.CONTENT))
+        # Only an exact match counts: weak tags and later dates do not
+        later = http_date(parse_http_date(last_modified) + 60)
+        for if_range in ('W/' + etag, later):
+            self.assertEqual(self.get(range='bytes=0-9', if_range=if_range)[0].status_code, 200, if_range)
+        # A stale copy gets the whole file, not 416 for a range beyond the current size
+        self.assertEqual(self.get(range='bytes=200-', if_range='"stale"')[0].status_code, 200)
+        self.assertEqual(self.get(range='bytes=200-', if_range=etag)[0].status_code, 416)
+
+    @override_settings(MEDIA_STREAM_OFFLOAD='x-accel')
+    def test_offload(self):
+        response, body = self.get(range='bytes=0-9')
+        self.assertEqual((response.status_code, body), (200, b''))
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/course_videos/lesson.mp4')
+
+
+class QuizQuestionCacheTest(TestCase):
+    def setUp(self):
+        self.quiz = create_quiz(create_course())
+        self.question = QuizQuestion.objects.filter(quiz=self.quiz).first()
+
+    def test_questions_are_read_once_per_version(self):
+        self.assertEqual(len(self.quiz.get_questions()), 3)
+        # Only the version is read, the questions come from the cache
+        with self.assertNumQueries(1):
+            self.assertEqual(len(self.quiz.get_questions()), 3)
+
+    def test_save_and_delete_invalidate(self):
+        self.assertEqual(self.quiz.get_answer_key()[self.question.id], 'A')
+        self.question.correct_answer = 'B'
+        self.question.save()
+        self.assertEqual(self.quiz.get_answer_key()[self.question.id], 'B')
+
+        self.question.delete()
+        self.assertEqual(len(self.quiz.get_questions()), 2)
+
+        other = CourseQuiz.objects.create(course=self.quiz.course, title='Другой тест')
+        self.assertEqual(other.get_questions(), [])
+        moved = QuizQuestion.objects.filter(quiz=self.quiz).first()
+        moved.quiz = other
+        moved.save()
+        self.assertEqual((len(self.quiz.get_questions()), len(other.get_questions())), (1, 1))
+
+    def test_version_is_shared_through_the_database(self):
+        self.quiz.get_answer_key()
+        # Another process changes the question and bumps the version: no local cache entry is touched
+        QuizQuestion.objects.filter(id=self.question.id).update(correct_answer='C')
+        CourseQuiz.objects.filter(id=self.quiz.id).update(questions_version=F('questions_version') + 1)
+        self.assertEqual(self.quiz.get_answer_key()[self.question.id], 'C')
+
+
+class QuizScoringTest(TestCase):
+    def setUp(self):
+        self.quiz = create_quiz(create_course(), questions=4, passing_score=50)
+        self.questions = list(QuizQuestion.objects.filter(quiz=self.quiz).order_by('id'))
+        self.user = CustomUser.objects.create_user(email='learner@example.com', password='secret')
+
+    def create_attempt(self, answers, question_ids=None, user=None, **kwargs):
+        return QuizAttempt.objects.create(
+            user=user or self.user, quiz=self.quiz, is_completed=True, question_ids=question_ids or [],
+            answers={str(question.id): answer for question, answer in answers.items()}, **kwargs,
+        )
+
+    def test_score_from_one_lookup_and_a_narrow_update(self):
+        first, second, third, fourth = self.questions
+        attempt = self.create_attempt({first: 'A', second: 'A', third: 'B', fourth: 'C'})
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(attempt.calculate_score(), (2, 50))
+        writes = [query['sql'] for query in context.captured_queries if query['sql'].startswith('UPDATE "courses_quizattempt"')]
+        self.assertEqual(len(writes), 1)
+        self.assertNotIn('"answers"', writes[0])
+        # Questions are read once per version, then only the version is looked up
+        with self.assertNumQueries(1):
+            attempt.calculate_score(save=False)
+        self.assertTrue(QuizAttempt.objects.get(id=attempt.id).is_passed)
+
+    def test_only_served_questions_count(self):
+        first, second, third, fourth = self.questions
+        # The unanswered served question counts as wrong, the answer to an unserved one is ignored
+        attempt = self.create_attempt({first: 'A', second: 'A', fourth: 'A'}, question_ids=[first.id, second.id, third.id])
+        self.assertEqual(attempt.calculate_score(), (2, 2 / 3 * 100))
+        # Without recorded questions (older attempts) every answer counts
+        legacy = self.create_attempt({first: 'A', second: 'B', fourth: 'x'})
+        self.assertEqual(legacy.calculate_score(), (1, 1 / 3 * 100))
+        self.assertEqual(self.create_attempt({}).calculate_score(), (0, 0.0))
+
+    def test_regrade_after_a_corrected_answer(self):
+        first, second, _, _ = self.questions
+        OrderProgress.refresh_for_orders([CourseOrder.objects.create(user=self.user, course=self.quiz.course, sender=self.user.email)])
+        failed = self.create_attempt({first: 'B', second: 'B'}, question_ids=[first.id, second.id])
+        passed = self.create_attempt({first: 'A', second: 'C'}, question_ids=[first.id, second.id])
+        unchanged = self.create_attempt({first: 'C', second: 'C'}, question_ids=[first.id, second.id])
+        QuizAttempt.rescore([failed, passed, unchanged])
+        self.assertFalse(OrderProgress.objects.get().quiz_passed)
+
+        # A bulk update bypasses the signals, the regrade still sees it
+        QuizQuestion.objects.filter(id=first.id).update(correct_answer='B')
+        with CaptureQueriesContext(connection) as context:
+            changed = regrade_quizzes([self.quiz.id])
+        self.assertEqual({attempt.id for attempt in changed}, {failed.id, passed.id})
+        self.assertEqual(len([query for query in context.captured_queries if query['sql'].startswith('UPDATE "courses_quizattempt"')]), 1)
+        self.assertEqual(
+            list(QuizAttempt.objects.order_by('id').values_list('score', 'is_passed')), [(1, True), (0, False), (0, False)],
+        )
+        # Progress follows the latest attempt
+        self.assertFalse(OrderProgress.objects.get().quiz_passed)
+
+    def test_regrade_issues_and_revokes_certificates(self):
+        first, second, _, _ = self.questions
+        other = CustomUser.objects.create_user(email='other@example.com', password='secret')
+        now_passed = self.create_attempt({first: 'B', second: 'B'}, question_ids=[first.id, second.id])
+        now_failed = self.create_attempt({first: 'A', second: 'C'}, question_ids=[first.id, second.id], user=other)
+        QuizAttempt.rescore([now_passed, now_failed])
+        QuizCertificate.objects.create(user=other, quiz=self.quiz, attempt=now_failed)
+
+        QuizQuestion.objects.filter(id=first.id).update(correct_answer='B')
+        regrade_quizzes([self.quiz.id])
+        certificate = QuizCertificate.objects.get(user=self.user, quiz=self.quiz)
+        self.assertEqual((certificate.attempt_id, certificate.is_active), (now_passed.id, True))
+        self.assertFalse(QuizCertificate.objects.get(user=other).is_active)
+
+        # Reverting the answer reverses both
+        QuizQuestion.objects.filter(id=first.id).update(correct_answer='A')
+        regrade_quizzes([self.quiz.id])
+        self.assertFalse(QuizCertificate.objects.get(user=self.user).is_active)
+        self.assertTrue(QuizCertificate.objects.get(user=other).is_active)
+
+
+class QuestionSamplingTest(TestCase):
+    def setUp(self):
+        self.quiz = create_quiz(create_course(), questions=10, questions_count=4)
+        self.inactive = QuizQuestion.objects.filter(quiz=self.quiz).order_by('-id').first()
+        self.inactive.is_active = False
+        self.inactive.save()
+
+    def test_sample_size_and_seed(self):
+        questions = self.quiz.get_random_questions(seed=42)
+        self.assertEqual(len(questions), 4)
+        self.assertNotIn(self.inactive, questions)
+        self.assertEqual(len(set(questions)), 4)
+        # The same seed reproduces the same draw in the same order
+        self.assertEqual(self.quiz.get_random_questions(seed=42), questions)
+        draws = {tuple(question.id for question in self.quiz.get_random_questions(seed=seed)) for seed in range(20)}
+        self.assertGreater(len(draws), 1)
+
+        self.assertEqual(len(self.quiz.get_random_questions(count=2, seed=1)), 2)
+        # Asking for more than there is returns every active question
+        self.assertEqual(len(self.quiz.get_random_questions(count=50, seed=1)), 9)
+
+    def test_attempt_records_the_served_questions(self):
+        user = CustomUser.objects.create_user(email='learner@example.com', password='secret')
+        CourseOrder.objects.create(user=user, course=self.quiz.course, sender=user.email)
+        self.client.force_login(user)
+        response = self.client.get(reverse('courses:start_quiz', args=[self.quiz.course_id]))
+        self.assertEqual(response.status_code, 200)
+
+        attempt = QuizAttempt.objects.get()
+        served = response.context['questions']
+        self.assertEqual(attempt.question_ids, [question.id for question in served])
+        self.assertEqual(self.quiz.get_random_questions(seed=attempt.question_seed), served)
+        self.assertEqual(attempt.get_served_questions(), served)
+
+
+class CourseSearchTest(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email='author@example.com', password='secret')
+        self.category = Categories.objects.create(name='Категория')
+
+    def create(self, name, description='Описание', author='Автор'):
+        return create_course(user=self.user, category=self.category, name=name, description=description, author=author)
+
+    def test_russian_normalization(self):
+        self.assertEqual(search.normalize('Ёжик, в тумане!'), ['ежик', 'в', 'тумане'])
+        self.assertEqual({search.stem(word) for word in ('курсы', 'курсов', 'курсами', 'курс')}, {'курс'})
+        # Short stems and latin words are kept as they are
+        self.assertEqual(search.stem('мир'), 'мир')
+        self.assertEqual(search.stem('django'), 'django')
+
+    def test_ranking(self):
+        in_description = self.create('Веб-разработка', description='Пишем сайты на Django')
+        in_name = self.create('Django для начинающих')
+        by_author = self.create('Бэкенд', author='Django Reinhardt')
+        self.create('Дизайн')
+        # Name weighs more than author, author more than description
+        self.assertEqual(search.search_course_ids('django'), [in_name.id, by_author.id, in_description.id])
+
+    def test_inflections_prefixes_and_every_word(self):
+        course = self.create('Курсы программирования', description='Ёмкий обзор')
+        self.assertEqual(search.search_course_ids('курсами'), [course.id])
+        self.assertEqual(search.search_course_ids('програм'), [course.id])
+        self.assertEqual(search.search_course_ids('емкий'), [course.id])
+        self.assertEqual(search.search_course_ids('курсов дизайна'), [])
+        self.assertEqual(search.search_course_ids('"*) OR (*'), [])
+
+    def test_index_follows_signals(self):
+        course = self.create('Основы Python')
+        course.name = 'Основы Go'
+        course.save()
+        self.assertEqual(search.search_course_ids('python'), [])
+        self.assertEqual(search.search_course_ids('go'), [course.id])
+        course_id = course.id
+        course.delete()
+        self.assertEqual(search.search_course_ids('go'), [])
+
+        # A bulk update bypasses the signals, the command restores the index
+        other = self.create('Основы SQL')
+        Courses.objects.filter(id=other.id).update(name='Основы Rust')
+        self.assertEqual(search.search_course_ids('rust'), [])
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Indexed 1 courses', out.getvalue())
+        self.assertEqual(search.search_course_ids('rust'), [other.id])
+        self.assertNotIn(course_id, search.search_course_ids('основы'))
+
+    def test_catalogue_orders_by_relevance(self):
+        in_description = self.create('Веб-разработка', description='Пишем сайты на Django')
+        in_name = self.create('Django для начинающих')
+        self.create('Дизайн')
+        response = self.client.get(reverse('courses:course_catalogue'), {'search': 'django'})
+        self.assertEqual(list(response.context['courses']), [in_name, in_description])
+
+        response = self.client.get(
+            reverse('courses:course_catalogue'), {'search': 'дизайн'}, headers={'X-Requested-With': 'XMLHttpRequest'},
+        )
+        self.assertTemplateUsed(response, 'courses-container.html')
+        self.assertEqual([course.name for course in response.context['courses']], ['Дизайн'])
+
+
+class CoursePaginationTest(TestCase):
+    def setUp(self):
+        user = CustomUser.objects.create_user(email='author@example.com', password='secret')
+        category = Categories.objects.create(name='Категория')
+        self.courses = [
+            create_course(user=user, category=category, name=f'Курс {index}', is_popular=True) for index in range(30)
+        ]
+        # Pairs of courses share a timestamp, the id breaks the tie
+        now = timezone.now()
+        for index, course in enumerate(self.courses):
+            Courses.objects.filter(id=course.id).update(created_at=now - timedelta(minutes=index // 2))
+        self.expected = list(Courses.objects.order_by('-created_at', '-id'))
+
+    def collect(self, queryset, **kwargs):
+        pages, cursor = [], None
+        while True:
+            page = pagination.paginate_courses(queryset, cursor, per_page=7, **kwargs)
+            pages.append(list(page))
+            if not page.has_next:
+                return pages
+            cursor = page.next_cursor
+
+    def test_pages_cover_every_course_once(self):
+        pages = self.collect(Courses.objects.all())
+        self.assertEqual([len(page) for page in pages], [7, 7, 7, 7, 2])
+        self.assertEqual(sum(pages, []), self.expected)
+
+    def test_new_courses_do_not_shift_pages(self):
+        first = pagination.paginate_courses(Courses.objects.all(), per_page=7)
+        create_course(email='other@example.com', name='Новый курс')
+        second = pagination.paginate_courses(Courses.objects.all(), first.next_cursor, per_page=7)
+        self.assertEqual(list(second), self.expected[7:14])
+
+    def test_exact_last_page_has_no_cursor(self):
+        page = pagination.paginate_courses(Courses.objects.all(), per_page=30)
+        self.assertEqual(len(page), 30)
+        self.assertFalse(page.has_next)
+        self.assertEqual(list(pagination.paginate_courses(Courses.objects.none())), [])
+
+    def test_tampered_cursor_falls_back_to_the_first_page(self):
+        cursor = pagination.paginate_courses(Courses.objects.all(), per_page=7).next_cursor
+        for token in (cursor[:-1] + ('A' if cursor[-1] != 'A' else 'B'), 'garbage', pagination.encode_cursor({'id': 'x'})):
+            self.assertEqual(list(pagination.paginate_courses(Courses.objects.all(), token, per_page=7)), self.expected[:7])
+        # A cursor signed for another purpose is rejected as well
+        forged = signing.dumps({'created_at': timezone.now().isoformat(), 'id': 0})
+        self.assertEqual(list(pagination.paginate_courses(Courses.objects.all(), forged, per_page=7)), self.expected[:7])
+
+    def test_ranked_results_use_an_offset(self):
+        ranked = Courses.objects.order_by('name')
+        pages = self.collect(ranked, ranked=True)
+        self.assertEqual(sum(pages, []), list(ranked))
+        self.assertEqual(pagination.decode_cursor(pagination.paginate_courses(ranked, per_page=7, ranked=True).next_cursor), {'offset': 7})
+
+    def test_show_more_keeps_the_filters(self):
+        response = self.client.get(reverse('courses:popular_courses'))
+        self.assertEqual(list(response.context['courses']), self.expected[:pagination.COURSES_PER_PAGE])
+        query = parse_qs(response.context['next_page_query'])
+
+        response = self.client.get(
+            reverse('courses:course_catalogue'), {'is_popular': 'true', 'cursor': query['cursor'][0]},
+            headers={'X-Requested-With': 'XMLHttpRequest'},
+        )
+        self.assertTemplateUsed(response, 'courses-container.html')
+        self.assertEqual(list(response.context['courses']), self.expected[12:24])
+        query = parse_qs(response.context['next_page_query'])
+        self.assertEqual(query['is_popular'], ['true'])
+        response = self.client.get(reverse('courses:course_catalogue'), query, headers={'X-Requested-With': 'XMLHttpRequest'})
+        self.assertEqual(list(response.context['courses']), self.expected[24:])
+        self.assertEqual(response.context['next_page_query'], '')
+
+
+class CategoryTreeTest(TestCase):
+    def setUp(self):
+        self.root = Categories.objects.create(name='Программирование')
+        self.web = Categories.objects.create(name='Веб', parent=self.root)
+        self.backend = Categories.objects.create(name='Бэкенд', parent=self.web)
+        self.design = Categories.objects.create(name='Дизайн')
+        self.user = CustomUser.objects.create_user(email='author@example.com', password='secret')
+        self.course = create_course(user=self.user, category=self.backend)
+        create_course(user=self.user, category=self.web)
+
+    def refresh(self):
+        return {category.name: category for category in Categories.objects.all()}
+
+    def test_paths_and_counts(self):
+        categories = self.refresh()
+        self.assertEqual(categories['Бэкенд'].path, f'/{self.root.id}/{self.web.id}/{self.backend.id}/')
+        self.assertEqual(categories['Бэкенд'].depth, 2)
+        self.assertEqual(
+            [(categories[name].courses_count, categories[name].total_courses_count) for name in ('Программирование', 'Веб', 'Бэкенд')],
+            [(0, 2), (1, 2), (1, 1)],
+        )
+        self.assertEqual(set(self.root.get_descendant_ids()), {self.root.id, self.web.id, self.backend.id})
+
+    def test_move_subtree(self):
+        web = Categories.objects.get(id=self.web.id)
+        web.parent = self.design
+        web.save()
+
+        categories = self.refresh()
+        self.assertEqual(categories['Веб'].path, f'/{self.design.id}/{self.web.id}/')
+        self.assertEqual(categories['Бэкенд'].path, f'/{self.design.id}/{self.web.id}/{self.backend.id}/')
+        self.assertEqual((categories['Бэкенд'].depth, categories['Веб'].depth), (2, 1))
+        self.assertEqual((categories['Программирование'].total_courses_count, categories['Дизайн'].total_courses_count), (0, 2))
+        self.assertEqual(Categories.get_descendant_ids_for(self.root.id), [self.root.id])
+        self.assertEqual(set(Categories.get_descendant_ids_for(self.design.id)), {self.design.id, self.web.id, self.backend.id})
+
+        # Moving to the top level
+        web.parent = None
+        web.save()
+        categories = self.refresh()
+        self.assertEqual((categories['Бэкенд'].path, categories['Бэкенд'].depth), (f'/{self.web.id}/{self.backend.id}/', 1))
+        self.assertEqual(categories['Дизайн'].total_courses_count, 0)
+
+    def test_course_moves_update_counts(self):
+        self.course.category = self.design
+        self.course.save()
+        categories = self.refresh()
+        self.assertEqual((categories['Программирование'].total_courses_count, categories['Дизайн'].total_courses_count), (1, 1))
+        self.course.delete()
+        self.assertEqual(self.refresh()['Дизайн'].total_courses_count, 0)
+
+    def test_rebuild_tree(self):
+        Categories.objects.update(path='', depth=0, courses_count=0, total_courses_count=0)
+        Categories.rebuild_tree()
+        categories = self.refresh()
+        self.assertEqual(categories['Бэкенд'].path, f'/{self.root.id}/{self.web.id}/{self.backend.id}/')
+        self.assertEqual(categories['Программирование'].total_courses_count, 2)
+
+    def test_per_process_cache_is_not_used(self):
+        Categories.get_descendants_map()
+        # Another worker moves the node: nothing can invalidate this process, so nothing is cached
+        Categories.objects.filter(path__startswith=self.web.path).update(
+            path=Concat(Value(f'/{self.design.id}/'), Substr('path', len(self.root.path) + 1)),
+        )
+        self.assertEqual(Categories.get_descendant_ids_for(self.root.id), [self.root.id])
+
+    def test_shared_cache_is_invalidated_on_move(self):
+        with tempfile.TemporaryDirectory() as location:
+            caches = {**settings.CACHES, 'querysets': {'BACKEND': 'config.cache_backends.FileBasedCache', 'LOCATION': location}}
+            with override_settings(CACHES=caches):
+                Categories.get_descendants_map()
+                with self.assertNumQueries(0):
+                    self.assertEqual(len(Categories.get_descendant_ids_for(self.root.id)), 3)
+                web = Categories.objects.get(id=self.web.id)
+                web.parent = self.design
+                web.save()
+                self.assertEqual(Categories.get_descendant_ids_for(self.root.id), [self.root.id])
+                self.assertEqual(len(Categories.get_descendant_ids_for(self.design.id)), 3)
+
+
+class CourseStatsTest(TestCase):
+    def setUp(self):
+        self.course = create_course()
+        self.chapter = CourseChapter.objects.create(course=self.course, title='Глава')
+        self.learner = CustomUser.objects.create_user(email='learner@example.com', password='secret')
+
+    def get_stats(self):
+        return CourseStats.objects.get(course=self.course)
+
+    def add_video(self, minutes, **kwargs):
+        return CourseChapterVideo.objects.create(
+            chapter=self.chapter, title='Урок', video_file='course_videos/lesson.mp4', video_time=timedelta(minutes=minutes), **kwargs,
+        )
+
+    def test_signals_keep_statistics_current(self):
+        self.assertEqual(self.get_stats().chapters_count, 1)
+        self.add_video(50)
+        video = self.add_video(25)
+        self.add_video(600, is_activate=False)
+        CourseChapterMaterials.objects.create(chapter=self.chapter, title='Конспект', material_type='document')
+        CourseReview.objects.create(course=self.course, first_name='А', last_name='Б', comment='+', rating=5, is_active=True)
+        CourseReview.objects.create(course=self.course, first_name='В', last_name='Г', comment='+', rating=4, is_active=True)
+        CourseReview.objects.create(course=self.course, first_name='Д', last_name='Е', comment='-', rating=1)
+        CourseEnrollment.objects.create(user=self.learner, course=self.course)
+        CourseOrder.objects.create(user=self.learner, course=self.course, sender=self.learner.email)
+
+        stats = self.get_stats()
+        self.assertEqual(
+            (stats.chapters_count, stats.lessons_count, stats.materials_count, stats.reviews_count,
+             stats.enrollments_count, stats.orders_count),
+            (1, 2, 1, 2, 1, 1),
+        )
+        self.assertEqual(stats.average_rating, Decimal('4.50'))
+        self.assertEqual((stats.total_duration_hours, stats.total_duration_minutes), (1, 15))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            video.delete()
+        self.assertEqual(self.get_stats().lessons_count, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.chapter.delete()
+        stats = self.get_stats()
+        self.assertEqual((stats.chapters_count, stats.lessons_count, stats.total_duration), (0, 0, timedelta(0)))
+
+    def test_changes_apply_deltas(self):
+        video = self.add_video(50)
+        review = CourseReview.objects.create(course=self.course, first_name='А', last_name='Б', comment='+', rating=5, is_active=True)
+        CourseReview.objects.create(course=self.course, first_name='В', last_name='Г', comment='+', rating=2, is_active=True)
+
+        video = CourseChapterVideo.objects.get(pk=video.pk)
+        video.video_time = timedelta(minutes=20)
+        video.save()
+        self.assertEqual(self.get_stats().total_duration, timedelta(minutes=20))
+        video.is_activate = False
+        video.save()
+        stats = self.get_stats()
+        self.assertEqual((stats.lessons_count, stats.total_duration), (0, timedelta(0)))
+
+        review.rating = 4
+        review.save()
+        self.assertEqual(self.get_stats().average_rating, Decimal('3.00'))
+        review.is_active = False
+        review.save()
+        stats = self.get_stats()
+        self.assertEqual((stats.reviews_count, stats.ratings_sum, stats.average_rating), (1, 2, Decimal('2.00')))
+
+        # A purchase is a single UPDATE of the stored row, nothing is recounted
+        with CaptureQueriesContext(connection) as context:
+            CourseOrder.objects.create(user=self.learner, course=self.course, sender=self.learner.email)
+        stats_queries = [query['sql'] for query in context.captured_queries if 'courses_coursestats' in query['sql']]
+        self.assertEqual(len(stats_queries), 1)
+        self.assertTrue(stats_queries[0].startswith('UPDATE'))
+        self.assertFalse([query for query in context.captured_queries if 'COUNT(' in query['sql']])
+        self.assertEqual(self.get_stats().orders_count, 1)
+
+    def test_moved_chapter_takes_its_content(self):
+        self.add_video(30)
+        CourseChapterMaterials.objects.create(chapter=self.chapter, title='Конспект', material_type='document')
+        other = create_course(email='other@example.com')
+        self.chapter.course = other
+        self.chapter.save()
+
+        stats = self.get_stats()
+        self.assertEqual((stats.chapters_count, stats.lessons_count, stats.materials_count), (0, 0, 0))
+        stats = CourseStats.objects.get(course=other)
+        self.assertEqual((stats.chapters_count, stats.lessons_count, stats.materials_count), (1, 1, 1))
+        self.assertEqual(stats.total_duration, timedelta(minutes=30))
+
+    def test_missing_row_is_built(self):
+        self.add_video(10)
+        CourseStats.objects.all().delete()
+        self.add_video(5)
+        stats = self.get_stats()
+        self.assertEqual((stats.lessons_count, stats.total_duration), (2, timedelta(minutes=15)))
+
+    def test_course_deletion_removes_statistics(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course.delete()
+        self.assertFalse(CourseStats.objects.exists())
+
+    def test_fixed_number_of_queries(self):
+        other = create_course(email='other@example.com')
+        CourseChapter.objects.create(course=other, title='Глава')
+        with self.assertNumQueries(7):
+            stats = CourseStats.build_for_courses([self.course.id, other.id])
+        self.assertEqual([item.chapters_count for item in stats], [1, 1])
+
+    def test_rebuild_and_lazy_creation(self):
+        CourseStats.objects.all().delete()
+        course = Courses.objects.get(id=self.course.id)
+        self.assertEqual(CourseStats.get_for_course(course).chapters_count, 1)
+
+        # Bulk changes bypass the signals, the command catches up
+        CourseChapter.objects.bulk_create([CourseChapter(course=self.course, title='Глава 2')])
+        out = StringIO()
+        call_command('rebuild_course_stats', '--course', str(self.course.id), stdout=out)
+        self.assertIn('Rebuilt statistics for 1 courses', out.getvalue())
+        self.assertEqual(self.get_stats().chapters_count, 2)
+
+    def test_detail_page_reads_the_stored_row(self):
+        self.add_video(90)
+        response = self.client.get(reverse('courses:course_detail', args=[self.course.id]))
+        self.assertEqual(response.context['total_lessons'], 1)
+        self.assertEqual((response.context['total_duration_hours'], response.context['total_duration_minutes']), (1, 30))
+
+
+FAKE_FFPROBE = """#!/bin/sh
+echo '{"format": {"duration": "125.4"}, "streams": [{"codec_type": "video", "width": 1280, "height": 720}, {"codec_type": "audio"}]}'
+"""
+
+# Writes the playlists, a segment per rendition or the poster, depending on the output
+FAKE_FFMPEG = """#!/bin/sh
+for last; do :; done
+case "$last" in
+  *index.m3u8)
+    output="$(dirname "$(dirname "$last")")"
+    for rendition in "$output"/*/; do printf '#EXTM3U\\nsegment_00000.ts\\n' > "$rendition/index.m3u8"; echo ts > "$rendition/segment_00000.ts"; done
+    printf '#EXTM3U\\n360p/index.m3u8\\n' > "$output/master.m3u8";;
+  *) echo jpg > "$last";;
+esac
+"""
+
+
+@override_settings(JOBS_RUN_INLINE=False)
+class VideoTranscodeTest(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        os.makedirs(os.path.join(media_root, 'course_videos'))
+        for name in ('first.mp4', 'second.mp4'):
+            with open(os.path.join(media_root, 'course_videos', name), 'wb') as file:
+                file.write(b'video')
+        binaries = {}
+        for name, script in (('ffprobe', FAKE_FFPROBE), ('ffmpeg', FAKE_FFMPEG)):
+            binaries[name] = os.path.join(media_root, name)
+            with open(binaries[name], 'w') as file:
+                file.write(script)
+            os.chmod(binaries[name], 0o755)
+        override = override_settings(MEDIA_ROOT=media_root, FFPROBE_BINARY=binaries['ffprobe'], FFMPEG_BINARY=binaries['ffmpeg'])
+        override.enable()
+        self.addCleanup(override.disable)
+        self.media_root = media_root
+
+        self.course = create_course()
+        self.chapter = CourseChapter.objects.create(course=self.course, title='Глава')
+
+    def upload(self, name, video=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            if video is None:
+                return CourseChapterVideo.objects.create(chapter=self.chapter, title='Урок', video_file=f'course_videos/{name}')
+            video.video_file = f'course_videos/{name}'
+            video.save()
+            return video
+
+    def run_jobs(self):
+        call_command('run_jobs', '--once', stdout=StringIO(), stderr=StringIO())
+
+    def test_upload_is_transcoded_by_the_job_worker(self):
+        video = self.upload('first.mp4')
+        self.assertEqual(VideoTranscode.objects.get().status, VideoTranscode.STATUS_PENDING)
+        self.assertEqual(Job.objects.get().payload, {'video_id': video.id, 'source_name': 'course_videos/first.mp4'})
+        self.assertIsNone(video.get_hls_url())
+
+        self.run_jobs()
+        transcode = VideoTranscode.objects.get()
+        self.assertEqual((transcode.status, transcode.attempts), (VideoTranscode.STATUS_READY, 1))
+        self.assertEqual([rendition['name'] for rendition in transcode.renditions], ['360p', '480p', '720p'])
+        self.assertEqual(Job.objects.get().status, Job.STATUS_DONE)
+
+        video = CourseChapterVideo.objects.get(id=video.id)
+        self.assertEqual(video.video_time, timedelta(seconds=125))
+        self.assertEqual(CourseStats.objects.get(course=self.course).total_duration, timedelta(seconds=125))
+        response = self.client.get(video.get_hls_url())
+        self.assertEqual((response.status_code, response['Content-Type']), (200, 'application/vnd.apple.mpegurl'))
+        self.assertEqual(self.client.get(video.get_poster_url()).status_code, 200)
+
+        # Saving without a new file queues nothing
+        video.title = 'Новое название'
+        with self.captureOnCommitCallbacks(execute=True):
+            video.save()
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_reupload_supersedes_the_queued_job(self):
+        video = self.upload('first.mp4')
+        self.upload('second.mp4', video)
+        self.assertEqual(Job.objects.count(), 2)
+
+        self.run_jobs()
+        transcode = VideoTranscode.objects.get()
+        self.assertEqual((transcode.status, transcode.source_name, transcode.attempts), (VideoTranscode.STATUS_READY, 'course_videos/second.mp4', 1))
+        # The job of the replaced file finished without doing any work
+        self.assertEqual(list(Job.objects.values_list('status', flat=True)), [Job.STATUS_DONE, Job.STATUS_DONE])
+
+        # A duplicate job (the admin action clicked twice) does not redo it either
+        with self.captureOnCommitCallbacks(execute=True):
+            VideoTranscode.enqueue([video])
+            VideoTranscode.enqueue([video])
+        self.run_jobs()
+        self.assertEqual(Job.objects.filter(status=Job.STATUS_DONE).count(), 4)
+        self.assertEqual(VideoTranscode.objects.get().attempts, 1)
+
+    def test_failures_are_retried_by_the_queue(self):
+        with override_settings(FFPROBE_BINARY=os.path.join(self.media_root, 'missing')):
+            self.upload('first.mp4')
+            for attempt in range(1, VideoTranscode.MAX_ATTEMPTS + 1):
+                Job.objects.update(run_at=timezone.now())
+                self.run_jobs()
+                transcode = VideoTranscode.objects.get()
+                self.assertEqual(transcode.attempts, attempt)
+                self.assertIn('не найден', transcode.error)
+        self.assertEqual(transcode.status, VideoTranscode.STATUS_FAILED)
+        self.assertFalse(Job.objects.exists())
+        self.assertEqual(DeadLetter.objects.get().name, 'courses.transcode_video')
+
+        # Re-queued after the fix, the next job starts over
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('enqueue_transcodes', '--failed', stdout=StringIO())
+        self.run_jobs()
+        self.assertEqual(VideoTranscode.objects.get().status, VideoTranscode.STATUS_READY)
+
+    def test_abandoned_transcoding_is_taken_over(self):
+        video = self.upload('first.mp4')
+        VideoTranscode.objects.update(status=VideoTranscode.STATUS_PROCESSING, started_at=timezone.now())
+        self.assertIsNone(VideoTranscode.start(video.id, 'course_videos/first.mp4'))
+        VideoTranscode.objects.update(started_at=timezone.now() - VideoTranscode.STALE_AFTER - timedelta(minutes=1))
+        self.assertEqual(VideoTranscode.start(video.id, 'course_videos/first.mp4').status, VideoTranscode.STATUS_PROCESSING)
+
+    def test_backfill_queues_videos_never_transcoded(self):
+        CourseChapterVideo.objects.bulk_create([CourseChapterVideo(chapter=self.chapter, title='Урок', video_file='course_videos/first.mp4')])
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('enqueue_transcodes', stdout=StringIO())
+        self.assertEqual(Job.objects.filter(name='courses.transcode_video').count(), 1)
+        self.run_jobs()
+        self.assertEqual(VideoTranscode.objects.get().status, VideoTranscode.STATUS_READY)
+
+    def test_deleting_the_video_removes_renditions(self):
+        video = self.upload('first.mp4')
+        self.run_jobs()
+        output = os.path.join(self.media_root, 'course_videos', 'hls', str(video.id))
+        self.assertTrue(os.path.isdir(output))
+        with self.captureOnCommitCallbacks(execute=True):
+            video.delete()
+        self.assertFalse(os.path.exists(output))
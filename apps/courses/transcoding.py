@@ -0,0 +1,211 @@
+"""Offline HLS transcoding of chapter videos with a local ffmpeg.
+
+The courses.transcode_video job (apps/courses/tasks.py, run by `manage.py run_jobs`)
+takes the VideoTranscode record of a video and:
+
+* probes the source with ffprobe (duration, height, audio track);
+* encodes every VIDEO_RENDITIONS entry not taller than the source (at least the
+  smallest one) to H.264/AAC HLS segments in a single ffmpeg run, with a master
+  playlist listing all of them so the player can switch bitrate;
+* grabs a poster frame;
+* fills an empty `video_time` from the probed duration.
+
+Output goes to MEDIA_ROOT/course_videos/hls/<video id>/, which is protected media
+reached through directory-scoped signed links (see signed_media.signed_hls_url).
+"""
+import json
+import os
+import shutil
+import subprocess
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+from . import signed_media
+
+MASTER_PLAYLIST = 'master.m3u8'
+POSTER_NAME = 'poster.jpg'
+POSTER_MAX_HEIGHT = 720
+PROBE_TIMEOUT = 120
+
+# mimetypes maps .ts to TypeScript / Qt Linguist files
+HLS_CONTENT_TYPES = {
+    '.m3u8': 'application/vnd.apple.mpegurl',
+    '.ts': 'video/mp2t',
+}
+
+
+class TranscodeError(Exception):
+    pass
+
+
+def get_output_name(video_id):
+    return f'{signed_media.HLS_ROOT}{video_id}'
+
+
+def get_content_type(name):
+    return HLS_CONTENT_TYPES.get(os.path.splitext(name)[1].lower())
+
+
+def run(args, timeout):
+    """Run an ffmpeg/ffprobe command and return its stdout, raising TranscodeError on failure"""
+    try:
+        result = subprocess.run(args, capture_output=True, text=True, timeout=timeout)
+    except FileNotFoundError:
+        raise TranscodeError(f'{args[0]} не найден')
+    except subprocess.TimeoutExpired:
+        raise TranscodeError(f'{args[0]}: превышено время ожидания ({timeout} с)')
+    if result.returncode != 0:
+        # The tail of stderr holds the actual error
+        raise TranscodeError(result.stderr.strip()[-2000:] or f'{args[0]} завершился с кодом {result.returncode}')
+    return result.stdout
+
+
+def probe(path):
+    """Duration in seconds, frame size and presence of an audio track"""
+    output = run([
+        settings.FFPROBE_BINARY, '-v', 'error', '-print_format', 'json', '-show_format', '-show_streams', path,
+    ], timeout=PROBE_TIMEOUT)
+    try:
+        data = json.loads(output or '{}')
+    except ValueError:
+        raise TranscodeError('ffprobe вернул некорректный ответ')
+    streams = data.get('streams', [])
+    video_stream = next((stream for stream in streams if stream.get('codec_type') == 'video'), None)
+    if video_stream is None:
+        raise TranscodeError('Видеопоток не найден')
+    duration = data.get('format', {}).get('duration') or video_stream.get('duration') or 0
+    return {
+        'duration': float(duration),
+        'width': int(video_stream.get('width') or 0),
+        'height': int(video_stream.get('height') or 0),
+        'has_audio': any(stream.get('codec_type') == 'audio' for stream in streams),
+    }
+
+
+def select_renditions(source_height):
+    """Renditions not taller than the source (no upscaling), at least the smallest one"""
+    renditions = sorted(settings.VIDEO_RENDITIONS, key=lambda rendition: rendition['height'])
+    return [rendition for rendition in renditions if rendition['height'] <= source_height] or renditions[:1]
+
+
+def build_hls_command(source, output_dir, renditions, has_audio):
+    """One ffmpeg run decoding the source once and encoding all renditions"""
+    count = len(renditions)
+    filters = [f'[0:v]split={count}' + ''.join(f'[v{index}]' for index in range(count))]
+    filters += [f'[v{index}]scale=-2:{rendition["height"]}[v{index}out]' for index, rendition in enumerate(renditions)]
+
+    args = [settings.FFMPEG_BINARY, '-y', '-hide_banner', '-loglevel', 'error', '-i', source,
+            '-filter_complex', ';'.join(filters)]
+    stream_map = []
+    for index, rendition in enumerate(renditions):
+        bitrate = rendition['video_bitrate']
+        args += [
+            '-map', f'[v{index}out]', f'-c:v:{index}', 'libx264', f'-b:v:{index}', f'{bitrate}k',
+            f'-maxrate:v:{index}', f'{int(bitrate * 1.1)}k', f'-bufsize:v:{index}', f'{bitrate * 2}k',
+        ]
+        entry = f'v:{index}'
+        if has_audio:
+            args += ['-map', '0:a:0', f'-c:a:{index}', 'aac', f'-b:a:{index}', f'{rendition["audio_bitrate"]}k']
+            entry += f',a:{index}'
+        stream_map.append(f'{entry},name:{rendition["name"]}')
+    if has_audio:
+        args += ['-ac', '2']
+
+    segment_seconds = settings.VIDEO_HLS_SEGMENT_SECONDS
+    args += [
+        '-preset', 'veryfast', '-profile:v', 'main', '-pix_fmt', 'yuv420p', '-sc_threshold', '0',
+        # Keyframes on segment boundaries keep renditions aligned for switching
+        '-force_key_frames', f'expr:gte(t,n_forced*{segment_seconds})',
+        '-f', 'hls', '-hls_time', str(segment_seconds), '-hls_playlist_type', 'vod',
+        '-hls_flags', 'independent_segments',
+        '-hls_segment_filename', os.path.join(output_dir, '%v', 'segment_%05d.ts'),
+        '-master_pl_name', MASTER_PLAYLIST,
+        '-var_stream_map', ' '.join(stream_map),
+        os.path.join(output_dir, '%v', 'index.m3u8'),
+    ]
+    return args
+
+
+def build_poster_command(source, poster_path, duration, source_height):
+    position = min(settings.VIDEO_POSTER_SECOND, duration / 2) if duration else 0
+    height = min(source_height or POSTER_MAX_HEIGHT, POSTER_MAX_HEIGHT)
+    return [
+        settings.FFMPEG_BINARY, '-y', '-hide_banner', '-loglevel', 'error', '-ss', f'{position:.2f}', '-i', source,
+        '-frames:v', '1', '-vf', f'scale=-2:{height}', '-q:v', '3', poster_path,
+    ]
+
+
+def fill_video_time(video, duration):
+    """Set the probed duration where it was left empty, on the video and its ordered copies"""
+    from apps.order.models import CourseVideoForOrderedUser
+    from .models import CourseChapter, CourseChapterVideo, CourseStats
+
+    empty = CourseChapterVideo.objects.filter(pk=video.pk, video_time=timedelta(0))
+    counted = empty.filter(is_activate=True).update(video_time=duration)
+    updated = counted or empty.update(video_time=duration)
+    CourseVideoForOrderedUser.objects.filter(source_video=video, video_time=timedelta(0)).update(video_time=duration)
+    if counted:
+        # update() bypasses the signals that keep course totals in sync
+        course_id = CourseChapter.objects.filter(pk=video.chapter_id).values_list('course_id', flat=True).first()
+        if course_id:
+            CourseStats.add(course_id, {'total_duration': duration})
+    if updated and hasattr(video, '_loaded_stats'):
+        # A later save of this instance must not count the duration a second time
+        video.video_time = duration
+        video._loaded_stats = (video.chapter_id, video.is_activate, duration)
+    return bool(updated)
+
+
+def remove_output(video_id):
+    path = default_storage.path(get_output_name(video_id))
+    shutil.rmtree(path, ignore_errors=True)
+    shutil.rmtree(path + '.tmp', ignore_errors=True)
+
+
+def transcode(job):
+    """Produce renditions and poster for a started transcoding and mark it ready.
+
+    Returns False when the video was re-uploaded while encoding; its new job redoes the work.
+    """
+    video = job.video
+    source = default_storage.path(job.source_name)
+    if not os.path.isfile(source):
+        raise TranscodeError(f'Файл {job.source_name} не найден')
+
+    info = probe(source)
+    renditions = select_renditions(info['height'])
+
+    # Encode next to the published directory and swap it in when complete,
+    # so viewers never see a half-written playlist
+    output_name = get_output_name(video.pk)
+    output_dir = default_storage.path(output_name)
+    work_dir = output_dir + '.tmp'
+    shutil.rmtree(work_dir, ignore_errors=True)
+    for rendition in renditions:
+        os.makedirs(os.path.join(work_dir, rendition['name']))
+    try:
+        run(build_hls_command(source, work_dir, renditions, info['has_audio']), timeout=settings.VIDEO_TRANSCODE_TIMEOUT)
+        run(build_poster_command(source, os.path.join(work_dir, POSTER_NAME), info['duration'], info['height']),
+            timeout=PROBE_TIMEOUT)
+    except TranscodeError:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.replace(work_dir, output_dir)
+
+    duration = timedelta(seconds=round(info['duration']))
+    ready = job.mark_ready(
+        playlist=f'{output_name}/{MASTER_PLAYLIST}',
+        poster=f'{output_name}/{POSTER_NAME}',
+        renditions=[
+            {'name': rendition['name'], 'height': rendition['height'],
+             'bandwidth': (rendition['video_bitrate'] + rendition['audio_bitrate']) * 1000}
+            for rendition in renditions
+        ],
+        duration=duration,
+    )
+    if ready:
+        fill_video_time(video, duration)
+    return ready
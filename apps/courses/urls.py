@@ -14,6 +14,7 @@ urlpatterns = [
     path('get-access/<int:course_id>/', views.get_access, name='get_access'),
     path('create-order/<int:course_id>/', views.create_course_order, name='create_order'),
     path('mark-video-watched/', views.mark_video_watched, name='mark_video_watched'),
+    path('video-telemetry/', views.video_telemetry, name='video_telemetry'),
     path('api/subcategories/', views.get_subcategories, name='get_subcategories'),
     path('create-review/<int:course_id>/', views.create_course_review, name='create_review'),
     path('reviews/', views.reviews_page, name='reviews'),
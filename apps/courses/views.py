@@ -1,17 +1,20 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import Http404, HttpResponseForbidden, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.core.mail import send_mail
+from apps.jobs.mail import queue_template_email
 from django.conf import settings
 from django.utils import timezone
 import json
 from django.core.paginator import Paginator
 from django.views.decorators.http import require_http_methods
-from .models import Courses, CourseChapter, CourseChapterVideo, CourseChapterMaterials, Categories, CourseReview, CourseQuiz, QuizQuestion, QuizAttempt, QuizCertificate
-from apps.website.models import DiscountForReferral
-from apps.order.models import CourseOrder, CourseChapterForOrderedUser, CourseVideoForOrderedUser, CourseMaterialForOrderedUser, UserVideoProgress, UserChapterProgress
+from django.views.static import serve
+from .models import Courses, CourseChapter, CourseChapterVideo, CourseChapterMaterials, Categories, CourseReview, CourseQuiz, QuizAttempt, QuizCertificate, CourseStats
+from . import search, signed_media, streaming, transcoding
+from .pagination import next_page_query, paginate_courses
+from apps.order.models import CourseOrder, CourseVideoForOrderedUser, UserVideoProgress, OrderProgress
+from apps.order import telemetry
 
 
 def course_detail(request, course_id):
@@ -22,27 +25,34 @@ def course_detail(request, course_id):
     chapters = CourseChapter.objects.filter(course=course).order_by('order')
     
     # Get course videos
-    videos = CourseChapterVideo.objects.filter(chapter__course=course, is_activate=True).order_by('chapter__order', 'order')
+    videos = list(
+        CourseChapterVideo.objects.filter(chapter__course=course, is_activate=True)
+        .select_related('transcode').order_by('chapter__order', 'order')
+    )
     
     # Get course materials (documents and images)
-    materials = CourseChapterMaterials.objects.filter(chapter__course=course, is_activate=True).order_by('chapter__order', 'order')
+    materials = list(CourseChapterMaterials.objects.filter(chapter__course=course, is_activate=True).order_by('chapter__order', 'order'))
     
     # Get related courses (same category)
     related_courses = Courses.objects.filter(
         category=course.category
-    ).exclude(id=course.id).order_by('-created_at')[:4]
+    ).exclude(id=course.id).select_related('stats').order_by('-created_at')[:4]
+    
+    # Course totals come from the denormalized statistics row
+    stats = CourseStats.get_for_course(course)
     
-    # Calculate course statistics
-    total_lessons = videos.count()
-    total_duration_seconds = sum(video.video_time.total_seconds() for video in videos)
-    total_duration_hours = int(total_duration_seconds // 3600)
-    total_duration_minutes = int((total_duration_seconds % 3600) // 60)
+    # Organize chapters with their content (grouped in memory, no query per chapter)
+    videos_by_chapter = {}
+    for video in videos:
+        videos_by_chapter.setdefault(video.chapter_id, []).append(video)
+    materials_by_chapter = {}
+    for material in materials:
+        materials_by_chapter.setdefault(material.chapter_id, []).append(material)
     
-    # Organize chapters with their content
     chapters_with_content = []
     for chapter in chapters:
-        chapter_videos = videos.filter(chapter=chapter)
-        chapter_materials = materials.filter(chapter=chapter)
+        chapter_videos = videos_by_chapter.get(chapter.id, [])
+        chapter_materials = materials_by_chapter.get(chapter.id, [])
         
         # Calculate total video duration for this chapter
         chapter_duration_seconds = sum(video.video_time.total_seconds() for video in chapter_videos)
@@ -53,7 +63,7 @@ def course_detail(request, course_id):
             'chapter': chapter,
             'videos': chapter_videos,
             'materials': chapter_materials,
-            'total_items': chapter_videos.count() + chapter_materials.count(),
+            'total_items': len(chapter_videos) + len(chapter_materials),
             'total_duration_seconds': chapter_duration_seconds,
             'total_duration_hours': chapter_duration_hours,
             'total_duration_minutes': chapter_duration_minutes
@@ -81,13 +91,13 @@ def course_detail(request, course_id):
         'materials': materials,
         'chapters_with_content': chapters_with_content,
         'related_courses': related_courses,
-        'total_lessons': total_lessons,
-        'total_duration_hours': total_duration_hours,
-        'total_duration_minutes': total_duration_minutes,
+        'course_stats': stats,
+        'total_lessons': stats.lessons_count,
+        'total_duration_hours': stats.total_duration_hours,
+        'total_duration_minutes': stats.total_duration_minutes,
         'is_enrolled': is_enrolled,
         'reviews': reviews,
         'course_quiz': course_quiz,
-        'referral_discount': DiscountForReferral.get_active_discount(),
     }
     
     return render(request, 'we-course.html', context)
@@ -102,37 +112,29 @@ def course_catalogue(request):
     is_popular_filter = request.GET.get('is_popular') == 'true'
     
     # Start with all courses (remove is_activate filter as it doesn't exist in model)
-    courses = Courses.objects.all().order_by('-created_at')
+    courses = Courses.objects.select_related('category', 'stats').order_by('-created_at')
     
-    # Filter by category - prioritize sub category over main category
-    if sub_category_id:
-        courses = courses.filter(category_id=sub_category_id)
-    elif main_category_id:
-        # If main category is selected, get all courses from that category and its subcategories
+    # Filter by category - prioritize sub category over main category.
+    # Either one matches courses of its subcategories at any depth (cached descendant ids).
+    selected_category_id = sub_category_id or main_category_id
+    if selected_category_id:
         try:
-            main_category = Categories.objects.get(id=main_category_id)
-            subcategory_ids = list(main_category.categories_set.values_list('id', flat=True))
-            subcategory_ids.append(main_category_id)
-            courses = courses.filter(category_id__in=subcategory_ids)
-        except Categories.DoesNotExist:
-            courses = courses.none()
-    
-    # Filter by search query if specified
-    if search_query:
-        courses = courses.filter(
-            name__icontains=search_query
-        ) | courses.filter(
-            description__icontains=search_query
-        ) | courses.filter(
-            author__icontains=search_query
-        )
+            category_ids = Categories.get_descendant_ids_for(selected_category_id)
+        except ValueError:
+            category_ids = []
+        courses = courses.filter(category_id__in=category_ids)
     
     # Filter by popular courses if specified
     if is_popular_filter:
         courses = courses.filter(is_popular=True)
     
-    # Get all courses for "show more" functionality
-    all_courses = courses
+    # Full-text search, results ordered by relevance
+    if search_query:
+        courses = search.search_courses(courses, search_query)
+    
+    # One page at a time, "show more" requests the next page by cursor
+    page = paginate_courses(courses, request.GET.get('cursor'), ranked=bool(search_query))
+    next_query = next_page_query(request, page)
     
     # Get main categories (categories without parent) with their subcategories
     main_categories = Categories.objects.filter(parent__isnull=True).prefetch_related('categories_set').order_by('name')
@@ -140,20 +142,20 @@ def course_catalogue(request):
     # For AJAX requests, return only the courses container
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return render(request, 'courses-container.html', {
-            'courses': all_courses,
+            'courses': page,
+            'next_page_query': next_query,
             'selected_sub_category': sub_category_id,
             'is_popular_filter': is_popular_filter,
-            'referral_discount': DiscountForReferral.get_active_discount(),
         })
     
     context = {
-        'courses': all_courses,
+        'courses': page,
+        'next_page_query': next_query,
         'main_categories': main_categories,
         'selected_main_category': main_category_id,
         'selected_sub_category': sub_category_id,
         'search_query': search_query,
         'is_popular_filter': is_popular_filter,
-        'referral_discount': DiscountForReferral.get_active_discount(),
     }
     
     return render(request, 'course-catalogue.html', context)
@@ -244,20 +246,18 @@ def reviews_page(request):
 
 def popular_courses(request):
     """Popular courses page view"""
-    popular_courses = Courses.objects.filter(
-        is_popular=True, 
-        is_activate=True
-    ).order_by('-created_at')
-    
-    # Pagination
-    paginator = Paginator(popular_courses, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    popular_courses = Courses.objects.filter(is_popular=True).select_related('category', 'stats')
     
+    page = paginate_courses(popular_courses, request.GET.get('cursor'))
     context = {
-        'page_obj': page_obj,
+        'courses': page,
+        'next_page_query': next_page_query(request, page),
     }
     
+    # "Show more" requests only need the next cards
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return render(request, 'courses-container.html', context)
+    
     return render(request, 'popular.html', context)
 
 
@@ -430,88 +430,23 @@ def create_course_order(request, course_id):
                     user_referral.referred_by_email = referral_sender.email
                     user_referral.save()
             
-            # Copy all chapters
-            chapters = CourseChapter.objects.filter(course=course, is_activate=True)
-            for chapter in chapters:
-                ordered_chapter, created = CourseChapterForOrderedUser.objects.get_or_create(
-                    order=order,
-                    title=chapter.title,
-                    chapter_order=chapter.order,
-                    defaults={
-                        'description': chapter.description,
-                        'is_activate': chapter.is_activate,
-                        'is_accessible': False  # No access until admin activates
-                    }
-                )
-                
-                # Copy videos for this chapter
-                videos = CourseChapterVideo.objects.filter(chapter=chapter, is_activate=True)
-                for video in videos:
-                    CourseVideoForOrderedUser.objects.get_or_create(
-                        order=order,
-                        title=video.title,
-                        video_order=video.order,
-                        defaults={
-                            'chapter': ordered_chapter,
-                            'description': video.description,
-                            'video_file': video.video_file,
-                            'video_time': video.video_time,
-                            'is_activate': video.is_activate,
-                            'is_free': video.is_free,
-                            'is_accessible': False  # No access until admin activates
-                        }
-                    )
-                
-                # Copy materials for this chapter
-                materials = CourseChapterMaterials.objects.filter(chapter=chapter, is_activate=True)
-                for material in materials:
-                    CourseMaterialForOrderedUser.objects.get_or_create(
-                        order=order,
-                        title=material.title,
-                        material_order=material.order,
-                        defaults={
-                            'chapter': ordered_chapter,
-                            'description': material.description,
-                            'material_type': material.material_type,
-                            'image_file': material.image_file,
-                            'document_file': material.document_file,
-                            'is_activate': material.is_activate,
-                            'is_free': material.is_free,
-                            'is_accessible': False  # No access until admin activates
-                        }
-                    )
+            # Copy all chapters, videos and materials (bulk inserts in one transaction)
+            order.schedule_materialize_content()
             
             # Send email notification
             try:
-                subject = f'Новая заявка на курс: {course.name}'
-                message = f'''
-Здравствуйте!
-
-Поступила новая заявка на покупку курса:
-
-Курс: {course.name}
-Имя: {first_name} {last_name}
-Email: {email}
-Телефон: {phone_number}
-Промокод: {promo_code if promo_code else 'Не указан'}
-Скидка: {discount_percentage}%
-Дата заявки: {order.order_date.strftime("%d.%m.%Y %H:%M")}
-
-Пожалуйста, рассмотрите заявку и активируйте доступ к курсу.
-
-С уважением,
-Система PROFACTIVE
-                '''
-                
-                send_mail(
-                    subject=subject,
-                    message=message,
-                    from_email=settings.EMAIL_HOST_USER,
-                    recipient_list=[settings.EMAIL_HOST_USER],
-                    fail_silently=False,
-                )
+                queue_template_email('order_created', {
+                    'course_name': course.name,
+                    'first_name': first_name,
+                    'last_name': last_name,
+                    'email': email,
+                    'phone_number': phone_number,
+                    'promo_code': promo_code,
+                    'discount_percentage': discount_percentage,
+                    'order_date': order.order_date,
+                }, [settings.EMAIL_HOST_USER], idempotency_key=f'order:{order.id}:created-email')
             except Exception as e:
-                print(f"Error sending email: {e}")
+                print(f"Error queueing email: {e}")
                 # Don't fail the order creation if email fails
             
             return JsonResponse({
@@ -544,142 +479,11 @@ def ordered_course_detail(request, order_id):
     """Display detailed view of ordered course"""
     order = get_object_or_404(CourseOrder, id=order_id, user=request.user)
     
-    # Get chapters with their content
-    chapters = CourseChapterForOrderedUser.objects.filter(
-        order=order
-    ).prefetch_related(
-        'coursevideoforordereduser_set',
-        'coursematerialforordereduser_set'
-    ).order_by('chapter_order')
-    
-    # Force update access if order is active but content is not accessible
-    if order.is_active:
-        updated_chapters = CourseChapterForOrderedUser.objects.filter(order=order, is_accessible=False).update(is_accessible=True)
-        updated_videos = CourseVideoForOrderedUser.objects.filter(order=order, is_accessible=False).update(is_accessible=True)
-        updated_materials = CourseMaterialForOrderedUser.objects.filter(order=order, is_accessible=False).update(is_accessible=True)
-        
-        # Refresh chapters after update
-        if updated_chapters > 0 or updated_videos > 0 or updated_materials > 0:
-            chapters = CourseChapterForOrderedUser.objects.filter(
-                order=order
-            ).prefetch_related(
-                'coursevideoforordereduser_set',
-                'coursematerialforordereduser_set'
-            ).order_by('chapter_order')
-    
-    # Add progressive access logic and video watched status
-    chapters_list = list(chapters)
-    
-    # Get all user video progress for this user
-    user_video_progress = UserVideoProgress.objects.filter(
-        user=request.user,
-        is_watched=True
-    ).values_list('video_id', flat=True)
-    
-    for i, chapter in enumerate(chapters_list):
-        # Check chapter accessibility
-        if i == 0:
-            # First chapter is always accessible
-            chapter.is_accessible = True
-        else:
-            # Subsequent chapters are accessible only if previous chapter is completed
-            previous_chapter = chapters_list[i - 1]
-            previous_progress = UserChapterProgress.objects.filter(
-                user=request.user,
-                chapter=previous_chapter,
-                is_completed=True
-            ).exists()
-            chapter.is_accessible = previous_progress
-        
-        # Get videos with progressive access
-        videos = chapter.coursevideoforordereduser_set.all().order_by('video_order')
-        videos_list = list(videos)
-        
-        for j, video in enumerate(videos_list):
-            if j == 0:
-                # First video in chapter is accessible if chapter is accessible
-                video.is_accessible = chapter.is_accessible
-            else:
-                # Subsequent videos are accessible only if previous video is watched AND chapter is accessible
-                previous_video = videos_list[j-1]
-                previous_watched = previous_video.id in user_video_progress
-                video.is_accessible = previous_watched and chapter.is_accessible
-            
-            # Check if video is watched
-            video.is_watched = video.id in user_video_progress
-        
-        # Check if chapter is completed
-        total_videos = videos.count()
-        watched_videos = sum(1 for video in videos_list if video.id in user_video_progress)
-        chapter.is_completed = total_videos > 0 and watched_videos == total_videos
-        
-        # Materials are accessible if chapter is accessible and at least one video is watched
-        for material in chapter.coursematerialforordereduser_set.all():
-            # Material is accessible if chapter is accessible and at least one video is watched
-            has_watched_video = any(video.id in user_video_progress for video in videos_list)
-            material.is_accessible = chapter.is_accessible and has_watched_video
-    
-    # Calculate total lessons and duration
-    total_lessons = sum(
-        chapter.coursevideoforordereduser_set.count() + 
-        chapter.coursematerialforordereduser_set.count()
-        for chapter in chapters
-    )
+    # Chapters, videos, materials and the user's progress with gating computed in memory
+    outline = order.build_outline(request.user)
     
-    total_duration_seconds = sum(
-        video.video_time.total_seconds()
-        for chapter in chapters
-        for video in chapter.coursevideoforordereduser_set.all()
-    )
-    
-    total_duration_hours = int(total_duration_seconds // 3600)
-    total_duration_minutes = int((total_duration_seconds % 3600) // 60)
-    
-    # Check if all chapters are completed
-    all_chapters_completed = all(chapter.is_completed for chapter in chapters_list)
-    
-    # Calculate progress data for the progress card
-    # Get all videos for this order
-    all_videos = CourseVideoForOrderedUser.objects.filter(order=order, is_accessible=True)
-    total_videos = all_videos.count()
-    
-    # Count watched videos from progress tracking
-    watched_videos = UserVideoProgress.objects.filter(
-        user=request.user, 
-        video__in=all_videos, 
-        is_watched=True
-    ).count()
-    
-    # Check if course has a quiz
-    has_quiz = False
-    quiz_passed = False
-    try:
-        quiz = CourseQuiz.objects.get(course=order.course, is_active=True)
-        has_quiz = True
-        quiz_attempt = QuizAttempt.objects.filter(user=request.user, quiz=quiz).order_by('-started_at').first()
-        if quiz_attempt:
-            quiz_passed = quiz_attempt.is_passed
-    except CourseQuiz.DoesNotExist:
-        pass
-    
-    # Calculate progress percentage based on video completion and quiz status
-    if total_videos > 0:
-        video_progress = (watched_videos / total_videos * 100)
-        
-        if has_quiz:
-            # If course has quiz, max progress is 90% until quiz is passed
-            if quiz_passed:
-                progress_percentage = 100  # 100% only after passing quiz
-            else:
-                progress_percentage = min(90, video_progress)  # Max 90% for video completion
-        else:
-            # If no quiz, progress is based on video completion only
-            progress_percentage = video_progress
-    else:
-        progress_percentage = 0
-    
-    # Ensure progress is never negative and never exceeds 100
-    progress_percentage = max(0, min(100, progress_percentage))
+    # Progress data for the progress card comes from the persisted snapshot
+    progress = OrderProgress.get_for_order(order)
     
     # Get quiz information
     quiz_attempt = None
@@ -697,18 +501,18 @@ def ordered_course_detail(request, order_id):
     context = {
         'order': order,
         'course': order.course,
-        'chapters': chapters,
-        'total_lessons': total_lessons,
-        'total_duration_hours': total_duration_hours,
-        'total_duration_minutes': total_duration_minutes,
+        'chapters': outline['chapters'],
+        'total_lessons': outline['total_lessons'],
+        'total_duration_hours': outline['total_duration_hours'],
+        'total_duration_minutes': outline['total_duration_minutes'],
         'is_enrolled': order.is_active,  # Access based on order status
         'quiz_attempt': quiz_attempt,
         'quiz_certificate': quiz_certificate,
-        'all_chapters_completed': all_chapters_completed,
+        'all_chapters_completed': outline['all_chapters_completed'],
         # Progress data for the progress card
-        'total_videos': total_videos,
-        'watched_videos': watched_videos,
-        'progress_percentage': round(progress_percentage, 1),
+        'total_videos': progress.total_videos,
+        'watched_videos': progress.watched_videos,
+        'progress_percentage': progress.percentage,
     }
     return render(request, 'ordered-course-detail.html', context)
 
@@ -717,63 +521,36 @@ def ordered_course_detail(request, order_id):
 def course_results(request):
     """Display user's course progress and results"""
     # Get all active orders for the user
-    orders = CourseOrder.objects.filter(user=request.user, is_active=True).select_related('course')
+    orders = list(CourseOrder.objects.filter(user=request.user, is_active=True).select_related('course'))
     
     course_progress = []
     
+    # Snapshots for all orders are read (or built once) in a fixed number of queries
+    snapshots = {progress.order_id: progress for progress in OrderProgress.objects.filter(order__in=orders)}
+    missing_orders = [order for order in orders if order.id not in snapshots]
+    for progress in OrderProgress.refresh_for_orders(missing_orders):
+        snapshots[progress.order_id] = progress
+    
+    # Latest attempt per quiz is only needed for the action buttons
+    latest_attempts = {}
+    for attempt in QuizAttempt.objects.filter(
+        user=request.user,
+        quiz__course__in=[order.course_id for order in orders],
+        quiz__is_active=True,
+    ).select_related('quiz').order_by('-started_at'):
+        latest_attempts.setdefault(attempt.quiz.course_id, attempt)
+    
     for order in orders:
-        # Get all videos for this order
-        videos = CourseVideoForOrderedUser.objects.filter(order=order, is_accessible=True)
-        total_videos = videos.count()
-        
-        # Count watched videos from progress tracking
-        watched_videos = UserVideoProgress.objects.filter(
-            user=request.user, 
-            video__in=videos, 
-            is_watched=True
-        ).count()
-        
-        # Get quiz information first
-        quiz_attempt = None
-        quiz_passed = False
-        has_quiz = False
-        try:
-            quiz = CourseQuiz.objects.get(course=order.course, is_active=True)
-            has_quiz = True
-            quiz_attempt = QuizAttempt.objects.filter(user=request.user, quiz=quiz).order_by('-started_at').first()
-            if quiz_attempt:
-                quiz_passed = quiz_attempt.is_passed
-        except CourseQuiz.DoesNotExist:
-            pass
-        
-        # Calculate progress percentage based on video completion and quiz status
-        if total_videos > 0:
-            video_progress = (watched_videos / total_videos * 100)
-            
-            if has_quiz:
-                # If course has quiz, max progress is 90% until quiz is passed
-                if quiz_passed:
-                    progress_percentage = 100  # 100% only after passing quiz
-                else:
-                    progress_percentage = min(90, video_progress)  # Max 90% for video completion
-            else:
-                # If no quiz, progress is based on video completion only
-                progress_percentage = video_progress
-        else:
-            progress_percentage = 0
-        
-        # Ensure progress is never negative and never exceeds 100
-        progress_percentage = max(0, min(100, progress_percentage))
-        
+        progress = snapshots[order.id]
         course_data = {
             'order': order,
             'course': order.course,
-            'total_videos': total_videos,
-            'watched_videos': watched_videos,
-            'progress_percentage': round(progress_percentage, 1),
-            'is_completed': progress_percentage >= 100,
-            'quiz_attempt': quiz_attempt,
-            'quiz_passed': quiz_passed
+            'total_videos': progress.total_videos,
+            'watched_videos': progress.watched_videos,
+            'progress_percentage': progress.percentage,
+            'is_completed': progress.is_completed,
+            'quiz_attempt': latest_attempts.get(order.course_id),
+            'quiz_passed': progress.quiz_passed
         }
         
         course_progress.append(course_data)
@@ -784,6 +561,27 @@ def course_results(request):
     return render(request, 'course-results.html', context)
 
 
+def media_gateway(request, path):
+    """Serve a protected media file for a valid signed link (no database access)"""
+    if not signed_media.verify(path, request.GET.get('expires'), request.GET.get('signature')):
+        return HttpResponseForbidden("Ссылка недействительна или устарела")
+    return streaming.serve_file(request, path)
+
+
+def media_gateway_scoped(request, expires, signature, path):
+    """Serve HLS playlists and segments under a directory-scoped signature (no database access)"""
+    if not signed_media.verify_scoped(path, expires, signature):
+        return HttpResponseForbidden("Ссылка недействительна или устарела")
+    return streaming.serve_file(request, path, content_type=transcoding.get_content_type(path))
+
+
+def public_media(request, path):
+    """Serve public media; paid content is only reachable through media_gateway"""
+    if signed_media.is_protected(path):
+        raise Http404("Файл не найден")
+    return serve(request, path, document_root=settings.MEDIA_ROOT)
+
+
 @login_required
 @csrf_exempt
 def mark_video_watched(request):
@@ -797,93 +595,25 @@ def mark_video_watched(request):
                 return JsonResponse({'success': False, 'message': 'Video ID is required'})
             
             # Get the video
-            video = get_object_or_404(CourseVideoForOrderedUser, id=video_id)
+            video = get_object_or_404(CourseVideoForOrderedUser.objects.select_related('order'), id=video_id)
             
             # Check if user has access to this video
-            if video.order.user != request.user:
+            if video.order.user_id != request.user.id:
                 return JsonResponse({'success': False, 'message': 'Access denied'})
             
-            # Mark video as watched
-            progress, created = UserVideoProgress.objects.get_or_create(
-                user=request.user,
-                video=video,
-                defaults={'is_watched': True}
-            )
-            
-            if not created:
-                progress.is_watched = True
-                progress.save()
-            
-            # Check if chapter is now completed and update progress
-            chapter = video.chapter
-            if chapter:
-                total_videos_in_chapter = CourseVideoForOrderedUser.objects.filter(chapter=chapter).count()
-                watched_videos_in_chapter = UserVideoProgress.objects.filter(
-                    user=request.user,
-                    video__chapter=chapter,
-                    is_watched=True
-                ).count()
-                
-                chapter_completed = total_videos_in_chapter > 0 and watched_videos_in_chapter == total_videos_in_chapter
-                
-                if chapter_completed:
-                    chapter_progress, created = UserChapterProgress.objects.get_or_create(
-                        user=request.user,
-                        chapter=chapter,
-                        defaults={'is_completed': True, 'completed_at': timezone.now()}
-                    )
-                    if not created and not chapter_progress.is_completed:
-                        chapter_progress.is_completed = True
-                        chapter_progress.completed_at = timezone.now()
-                        chapter_progress.save()
-            
-            # Calculate new progress
-            order = video.order
-            all_videos = CourseVideoForOrderedUser.objects.filter(order=order, is_accessible=True)
-            watched_videos = UserVideoProgress.objects.filter(
-                user=request.user,
-                video__in=all_videos,
-                is_watched=True
-            ).count()
-            
-            total_videos = all_videos.count()
-            
-            # Check if course has a quiz and if it's passed
-            has_quiz = False
-            quiz_passed = False
-            try:
-                quiz = CourseQuiz.objects.get(course=order.course, is_active=True)
-                has_quiz = True
-                quiz_attempt = QuizAttempt.objects.filter(user=request.user, quiz=quiz).order_by('-started_at').first()
-                if quiz_attempt:
-                    quiz_passed = quiz_attempt.is_passed
-            except CourseQuiz.DoesNotExist:
-                pass
-            
-            # Calculate progress percentage based on video completion and quiz status
-            if total_videos > 0:
-                video_progress = (watched_videos / total_videos * 100)
-                
-                if has_quiz:
-                    # If course has quiz, max progress is 90% until quiz is passed
-                    if quiz_passed:
-                        progress_percentage = 100  # 100% only after passing quiz
-                    else:
-                        progress_percentage = min(90, video_progress)  # Max 90% for video completion
-                else:
-                    # If no quiz, progress is based on video completion only
-                    progress_percentage = video_progress
-            else:
-                progress_percentage = 0
+            # Repeats only read; the first watch updates chapter and order progress incrementally
+            changed = UserVideoProgress.mark_watched(request.user, video)
+            progress = OrderProgress.get_for_order(video.order)
             
             return JsonResponse({
                 'success': True,
                 'message': 'Video marked as watched',
+                'changed': changed,
                 'progress': {
-                    'watched_videos': watched_videos,
-                    'total_videos': total_videos,
-                    'percentage': round(progress_percentage, 1),
-                    'is_completed': progress_percentage >= 100
+                    'watched_videos': progress.watched_videos,
+                    'total_videos': progress.total_videos,
+                    'percentage': progress.percentage,
+                    'is_completed': progress.is_completed
                 }
             })
             
@@ -893,6 +623,26 @@ def mark_video_watched(request):
     return JsonResponse({'success': False, 'message': 'Invalid request method'})
 
 
+@login_required
+@require_http_methods(['POST'])
+def video_telemetry(request):
+    """Accept a batch of player heartbeats for the user's ordered videos (buffered, see apps/order/telemetry.py)"""
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'success': False, 'message': 'Invalid JSON'}, status=400)
+    events = telemetry.parse_events(data.get('events') if isinstance(data, dict) else None)
+    events = events[:settings.VIDEO_TELEMETRY_MAX_EVENTS]
+
+    # One query checks ownership of every video in the batch
+    allowed = set(CourseVideoForOrderedUser.objects.filter(
+        id__in={video_id for video_id, _, _ in events}, order__user=request.user, order__is_active=True,
+    ).values_list('id', flat=True))
+    events = [event for event in events if event[0] in allowed]
+    telemetry.record(request.user.id, events)
+    return JsonResponse({'success': True, 'accepted': len(events)})
+
+
 # Quiz Views
 @login_required
 def start_quiz(request, course_id):
@@ -918,8 +668,9 @@ def start_quiz(request, course_id):
         messages.info(request, 'Вы уже прошли этот тест')
         return redirect('courses:quiz_results', course_id=course_id)
     
-    # Get random questions
-    questions = quiz.get_random_questions()
+    # Draw questions for this attempt, the seed allows reproducing the draw
+    question_seed = QuizAttempt.new_question_seed()
+    questions = quiz.get_random_questions(seed=question_seed)
     
     if not questions:
         messages.error(request, 'В тесте нет вопросов')
@@ -930,7 +681,9 @@ def start_quiz(request, course_id):
     attempt = QuizAttempt.objects.create(
         user=request.user,
         quiz=quiz,
-        answers={}
+        answers={},
+        question_ids=[question.id for question in questions],
+        question_seed=question_seed,
     )
     
     context = {
@@ -991,8 +744,9 @@ def submit_quiz(request, course_id):
             time_taken = (attempt.completed_at - attempt.started_at).total_seconds()
             attempt.time_taken = int(time_taken)
         
-        # Calculate score
-        score, percentage = attempt.calculate_score()
+        # Calculate score and save everything changed by the submission in one UPDATE
+        score, percentage = attempt.calculate_score(save=False)
+        attempt.save(update_fields=['answers', 'is_completed', 'completed_at', 'time_taken', *QuizAttempt.SCORE_FIELDS])
         
         # Create certificate if passed
         if attempt.is_passed:
@@ -1044,7 +798,10 @@ def quiz_results(request, course_id):
             pass
     
     # Get questions with correct answers for review
-    questions = QuizQuestion.objects.filter(quiz=quiz, id__in=attempt.answers.keys())
+    if attempt.question_ids:
+        questions = attempt.get_served_questions()
+    else:
+        questions = [question for question in quiz.get_questions() if str(question.id) in attempt.answers]
     
     context = {
         'course': course,
@@ -0,0 +1,86 @@
+from django.contrib import admin
+from django.utils import timezone
+from .models import Job, DeadLetter, OutboundEmail, MailDeliveryStats
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['name', 'status', 'attempts', 'max_attempts', 'run_at', 'created_at', 'finished_at']
+    list_filter = ['status', 'name']
+    search_fields = ['name', 'idempotency_key']
+    readonly_fields = ['name', 'payload', 'idempotency_key', 'status', 'attempts', 'max_attempts', 'sensitive', 'last_error', 'run_at', 'locked_at', 'created_at', 'finished_at']
+    actions = ['run_now']
+
+    def has_add_permission(self, request):
+        return False
+
+    def run_now(self, request, queryset):
+        updated = queryset.filter(status=Job.STATUS_QUEUED).update(run_at=timezone.now())
+        self.message_user(request, f'Будет выполнено без ожидания: {updated}')
+    run_now.short_description = "Выполнить без ожидания"
+
+
+@admin.register(DeadLetter)
+class DeadLetterAdmin(admin.ModelAdmin):
+    list_display = ['name', 'attempts', 'last_error', 'enqueued_at', 'failed_at']
+    list_filter = ['name']
+    search_fields = ['name', 'idempotency_key', 'last_error']
+    readonly_fields = ['name', 'payload', 'idempotency_key', 'attempts', 'sensitive', 'last_error', 'enqueued_at', 'failed_at']
+    actions = ['retry']
+
+    def has_add_permission(self, request):
+        return False
+
+    def retry(self, request, queryset):
+        retried = skipped = 0
+        for dead_letter in queryset:
+            if dead_letter.can_retry():
+                dead_letter.retry()
+                retried += 1
+            else:
+                skipped += 1
+        message = f'Снова в очереди: {retried}'
+        if skipped:
+            message += f', пропущено (данные удалены): {skipped}'
+        self.message_user(request, message)
+    retry.short_description = "Повторить"
+
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ['subject', 'recipients', 'status', 'attempts', 'created_at', 'sent_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['subject', 'recipients', 'idempotency_key']
+    readonly_fields = ['subject', 'body', 'from_email', 'recipients', 'idempotency_key', 'sensitive', 'status', 'attempts', 'last_error', 'send_after', 'locked_at', 'created_at', 'sent_at']
+    actions = ['resend']
+
+    def has_add_permission(self, request):
+        return False
+
+    def get_fields(self, request, obj=None):
+        fields = super().get_fields(request, obj)
+        # Credentials are never shown in the admin
+        if obj and obj.sensitive:
+            fields = [field for field in fields if field != 'body']
+        return fields
+
+    def resend(self, request, queryset):
+        from .mail import schedule_flush
+
+        updated = queryset.filter(status=OutboundEmail.STATUS_FAILED, sensitive=False).update(
+            status=OutboundEmail.STATUS_QUEUED, attempts=0, send_after=timezone.now()
+        )
+        if updated:
+            schedule_flush()
+        self.message_user(request, f'Снова в очереди: {updated}')
+    resend.short_description = "Отправить повторно"
+
+
+@admin.register(MailDeliveryStats)
+class MailDeliveryStatsAdmin(admin.ModelAdmin):
+    list_display = ['minute', 'sent', 'failed', 'connections', 'flushes', 'send_seconds']
+    date_hierarchy = 'minute'
+    readonly_fields = ['minute', 'sent', 'failed', 'connections', 'flushes', 'send_seconds']
+
+    def has_add_permission(self, request):
+        return False
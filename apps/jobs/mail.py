@@ -0,0 +1,180 @@
+"""Outbound mail spooler.
+
+`queue_email` stores the message as an OutboundEmail once the transaction commits
+(`queue_emails` stores many with one INSERT) and schedules a `jobs.flush_mail`
+job. Scheduling is coalesced (at most one flush waits in the queue) and delayed by
+MAIL_FLUSH_DELAY seconds, so a bulk admin save activating dozens of orders becomes
+one batch.
+
+A flush opens a single connection with get_connection() and sends every due
+message over it, at most MAIL_RATE_LIMIT_PER_MINUTE per calendar minute; the rest
+waits for the next minute. Failed messages are retried with the job backoff up to
+MAIL_MAX_ATTEMPTS. Per-minute counters are kept in MailDeliveryStats
+(`manage.py mail_stats`).
+
+Bodies come from templates/emails/<name>/ (subject.txt, body.txt and optional
+body.html, see `manage.py preview_email`). They are compiled once per process by
+the cached template loader and rendered with a plain Context: no request, no
+context processors, only the values the email needs.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.template import Context, TemplateDoesNotExist, engines
+from django.utils import timezone
+
+from .models import MailDeliveryStats, OutboundEmail
+from .queue import enqueue
+
+
+EMAIL_TEMPLATES_DIR = 'emails'
+
+
+def get_email_templates(name):
+    """Compiled (subject, text, html) templates of an email; html is None when there is none"""
+    engine = engines['django'].engine
+    subject = engine.get_template(f'{EMAIL_TEMPLATES_DIR}/{name}/subject.txt')
+    text = engine.get_template(f'{EMAIL_TEMPLATES_DIR}/{name}/body.txt')
+    try:
+        html = engine.get_template(f'{EMAIL_TEMPLATES_DIR}/{name}/body.html')
+    except TemplateDoesNotExist:
+        html = None
+    return subject, text, html
+
+
+def render_email(name, context):
+    """Render an email template to (subject, text, html)"""
+    subject, text, html = get_email_templates(name)
+    return (
+        # Headers cannot contain newlines
+        ' '.join(subject.render(Context(context, autoescape=False)).split()),
+        text.render(Context(context, autoescape=False)).strip() + '\n',
+        html.render(Context(context)) if html else '',
+    )
+
+
+def new_email(subject, message, recipient_list, html_message='', from_email=None, idempotency_key=None,
+              sensitive=False):
+    """Unsaved OutboundEmail for queue_emails.
+
+    `sensitive` messages (credentials) have their body erased once sent or given up.
+    """
+    return OutboundEmail(
+        subject=subject,
+        body=message,
+        html_body=html_message or '',
+        from_email=from_email or settings.EMAIL_HOST_USER,
+        recipients=list(recipient_list),
+        idempotency_key=idempotency_key,
+        sensitive=sensitive,
+    )
+
+
+def new_template_email(name, context, recipient_list, **kwargs):
+    """Unsaved OutboundEmail rendered from templates/emails/<name>/"""
+    subject, message, html_message = render_email(name, context)
+    return new_email(subject, message, recipient_list, html_message=html_message, **kwargs)
+
+
+def queue_emails(emails):
+    """Spool unsaved OutboundEmail rows with one INSERT once the current transaction commits.
+
+    Messages whose idempotency key is already spooled are skipped.
+    """
+    emails = list(emails)
+    if not emails:
+        return
+
+    def spool():
+        OutboundEmail.objects.bulk_create(emails, ignore_conflicts=True)
+        # Inline mode has no worker to pick up a delayed flush
+        schedule_flush(None if settings.JOBS_RUN_INLINE else timedelta(seconds=settings.MAIL_FLUSH_DELAY))
+
+    transaction.on_commit(spool)
+
+
+def queue_email(subject, message, recipient_list, **kwargs):
+    """Spool an email once the current transaction commits, see new_email for the options"""
+    queue_emails([new_email(subject, message, recipient_list, **kwargs)])
+
+
+def queue_template_email(name, context, recipient_list, **kwargs):
+    """Render templates/emails/<name>/ and spool the result, see queue_email"""
+    queue_emails([new_template_email(name, context, recipient_list, **kwargs)])
+
+
+def schedule_flush(delay=None):
+    enqueue('jobs.flush_mail', delay=delay, coalesce=True)
+
+
+def schedule_next_flush(rate_limited):
+    """Queue a flush for messages still waiting (retries, or over the rate limit)"""
+    next_send = OutboundEmail.objects.filter(status=OutboundEmail.STATUS_QUEUED).order_by('send_after').values_list(
+        'send_after', flat=True
+    ).first()
+    if next_send is None:
+        return
+    now = timezone.now()
+    run_at = max(next_send, now)
+    if rate_limited:
+        run_at = max(run_at, MailDeliveryStats.get_minute(now) + timedelta(minutes=1))
+    schedule_flush(run_at - now)
+
+
+def build_message(email, connection):
+    message = EmailMultiAlternatives(
+        subject=email.subject, body=email.body, from_email=email.from_email, to=email.recipients, connection=connection,
+    )
+    if email.html_body:
+        message.attach_alternative(email.html_body, 'text/html')
+    return message
+
+
+def send_queued_mail():
+    """Send due messages over one connection within the rate limit, return (sent, failed)"""
+    minute = MailDeliveryStats.get_minute()
+    sent = failed = connections = 0
+    connection = None
+    rate_limited = False
+    started = time.monotonic()
+    try:
+        while True:
+            budget = settings.MAIL_RATE_LIMIT_PER_MINUTE - MailDeliveryStats.get_sent(minute) - sent
+            if budget <= 0:
+                rate_limited = True
+                break
+            batch = OutboundEmail.claim_due(min(budget, settings.MAIL_BATCH_SIZE))
+            if not batch:
+                break
+
+            delivered = []
+            for email in batch:
+                try:
+                    if connection is None:
+                        connection = get_connection(fail_silently=False)
+                        connections += 1
+                        connection.open()
+                    connection.send_messages([build_message(email, connection)])
+                except Exception as e:
+                    email.mark_failed(f'{type(e).__name__}: {e}')
+                    failed += 1
+                    # The connection may be broken, open a fresh one for the next message
+                    if connection is not None:
+                        connection.close()
+                        connection = None
+                else:
+                    delivered.append(email)
+            OutboundEmail.mark_sent(delivered)
+            sent += len(delivered)
+    finally:
+        if connection is not None:
+            connection.close()
+        MailDeliveryStats.record(
+            minute, sent=sent, failed=failed, connections=connections, send_seconds=time.monotonic() - started,
+        )
+
+    schedule_next_flush(rate_limited)
+    return sent, failed
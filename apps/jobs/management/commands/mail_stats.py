@@ -0,0 +1,37 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Sum
+from django.utils import timezone
+from apps.jobs.models import MailDeliveryStats, OutboundEmail
+
+
+class Command(BaseCommand):
+    help = 'Show outbound mail delivery statistics and the spool backlog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--minutes', type=int, default=60, help='Length of the reported period')
+
+    def handle(self, *args, **options):
+        since = MailDeliveryStats.get_minute() - timedelta(minutes=options['minutes'] - 1)
+        totals = MailDeliveryStats.objects.filter(minute__gte=since).aggregate(
+            sent=Sum('sent'), failed=Sum('failed'), connections=Sum('connections'),
+            flushes=Sum('flushes'), send_seconds=Sum('send_seconds'),
+        )
+        sent = totals['sent'] or 0
+        connections = totals['connections'] or 0
+        self.stdout.write(f'Last {options["minutes"]} min (limit {settings.MAIL_RATE_LIMIT_PER_MINUTE}/min)')
+        self.stdout.write(
+            f'sent: {sent}  failed: {totals["failed"] or 0}  flushes: {totals["flushes"] or 0}  '
+            f'connections: {connections}  messages per connection: {sent / connections if connections else 0:.1f}  '
+            f'send time: {totals["send_seconds"] or 0:.1f}s'
+        )
+
+        backlog = dict(OutboundEmail.objects.values_list('status').annotate(count=Count('id')))
+        self.stdout.write('spool: ' + '  '.join(
+            f'{label}: {backlog.get(status, 0)}' for status, label in OutboundEmail.STATUS_CHOICES
+        ))
+        oldest = OutboundEmail.objects.filter(status=OutboundEmail.STATUS_QUEUED).order_by('created_at').first()
+        if oldest:
+            self.stdout.write(f'oldest queued message waits {timezone.now() - oldest.created_at}')
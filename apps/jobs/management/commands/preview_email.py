@@ -0,0 +1,79 @@
+import json
+import os
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.template import TemplateDoesNotExist
+from apps.jobs.mail import EMAIL_TEMPLATES_DIR, render_email
+
+# Sample values for every template, overridable with --context
+SAMPLE_CONTEXTS = {
+    'order_created': {
+        'course_name': 'Немецкий язык A1', 'first_name': 'Иван', 'last_name': 'Петров', 'email': 'ivan@example.com',
+        'phone_number': '+7 900 000-00-00', 'promo_code': 'PROMO123', 'discount_percentage': 10,
+        'order_date': datetime(2025, 1, 15, 12, 30),
+    },
+    'order_activated': {
+        'first_name': 'Иван', 'last_name': 'Петров', 'email': 'ivan@example.com', 'course_name': 'Немецкий язык A1',
+        'course_url': f'{settings.SITE_URL}/courses/ordered/1/',
+    },
+    'user_credentials': {
+        'first_name': 'Иван', 'last_name': 'Петров', 'email': 'ivan@example.com', 'password': 'Xy7!pQ2mRt9a',
+        'login_url': f'{settings.SITE_URL}{settings.LOGIN_URL}',
+    },
+    'referral_link': {
+        'first_name': 'Иван', 'last_name': 'Петров', 'promo_code': 'REF12345',
+        'referral_link': f'{settings.SITE_URL}/referral/REF12345/',
+    },
+}
+
+
+class Command(BaseCommand):
+    help = 'Render an email template with sample data (templates/emails/<name>/)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', nargs='?', help='Template name; omit to list the available ones')
+        parser.add_argument('--html', action='store_true', help='Print the HTML version instead of the text one')
+        parser.add_argument('--context', default='{}', help='JSON object overriding sample values')
+        parser.add_argument('--benchmark', type=int, default=0, metavar='N', help='Render N times and report the rate')
+
+    def handle(self, *args, **options):
+        if not options['name']:
+            for name in self.get_template_names():
+                self.stdout.write(name)
+            return
+
+        try:
+            overrides = json.loads(options['context'])
+        except ValueError as e:
+            raise CommandError(f'--context is not valid JSON: {e}')
+        context = {**SAMPLE_CONTEXTS.get(options['name'], {}), **overrides}
+
+        try:
+            subject, text, html = render_email(options['name'], context)
+        except TemplateDoesNotExist as e:
+            raise CommandError(f'Template not found: {e}')
+
+        if options['benchmark']:
+            started = time.perf_counter()
+            for _ in range(options['benchmark']):
+                render_email(options['name'], context)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'{options["benchmark"]} renders in {elapsed:.3f}s ({options["benchmark"] / elapsed:.0f}/s)')
+            return
+
+        self.stdout.write(f'Subject: {subject}\n')
+        if options['html']:
+            self.stdout.write(html or self.style.WARNING('No HTML version'))
+        else:
+            self.stdout.write(text)
+
+    def get_template_names(self):
+        names = set(SAMPLE_CONTEXTS)
+        for directory in settings.TEMPLATES[0]['DIRS']:
+            path = os.path.join(directory, EMAIL_TEMPLATES_DIR)
+            if os.path.isdir(path):
+                names.update(entry for entry in os.listdir(path) if os.path.isdir(os.path.join(path, entry)))
+        return sorted(names)
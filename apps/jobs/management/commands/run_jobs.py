@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from apps.jobs.models import Job
+from apps.jobs.queue import run_job
+
+PRUNE_EVERY = 60 * 60
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs (worker loop)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run due jobs until none is left and exit')
+        parser.add_argument('--interval', type=float, default=2, help='Seconds to wait when no job is due')
+
+    def handle(self, *args, **options):
+        succeeded = failed = 0
+        pruned_at = 0
+        while True:
+            close_old_connections()
+            if time.monotonic() - pruned_at > PRUNE_EVERY:
+                Job.prune()
+                pruned_at = time.monotonic()
+
+            job = Job.claim_next()
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+                continue
+
+            if run_job(job):
+                succeeded += 1
+            else:
+                failed += 1
+                self.stderr.write(self.style.ERROR(f'{job}: {job.last_error}'))
+
+        self.stdout.write(self.style.SUCCESS(f'Jobs done: {succeeded}, failed: {failed}'))
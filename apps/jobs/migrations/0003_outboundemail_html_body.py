@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 13:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0002_mail_spool'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboundemail',
+            name='html_body',
+            field=models.TextField(blank=True, verbose_name='HTML версия'),
+        ),
+    ]
@@ -0,0 +1,256 @@
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """Queued unit of background work, see apps/jobs/queue.py"""
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'В очереди'),
+        (STATUS_RUNNING, 'Выполняется'),
+        (STATUS_DONE, 'Выполнена'),
+    ]
+
+    name = models.CharField(max_length=100, db_index=True, verbose_name="Задача")
+    payload = models.JSONField(default=dict, blank=True, verbose_name="Параметры")
+    idempotency_key = models.CharField(max_length=200, unique=True, null=True, blank=True, verbose_name="Ключ идемпотентности")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED, verbose_name="Статус")
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="Попыток")
+    max_attempts = models.PositiveSmallIntegerField(default=5, verbose_name="Максимум попыток")
+    sensitive = models.BooleanField(default=False, verbose_name="Содержит персональные данные")
+    last_error = models.TextField(blank=True, verbose_name="Последняя ошибка")
+    run_at = models.DateTimeField(default=timezone.now, verbose_name="Запуск не раньше")
+    locked_at = models.DateTimeField(null=True, blank=True, verbose_name="Взята в работу")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Дата выполнения")
+
+    class Meta:
+        verbose_name = "Задача"
+        verbose_name_plural = "1. Очередь задач"
+        ordering = ['run_at']
+        indexes = [models.Index(fields=['status', 'run_at'], name='jobs_job_status_run_at_idx')]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.get_status_display()})"
+
+    @classmethod
+    def claimable(cls, now):
+        """Due queued jobs and running jobs whose worker died (lock expired)"""
+        from .queue import get_lock_timeouts
+
+        lock_timeouts = get_lock_timeouts()
+        lock_expired = Q(locked_at__lt=now - timedelta(seconds=settings.JOBS_LOCK_TIMEOUT)) & ~Q(name__in=lock_timeouts)
+        for name, seconds in lock_timeouts.items():
+            lock_expired |= Q(name=name, locked_at__lt=now - timedelta(seconds=seconds))
+        return Q(status=cls.STATUS_QUEUED, run_at__lte=now) | (Q(status=cls.STATUS_RUNNING) & lock_expired)
+
+    @classmethod
+    def claim(cls, job_id):
+        """Take the job if it is still claimable, None when another worker won"""
+        now = timezone.now()
+        claimed = cls.objects.filter(cls.claimable(now), id=job_id).update(
+            status=cls.STATUS_RUNNING, attempts=F('attempts') + 1, locked_at=now,
+        )
+        return cls.objects.get(id=job_id) if claimed else None
+
+    @classmethod
+    def claim_next(cls):
+        """Claim the job due first, None when nothing is due"""
+        for job_id in cls.objects.filter(cls.claimable(timezone.now())).values_list('id', flat=True)[:10]:
+            job = cls.claim(job_id)
+            if job:
+                return job
+        return None
+
+    @classmethod
+    def prune(cls, older_than=None):
+        """Delete finished jobs, which also frees their idempotency keys"""
+        older_than = older_than or timedelta(days=settings.JOBS_KEEP_DONE_DAYS)
+        deleted, _ = cls.objects.filter(status=cls.STATUS_DONE, finished_at__lt=timezone.now() - older_than).delete()
+        return deleted
+
+    @staticmethod
+    def get_backoff(attempts):
+        """Exponential delay before the next attempt, with jitter so failed jobs do not retry in lockstep"""
+        delay = min(settings.JOBS_BACKOFF_BASE * 2 ** max(attempts - 1, 0), settings.JOBS_BACKOFF_MAX)
+        return timedelta(seconds=delay * random.uniform(1, 1.1))
+
+    def mark_done(self):
+        self.status = self.STATUS_DONE
+        self.finished_at = timezone.now()
+        self.locked_at = None
+        self.last_error = ''
+        if self.sensitive:
+            self.payload = {}
+        self.save(update_fields=['status', 'finished_at', 'locked_at', 'last_error', 'payload'])
+
+    def mark_failed(self, error):
+        """Schedule a retry with backoff, or move the job to the dead letters"""
+        if self.attempts >= self.max_attempts:
+            with transaction.atomic():
+                DeadLetter.objects.create(
+                    name=self.name,
+                    payload={} if self.sensitive else self.payload,
+                    idempotency_key=self.idempotency_key,
+                    attempts=self.attempts,
+                    sensitive=self.sensitive,
+                    last_error=error,
+                    enqueued_at=self.created_at,
+                )
+                self.delete()
+            return
+        self.status = self.STATUS_QUEUED
+        self.run_at = timezone.now() + self.get_backoff(self.attempts)
+        self.locked_at = None
+        self.last_error = error
+        self.save(update_fields=['status', 'run_at', 'locked_at', 'last_error'])
+
+
+class DeadLetter(models.Model):
+    """Job that failed all its attempts, kept for inspection and manual retry"""
+    name = models.CharField(max_length=100, db_index=True, verbose_name="Задача")
+    payload = models.JSONField(default=dict, blank=True, verbose_name="Параметры")
+    idempotency_key = models.CharField(max_length=200, null=True, blank=True, verbose_name="Ключ идемпотентности")
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="Попыток")
+    sensitive = models.BooleanField(default=False, verbose_name="Содержит персональные данные")
+    last_error = models.TextField(blank=True, verbose_name="Последняя ошибка")
+    enqueued_at = models.DateTimeField(verbose_name="Поставлена в очередь")
+    failed_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата отказа")
+
+    class Meta:
+        verbose_name = "Неудачная задача"
+        verbose_name_plural = "2. Неудачные задачи"
+        ordering = ['-failed_at']
+
+    def __str__(self):
+        return f"{self.name} ({self.failed_at:%d.%m.%Y %H:%M})"
+
+    def can_retry(self):
+        # The payload of sensitive jobs is erased, there is nothing to run again
+        return not self.sensitive
+
+    def retry(self):
+        """Put the job back in the queue with a fresh attempt budget"""
+        from .queue import enqueue
+
+        with transaction.atomic():
+            job = enqueue(self.name, self.payload, idempotency_key=self.idempotency_key)
+            self.delete()
+        return job
+
+
+class OutboundEmail(models.Model):
+    """Spooled email, sent in batches by the jobs.flush_mail job (see apps/jobs/mail.py)"""
+    STATUS_QUEUED = 'queued'
+    STATUS_SENDING = 'sending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'В очереди'),
+        (STATUS_SENDING, 'Отправляется'),
+        (STATUS_SENT, 'Отправлено'),
+        (STATUS_FAILED, 'Ошибка'),
+    ]
+
+    subject = models.CharField(max_length=255, verbose_name="Тема")
+    body = models.TextField(blank=True, verbose_name="Текст")
+    html_body = models.TextField(blank=True, verbose_name="HTML версия")
+    from_email = models.CharField(max_length=255, verbose_name="Отправитель")
+    recipients = models.JSONField(default=list, verbose_name="Получатели")
+    idempotency_key = models.CharField(max_length=200, unique=True, null=True, blank=True, verbose_name="Ключ идемпотентности")
+    sensitive = models.BooleanField(default=False, verbose_name="Содержит персональные данные")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED, verbose_name="Статус")
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="Попыток")
+    last_error = models.TextField(blank=True, verbose_name="Последняя ошибка")
+    send_after = models.DateTimeField(default=timezone.now, verbose_name="Отправить не раньше")
+    locked_at = models.DateTimeField(null=True, blank=True, verbose_name="Взято в отправку")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name="Дата отправки")
+
+    class Meta:
+        verbose_name = "Исходящее письмо"
+        verbose_name_plural = "3. Исходящие письма"
+        ordering = ['send_after']
+        indexes = [models.Index(fields=['status', 'send_after'], name='jobs_email_status_send_idx')]
+
+    def __str__(self):
+        return f"{self.subject} → {', '.join(self.recipients)}"
+
+    @classmethod
+    def claim_due(cls, limit):
+        """Lock up to `limit` due messages for sending (and messages of a dead flush)"""
+        now = timezone.now()
+        lock_expired = now - timedelta(seconds=settings.JOBS_LOCK_TIMEOUT)
+        claimable = Q(status=cls.STATUS_QUEUED, send_after__lte=now) | Q(status=cls.STATUS_SENDING, locked_at__lt=lock_expired)
+        ids = list(cls.objects.filter(claimable).values_list('id', flat=True)[:limit])
+        if not ids:
+            return []
+        cls.objects.filter(claimable, id__in=ids).update(status=cls.STATUS_SENDING, attempts=F('attempts') + 1, locked_at=now)
+        # Rows another flush claimed in between are not returned
+        return list(cls.objects.filter(id__in=ids, status=cls.STATUS_SENDING, locked_at=now))
+
+    @classmethod
+    def mark_sent(cls, emails):
+        """Set-based: one UPDATE for the batch, plus one erasing bodies of sensitive messages"""
+        ids = [email.id for email in emails]
+        if not ids:
+            return
+        cls.objects.filter(id__in=ids).update(status=cls.STATUS_SENT, sent_at=timezone.now(), locked_at=None, last_error='')
+        cls.objects.filter(id__in=ids, sensitive=True).update(body='', html_body='')
+
+    def mark_failed(self, error):
+        """Retry later with the job backoff, or give up after MAIL_MAX_ATTEMPTS"""
+        self.last_error = error
+        self.locked_at = None
+        if self.attempts >= settings.MAIL_MAX_ATTEMPTS:
+            self.status = self.STATUS_FAILED
+            if self.sensitive:
+                self.body = self.html_body = ''
+        else:
+            self.status = self.STATUS_QUEUED
+            self.send_after = timezone.now() + Job.get_backoff(self.attempts)
+        self.save(update_fields=['last_error', 'locked_at', 'status', 'send_after', 'body', 'html_body'])
+
+
+class MailDeliveryStats(models.Model):
+    """Outbound mail counters per calendar minute, also used for the rate limit"""
+    minute = models.DateTimeField(unique=True, verbose_name="Минута")
+    sent = models.PositiveIntegerField(default=0, verbose_name="Отправлено")
+    failed = models.PositiveIntegerField(default=0, verbose_name="Ошибок")
+    connections = models.PositiveIntegerField(default=0, verbose_name="Соединений")
+    flushes = models.PositiveIntegerField(default=0, verbose_name="Пакетов")
+    send_seconds = models.FloatField(default=0, verbose_name="Время отправки, с")
+
+    class Meta:
+        verbose_name = "Статистика отправки писем"
+        verbose_name_plural = "4. Статистика отправки писем"
+        ordering = ['-minute']
+
+    def __str__(self):
+        return f"{self.minute:%d.%m.%Y %H:%M}: {self.sent} / {self.failed}"
+
+    @staticmethod
+    def get_minute(now=None):
+        return (now or timezone.now()).replace(second=0, microsecond=0)
+
+    @classmethod
+    def get_sent(cls, minute):
+        return cls.objects.filter(minute=minute).values_list('sent', flat=True).first() or 0
+
+    @classmethod
+    def record(cls, minute, sent=0, failed=0, connections=0, send_seconds=0):
+        cls.objects.get_or_create(minute=minute)
+        cls.objects.filter(minute=minute).update(
+            sent=F('sent') + sent,
+            failed=F('failed') + failed,
+            connections=F('connections') + connections,
+            flushes=F('flushes') + 1,
+            send_seconds=F('send_seconds') + send_seconds,
+        )
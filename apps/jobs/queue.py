@@ -0,0 +1,104 @@
+"""Database-backed job queue.
+
+Jobs are rows of the Job table, so no broker is needed: `manage.py run_jobs`
+claims due jobs with a conditional UPDATE (safe with several workers), runs the
+registered handler with the job payload as keyword arguments and either marks the
+job done or schedules a retry with exponential backoff. After `max_attempts`
+failures the job moves to the DeadLetter table.
+
+Handlers are plain functions registered with @task in an app's tasks.py module.
+Request code enqueues with `enqueue_on_commit` so a job never sees data of a
+rolled back transaction and never runs before the rows it needs are committed.
+
+An idempotency key makes enqueueing a no-op while a job with the same key exists
+(queued, running or done and not yet pruned). `coalesce=True` makes it a no-op
+while a job of the same name is waiting to run, for jobs that process whatever
+has accumulated (e.g. the mail flush); a waiting job scheduled later than the new
+one would run is moved earlier.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+_registry = {}
+
+
+def task(name, max_attempts=None, lock_timeout=None):
+    """Register a job handler under `name`.
+
+    `lock_timeout` (seconds) replaces JOBS_LOCK_TIMEOUT for handlers that legitimately
+    run longer, so their jobs are not taken over by another worker while still running.
+    """
+    def decorator(func):
+        _registry[name] = (func, max_attempts, lock_timeout)
+        return func
+    return decorator
+
+
+def get_lock_timeouts():
+    """{job name: seconds} for the handlers registered with their own lock timeout"""
+    return {name: lock_timeout for name, (_, _, lock_timeout) in _registry.items() if lock_timeout}
+
+
+def get_handler(name):
+    try:
+        return _registry[name][0]
+    except KeyError:
+        raise LookupError(f'Неизвестная задача: {name}')
+
+
+def enqueue(name, payload=None, idempotency_key=None, delay=None, sensitive=False, coalesce=False):
+    """Add a job and return it (the existing one for a known idempotency key or a coalesced job).
+
+    `sensitive` jobs have their payload erased once done or dead-lettered.
+    """
+    from .models import Job
+
+    get_handler(name)
+    if coalesce:
+        waiting = Job.objects.filter(name=name, status=Job.STATUS_QUEUED).first()
+        if waiting:
+            # A job pushed back by a backoff or a rate limit must not hold up what was just queued
+            run_at = timezone.now() + (delay or timedelta(0))
+            if Job.objects.filter(pk=waiting.pk, status=Job.STATUS_QUEUED, run_at__gt=run_at).update(run_at=run_at):
+                waiting.run_at = run_at
+            return waiting
+    job = Job(
+        name=name,
+        payload=payload or {},
+        idempotency_key=idempotency_key,
+        max_attempts=_registry[name][1] or settings.JOBS_MAX_ATTEMPTS,
+        sensitive=sensitive,
+    )
+    if delay:
+        job.run_at = job.run_at + delay
+    if idempotency_key is None:
+        job.save()
+    else:
+        Job.objects.bulk_create([job], ignore_conflicts=True)
+        job = Job.objects.get(idempotency_key=idempotency_key)
+
+    if settings.JOBS_RUN_INLINE and job.status == Job.STATUS_QUEUED and not delay:
+        # Development without a worker: run right away
+        claimed = Job.claim(job.pk)
+        if claimed:
+            run_job(claimed)
+    return job
+
+
+def enqueue_on_commit(name, payload=None, **kwargs):
+    """Enqueue once the current transaction commits (immediately outside a transaction)"""
+    transaction.on_commit(lambda: enqueue(name, payload, **kwargs))
+
+
+def run_job(job):
+    """Run a claimed job, return True on success"""
+    try:
+        get_handler(job.name)(**job.payload)
+    except Exception as e:
+        job.mark_failed(f'{type(e).__name__}: {e}')
+        return False
+    job.mark_done()
+    return True
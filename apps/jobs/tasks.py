@@ -0,0 +1,7 @@
+from . import mail
+from .queue import task
+
+
+@task('jobs.flush_mail')
+def flush_mail():
+    mail.send_queued_mail()
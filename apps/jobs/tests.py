@@ -0,0 +1,133 @@
+from datetime import timedelta
+
+from django.core import mail
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .mail import queue_email, queue_template_email, schedule_flush
+from .models import DeadLetter, Job, MailDeliveryStats, OutboundEmail
+from .queue import enqueue, run_job, task
+
+calls = []
+
+
+@task('tests.record', max_attempts=2)
+def record(value, fail=False):
+    calls.append(value)
+    if fail:
+        raise RuntimeError('boom')
+
+
+@task('tests.slow', lock_timeout=60 * 60)
+def slow():
+    pass
+
+
+@override_settings(JOBS_RUN_INLINE=False)
+class JobQueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_idempotency_key_enqueues_once(self):
+        first = enqueue('tests.record', {'value': 1}, idempotency_key='k')
+        second = enqueue('tests.record', {'value': 2}, idempotency_key='k')
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_failed_job_is_retried_with_backoff_then_dead_lettered(self):
+        job = enqueue('tests.record', {'value': 1, 'fail': True})
+
+        self.assertFalse(run_job(Job.claim_next()))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_QUEUED)
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=20))
+        self.assertIsNone(Job.claim_next())
+
+        Job.objects.update(run_at=timezone.now())
+        self.assertFalse(run_job(Job.claim_next()))
+        self.assertFalse(Job.objects.exists())
+        dead_letter = DeadLetter.objects.get()
+        self.assertEqual(dead_letter.attempts, 2)
+        self.assertIn('boom', dead_letter.last_error)
+        self.assertEqual(calls, [1, 1])
+
+        dead_letter.retry()
+        self.assertEqual(Job.objects.get().payload, {'value': 1, 'fail': True})
+
+    def test_lock_timeout_per_task(self):
+        enqueue('tests.record', {'value': 1})
+        enqueue('tests.slow')
+        Job.objects.update(status=Job.STATUS_RUNNING, locked_at=timezone.now() - timedelta(minutes=30))
+        # Only the job past the default lock timeout is taken over
+        self.assertEqual(Job.claim_next().name, 'tests.record')
+        self.assertIsNone(Job.claim_next())
+        Job.objects.filter(name='tests.slow').update(locked_at=timezone.now() - timedelta(hours=2))
+        self.assertEqual(Job.claim_next().name, 'tests.slow')
+
+    def test_sensitive_payload_is_erased_after_running(self):
+        enqueue('tests.record', {'value': 'secret'}, sensitive=True)
+
+        self.assertTrue(run_job(Job.claim_next()))
+        self.assertEqual(Job.objects.get().payload, {})
+
+
+@override_settings(JOBS_RUN_INLINE=False, MAIL_FLUSH_DELAY=0, MAIL_RATE_LIMIT_PER_MINUTE=3)
+class MailSpoolTests(TestCase):
+    def queue(self, count, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            for index in range(count):
+                queue_email(f'Subject {index}', 'Body', [f'user{index}@example.com'], **kwargs)
+
+    def test_messages_are_coalesced_into_one_flush_over_one_connection(self):
+        self.queue(3)
+        self.assertEqual(Job.objects.filter(name='jobs.flush_mail').count(), 1)
+
+        self.assertTrue(run_job(Job.claim_next()))
+        self.assertEqual(len(mail.outbox), 3)
+        stats = MailDeliveryStats.objects.get()
+        self.assertEqual((stats.sent, stats.connections, stats.flushes), (3, 1, 1))
+        self.assertEqual(OutboundEmail.objects.filter(status=OutboundEmail.STATUS_SENT).count(), 3)
+
+    def test_rate_limit_defers_the_rest_to_the_next_minute(self):
+        self.queue(5)
+        run_job(Job.claim_next())
+
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(OutboundEmail.objects.filter(status=OutboundEmail.STATUS_QUEUED).count(), 2)
+        next_flush = Job.objects.get(name='jobs.flush_mail', status=Job.STATUS_QUEUED)
+        self.assertAlmostEqual(
+            next_flush.run_at, MailDeliveryStats.get_minute() + timedelta(minutes=1), delta=timedelta(seconds=1)
+        )
+
+    def test_coalesced_flush_is_moved_earlier(self):
+        schedule_flush(timedelta(minutes=5))
+        schedule_flush(timedelta(minutes=10))
+        flush = Job.objects.get(name='jobs.flush_mail')
+        self.assertGreater(flush.run_at, timezone.now() + timedelta(minutes=4))
+
+        schedule_flush()
+        self.assertEqual(Job.objects.filter(name='jobs.flush_mail').count(), 1)
+        self.assertEqual(Job.claim_next().pk, flush.pk)
+
+    def test_duplicate_and_sensitive_messages(self):
+        self.queue(1, idempotency_key='credentials', sensitive=True)
+        self.queue(1, idempotency_key='credentials', sensitive=True)
+        run_job(Job.claim_next())
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(OutboundEmail.objects.get().body, '')
+
+    def test_template_email_has_text_and_html_versions(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            queue_template_email('referral_link', {
+                'first_name': 'Иван', 'last_name': '<Петров>', 'promo_code': 'REF1',
+                'referral_link': 'https://example.com/referral/REF1/',
+            }, ['ivan@example.com'])
+        run_job(Job.claim_next())
+
+        message = mail.outbox[0]
+        self.assertNotIn('\n', message.subject)
+        self.assertIn('<Петров>', message.body)
+        html, content_type = message.alternatives[0]
+        self.assertEqual(content_type, 'text/html')
+        self.assertIn('&lt;Петров&gt;', html)
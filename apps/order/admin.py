@@ -1,10 +1,16 @@
+from django.conf import settings
 from django.contrib import admin
+from django.db.models import Q
+from django.utils.html import format_html, format_html_join
+from . import segments
 from .models import (
     CourseOrder, 
     CourseChapterForOrderedUser, 
     CourseVideoForOrderedUser, 
     CourseMaterialForOrderedUser,
-    UserVideoProgress
+    UserVideoProgress,
+    OrderProgress,
+    VideoHeatmap,
 )
 
 
@@ -16,6 +22,7 @@ class CourseOrderAdmin(admin.ModelAdmin):
     readonly_fields = ['order_date']
     list_editable = ['is_active', 'is_completed']
     ordering = ['-order_date']
+    actions = ['activate_selected']
     
     fieldsets = (
         ('Основная информация', {
@@ -30,6 +37,18 @@ class CourseOrderAdmin(admin.ModelAdmin):
         }),
     )
 
+    def activate_selected(self, request, queryset):
+        # Active orders that already have their user are skipped
+        pending = queryset.filter(Q(is_active=False) | Q(user__isnull=True, sender__isnull=False)).select_related('course')
+        orders = list(pending)
+        assigned = CourseOrder.activate_orders(orders)
+        self.message_user(
+            request,
+            f"Активировано заказов: {len(orders)}, пропущено: {queryset.count() - len(orders)}, "
+            f"уведомлений отправлено: {len(assigned)}",
+        )
+    activate_selected.short_description = "Активировать выбранные заказы"
+
 
 class CourseVideoForOrderedUserInline(admin.TabularInline):
     model = CourseVideoForOrderedUser
@@ -53,12 +72,13 @@ class CourseChapterForOrderedUserAdmin(admin.ModelAdmin):
     readonly_fields = ['access_granted_date']
     list_editable = ['is_activate', 'is_accessible', 'chapter_order']
     ordering = ['order', 'chapter_order']
+    raw_id_fields = ['source_chapter']
     
     inlines = [CourseVideoForOrderedUserInline, CourseMaterialForOrderedUserInline]
     
     fieldsets = (
         ('Основная информация', {
-            'fields': ('order', 'title', 'description', 'chapter_order')
+            'fields': ('order', 'source_chapter', 'title', 'description', 'chapter_order')
         }),
         ('Статус', {
             'fields': ('is_activate', 'is_accessible', 'access_granted_date')
@@ -74,10 +94,11 @@ class CourseVideoForOrderedUserAdmin(admin.ModelAdmin):
     readonly_fields = ['access_granted_date']
     list_editable = ['is_activate', 'is_accessible', 'video_order']
     ordering = ['order', 'video_order']
+    raw_id_fields = ['source_video']
     
     fieldsets = (
         ('Основная информация', {
-            'fields': ('order', 'chapter', 'title', 'description', 'video_order')
+            'fields': ('order', 'chapter', 'source_video', 'title', 'description', 'video_order')
         }),
         ('Видео файл', {
             'fields': ('video_file', 'video_time')
@@ -96,10 +117,11 @@ class CourseMaterialForOrderedUserAdmin(admin.ModelAdmin):
     readonly_fields = ['access_granted_date']
     list_editable = ['is_activate', 'is_accessible', 'material_order']
     ordering = ['order', 'material_order']
+    raw_id_fields = ['source_material']
     
     fieldsets = (
         ('Основная информация', {
-            'fields': ('order', 'chapter', 'title', 'description', 'material_type', 'material_order')
+            'fields': ('order', 'chapter', 'source_material', 'title', 'description', 'material_type', 'material_order')
         }),
         ('Файлы', {
             'fields': ('image_file', 'document_file')
@@ -115,10 +137,10 @@ class CourseMaterialForOrderedUserAdmin(admin.ModelAdmin):
 
 @admin.register(UserVideoProgress)
 class UserVideoProgressAdmin(admin.ModelAdmin):
-    list_display = ['user', 'video', 'is_watched', 'watched_at', 'watch_duration']
+    list_display = ['user', 'video', 'is_watched', 'watched_at', 'watch_duration', 'last_position']
     list_filter = ['is_watched', 'watched_at', 'video__order__course']
     search_fields = ['user__email', 'video__title', 'video__order__course__name']
-    readonly_fields = ['watched_at']
+    readonly_fields = ['watched_at', 'position_updated_at', 'watched_segments_display']
     list_editable = ['is_watched']
     ordering = ['-watched_at']
     
@@ -127,6 +149,58 @@ class UserVideoProgressAdmin(admin.ModelAdmin):
             'fields': ('user', 'video', 'is_watched', 'watched_at')
         }),
         ('Детали просмотра', {
-            'fields': ('watch_duration',)
+            'fields': ('watch_duration', 'last_position', 'position_updated_at', 'watched_segments_display')
         }),
     )
+
+    @admin.display(description="Просмотренные отрезки")
+    def watched_segments_display(self, obj):
+        watched = segments.count_watched(obj.watched_segments)
+        return f"{watched} × {settings.VIDEO_SEGMENT_SECONDS} с"
+
+
+@admin.register(OrderProgress)
+class OrderProgressAdmin(admin.ModelAdmin):
+    list_display = ['order', 'watched_videos', 'total_videos', 'quiz_passed', 'percentage', 'last_activity_at']
+    list_filter = ['has_quiz', 'quiz_passed', 'order__course']
+    search_fields = ['order__sender', 'order__user__email', 'order__course__name']
+    readonly_fields = ['order', 'watched_videos', 'total_videos', 'has_quiz', 'quiz_passed', 'percentage', 'last_activity_at', 'updated_at']
+    ordering = ['-last_activity_at']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('order__course', 'order__user')
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(VideoHeatmap)
+class VideoHeatmapAdmin(admin.ModelAdmin):
+    list_display = ['video', 'viewers', 'segment_seconds', 'computed_at']
+    list_filter = ['video__chapter__course']
+    search_fields = ['video__title', 'video__chapter__course__name']
+    readonly_fields = ['video', 'segment_seconds', 'viewers', 'computed_at', 'chart']
+    exclude = ['counts']
+    ordering = ['-viewers']
+    # Most bars drawn, long videos are shown at a coarser step
+    chart_width = 120
+
+    def has_add_permission(self, request):
+        # Heatmaps are built by manage.py build_video_heatmaps
+        return False
+
+    @admin.display(description="Зрители по времени")
+    def chart(self, obj):
+        counts = obj.counts
+        if not counts or not obj.peak:
+            return "Нет данных"
+        step = -(-len(counts) // self.chart_width)
+        bars = [(start, max(counts[start:start + step])) for start in range(0, len(counts), step)]
+        return format_html(
+            '<div style="display:flex;align-items:flex-end;height:120px;gap:1px">{}</div>',
+            format_html_join('', '<div title="{} — {}" style="flex:1;background:#417690;height:{}%"></div>', (
+                (f"{start * obj.segment_seconds // 60}:{start * obj.segment_seconds % 60:02d}", viewers,
+                 max(1, round(viewers / obj.peak * 100)) if viewers else 0)
+                for start, viewers in bars
+            )),
+        )
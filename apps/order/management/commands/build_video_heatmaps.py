@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from apps.courses.models import CourseChapterVideo
+from apps.order.models import VideoHeatmap
+
+
+class Command(BaseCommand):
+    help = 'Aggregate watched-segment bitmaps into per-video heatmaps (run nightly from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200, help='Videos aggregated per batch')
+        parser.add_argument('--video', type=int, action='append', dest='video_ids', help='Rebuild only the given course video id (repeatable)')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        videos = CourseChapterVideo.objects.order_by('id')
+        if options['video_ids']:
+            videos = videos.filter(id__in=options['video_ids'])
+        video_ids = list(videos.values_list('id', flat=True))
+
+        total = viewers = 0
+        for start in range(0, len(video_ids), batch_size):
+            heatmaps = VideoHeatmap.rebuild(video_ids[start:start + batch_size])
+            total += len(heatmaps)
+            viewers += sum(heatmap.viewers for heatmap in heatmaps)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt heatmaps for {total} videos ({viewers} viewer bitmaps)'))
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from apps.order.models import CourseOrder, OrderProgress
+
+
+class Command(BaseCommand):
+    help = 'Compare stored order progress snapshots with freshly computed values'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Orders checked per batch')
+        parser.add_argument('--fix', action='store_true', help='Rewrite snapshots that are missing or out of date')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        stale_orders = []
+        checked = 0
+
+        order_ids = list(CourseOrder.objects.order_by('id').values_list('id', flat=True))
+        for start in range(0, len(order_ids), batch_size):
+            orders = list(CourseOrder.objects.filter(id__in=order_ids[start:start + batch_size]))
+            stored = {progress.order_id: progress for progress in OrderProgress.objects.filter(order__in=orders)}
+
+            for expected in OrderProgress.build_for_orders(orders):
+                checked += 1
+                current = stored.get(expected.order_id)
+                if current is None:
+                    self.stdout.write(self.style.WARNING(f'Order {expected.order_id}: snapshot is missing'))
+                    stale_orders.append(expected.order)
+                    continue
+                differences = current.differs_from(expected)
+                for field in differences:
+                    self.stdout.write(self.style.WARNING(
+                        f'Order {expected.order_id}: {field} is {getattr(current, field)}, expected {getattr(expected, field)}'
+                    ))
+                if differences:
+                    stale_orders.append(expected.order)
+
+        if options['fix'] and stale_orders:
+            OrderProgress.refresh_for_orders(stale_orders)
+            self.stdout.write(self.style.SUCCESS(f'Fixed {len(stale_orders)} snapshots'))
+
+        if stale_orders and not options['fix']:
+            self.stdout.write(self.style.ERROR(f'{len(stale_orders)} of {checked} snapshots are inconsistent'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Checked {checked} snapshots'))
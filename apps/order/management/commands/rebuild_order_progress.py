@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from apps.order.models import CourseOrder, OrderProgress
+
+
+class Command(BaseCommand):
+    help = 'Rebuild progress snapshots for course orders in bulk'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Orders processed per batch')
+        parser.add_argument('--order', type=int, action='append', dest='order_ids', help='Rebuild only the given order id (repeatable)')
+
+    def handle(self, *args, **options):
+        orders = CourseOrder.objects.order_by('id')
+        if options['order_ids']:
+            orders = orders.filter(id__in=options['order_ids'])
+
+        batch_size = options['batch_size']
+        rebuilt = 0
+        batch = []
+        for order in orders.iterator(chunk_size=batch_size):
+            batch.append(order)
+            if len(batch) >= batch_size:
+                rebuilt += len(OrderProgress.refresh_for_orders(batch))
+                batch = []
+        if batch:
+            rebuilt += len(OrderProgress.refresh_for_orders(batch))
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rebuilt} order progress snapshots'))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from apps.order.models import (
+    CourseOrder, CourseChapterForOrderedUser, CourseVideoForOrderedUser, CourseMaterialForOrderedUser, OrderProgress,
+)
+
+
+class Command(BaseCommand):
+    help = 'Align is_accessible of ordered content with the activation of its order (one-off repair of legacy rows)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many rows are out of sync')
+
+    def handle(self, *args, **options):
+        affected_orders = set()
+        with transaction.atomic():
+            for model in (CourseChapterForOrderedUser, CourseVideoForOrderedUser, CourseMaterialForOrderedUser):
+                stale = model.objects.filter(order__is_active=True, is_accessible=False) | model.objects.filter(
+                    order__is_active=False, is_accessible=True
+                )
+                affected_orders.update(stale.values_list('order_id', flat=True).distinct())
+                count = stale.count()
+                if not options['dry_run']:
+                    model.objects.filter(order__is_active=True, is_accessible=False).update(is_accessible=True)
+                    model.objects.filter(order__is_active=False, is_accessible=True).update(is_accessible=False)
+                self.stdout.write(f'{model.__name__}: {count} rows out of sync')
+
+            if not options['dry_run'] and affected_orders:
+                # Snapshots built before access followed the order may count the wrong videos
+                OrderProgress.refresh_for_orders(CourseOrder.objects.filter(id__in=affected_orders))
+
+        action = 'Would repair' if options['dry_run'] else 'Repaired'
+        self.stdout.write(self.style.SUCCESS(f'{action} content access of {len(affected_orders)} orders'))
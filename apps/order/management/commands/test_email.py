@@ -1,24 +1,29 @@
 from django.core.management.base import BaseCommand
-from django.core.mail import send_mail
 from django.conf import settings
+from apps.jobs.mail import new_email, send_queued_mail
+from apps.jobs.models import OutboundEmail
 
 
 class Command(BaseCommand):
     help = 'Test email sending'
 
     def handle(self, *args, **options):
-        try:
-            result = send_mail(
-                subject='Test Email',
-                message='This is a test email from Django.',
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=['sobirjon0518@yandex.ru'],
-                fail_silently=False,
-            )
+        # Delivered through the mail spool like every other email; the flush
+        # also sends whatever else is due
+        email = new_email(
+            subject='Test Email',
+            message='This is a test email from Django.',
+            recipient_list=['sobirjon0518@yandex.ru'],
+            from_email=settings.DEFAULT_FROM_EMAIL,
+        )
+        email.save()
+        send_queued_mail()
+        email.refresh_from_db()
+        if email.status == OutboundEmail.STATUS_SENT:
             self.stdout.write(
-                self.style.SUCCESS(f'Email sent successfully: {result}')
+                self.style.SUCCESS(f'Email sent successfully: {email.pk}')
             )
-        except Exception as e:
+        else:
             self.stdout.write(
-                self.style.ERROR(f'Error sending email: {e}')
+                self.style.ERROR(f'Error sending email: {email.last_error or email.get_status_display()}')
             )
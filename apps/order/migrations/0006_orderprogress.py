@@ -0,0 +1,32 @@
+# Generated by Django 5.2.6 on 2026-10-17 12:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0005_userchapterprogress'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('watched_videos', models.PositiveIntegerField(default=0, verbose_name='Просмотрено видео')),
+                ('total_videos', models.PositiveIntegerField(default=0, verbose_name='Всего видео')),
+                ('has_quiz', models.BooleanField(default=False, verbose_name='Есть тест')),
+                ('quiz_passed', models.BooleanField(default=False, verbose_name='Тест пройден')),
+                ('percentage', models.FloatField(default=0.0, verbose_name='Процент прохождения')),
+                ('last_activity_at', models.DateTimeField(blank=True, null=True, verbose_name='Последняя активность')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='progress', to='order.courseorder', verbose_name='Заказ')),
+            ],
+            options={
+                'verbose_name': 'Прогресс по заказу',
+                'verbose_name_plural': '7. Прогресс по заказам',
+            },
+        ),
+    ]
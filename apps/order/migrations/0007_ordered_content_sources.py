@@ -0,0 +1,41 @@
+# Generated by Django 5.2.6 on 2026-10-17 12:58
+
+import datetime
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0017_remove_option_d'),
+        ('order', '0006_orderprogress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coursechapterforordereduser',
+            name='source_chapter',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ordered_copies', to='courses.coursechapter', verbose_name='Исходная глава'),
+        ),
+        migrations.AddField(
+            model_name='coursematerialforordereduser',
+            name='source_material',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ordered_copies', to='courses.coursechaptermaterials', verbose_name='Исходный материал'),
+        ),
+        migrations.AddField(
+            model_name='coursevideoforordereduser',
+            name='source_video',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ordered_copies', to='courses.coursechaptervideo', verbose_name='Исходное видео'),
+        ),
+        migrations.AlterField(
+            model_name='coursevideoforordereduser',
+            name='video_file',
+            field=models.FileField(blank=True, upload_to='course_videos/ordered/', verbose_name='Видео файл'),
+        ),
+        migrations.AlterField(
+            model_name='coursevideoforordereduser',
+            name='video_time',
+            field=models.DurationField(blank=True, default=datetime.timedelta(0), null=True, verbose_name='Длительность видео'),
+        ),
+    ]
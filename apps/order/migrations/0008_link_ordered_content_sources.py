@@ -0,0 +1,72 @@
+# Generated by Django 5.2.6 on 2026-10-17 12:58
+
+from django.db import migrations
+
+
+def link_sources(apps, schema_editor):
+    """Link per-order copies to their course rows by title and position, the copied payload is kept"""
+    CourseOrder = apps.get_model('order', 'CourseOrder')
+    CourseChapter = apps.get_model('courses', 'CourseChapter')
+    CourseChapterVideo = apps.get_model('courses', 'CourseChapterVideo')
+    CourseChapterMaterials = apps.get_model('courses', 'CourseChapterMaterials')
+    CourseChapterForOrderedUser = apps.get_model('order', 'CourseChapterForOrderedUser')
+    CourseVideoForOrderedUser = apps.get_model('order', 'CourseVideoForOrderedUser')
+    CourseMaterialForOrderedUser = apps.get_model('order', 'CourseMaterialForOrderedUser')
+
+    course_ids = CourseOrder.objects.values_list('course_id', flat=True).distinct()
+    for course_id in course_ids:
+        source_chapters = {
+            (chapter.title, chapter.order): chapter
+            for chapter in CourseChapter.objects.filter(course_id=course_id)
+        }
+        # Positions of videos and materials only count within their chapter
+        source_videos = {
+            (video.chapter_id, video.title, video.order): video
+            for video in CourseChapterVideo.objects.filter(chapter__course_id=course_id)
+        }
+        source_materials = {
+            (material.chapter_id, material.title, material.order): material
+            for material in CourseChapterMaterials.objects.filter(chapter__course_id=course_id)
+        }
+
+        chapters = []
+        chapter_sources = {}
+        for chapter in CourseChapterForOrderedUser.objects.filter(order__course_id=course_id):
+            if chapter.source_chapter_id is None:
+                source = source_chapters.get((chapter.title, chapter.chapter_order))
+                if source is None:
+                    continue
+                chapter.source_chapter = source
+                chapters.append(chapter)
+            chapter_sources[chapter.id] = chapter.source_chapter_id
+        CourseChapterForOrderedUser.objects.bulk_update(chapters, ['source_chapter'], batch_size=500)
+
+        videos = []
+        for video in CourseVideoForOrderedUser.objects.filter(order__course_id=course_id, source_video__isnull=True):
+            source = source_videos.get((chapter_sources.get(video.chapter_id), video.title, video.video_order))
+            if source is None:
+                continue
+            video.source_video = source
+            videos.append(video)
+        CourseVideoForOrderedUser.objects.bulk_update(videos, ['source_video'], batch_size=500)
+
+        materials = []
+        for material in CourseMaterialForOrderedUser.objects.filter(order__course_id=course_id, source_material__isnull=True):
+            source = source_materials.get((chapter_sources.get(material.chapter_id), material.title, material.material_order))
+            if source is None:
+                continue
+            material.source_material = source
+            materials.append(material)
+        CourseMaterialForOrderedUser.objects.bulk_update(materials, ['source_material'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0007_ordered_content_sources'),
+    ]
+
+    operations = [
+        # Going back drops the source columns in 0007, nothing to undo here
+        migrations.RunPython(link_sources, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.6 on 2026-10-17 13:28
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0024_hot_path_indexes'),
+        ('order', '0008_link_ordered_content_sources'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='courseorder',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['user', '-order_date'], name='order_user_active_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-17 13:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0009_courseorder_user_active_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uservideoprogress',
+            name='last_position',
+            field=models.PositiveIntegerField(default=0, verbose_name='Позиция для продолжения, с'),
+        ),
+        migrations.AddField(
+            model_name='uservideoprogress',
+            name='position_updated_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Позиция обновлена'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-17 13:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0024_hot_path_indexes'),
+        ('order', '0010_uservideoprogress_resume_position'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uservideoprogress',
+            name='watched_segments',
+            field=models.BinaryField(blank=True, default=b'', verbose_name='Просмотренные отрезки'),
+        ),
+        migrations.CreateModel(
+            name='VideoHeatmap',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('segment_seconds', models.PositiveIntegerField(verbose_name='Длина отрезка, с')),
+                ('viewers', models.PositiveIntegerField(default=0, verbose_name='Зрителей')),
+                ('counts', models.JSONField(blank=True, default=list, verbose_name='Зрителей по отрезкам')),
+                ('computed_at', models.DateTimeField(verbose_name='Дата расчета')),
+                ('video', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='heatmap', to='courses.coursechaptervideo', verbose_name='Видео')),
+            ],
+            options={
+                'verbose_name': 'Тепловая карта просмотра',
+                'verbose_name_plural': '8. Тепловые карты просмотра',
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.6 on 2026-10-17 14:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0026_coursestats_ratings_sum'),
+        ('order', '0011_video_watched_segments'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='coursechapterforordereduser',
+            unique_together=set(),
+        ),
+        migrations.AlterUniqueTogether(
+            name='coursematerialforordereduser',
+            unique_together=set(),
+        ),
+        migrations.AlterUniqueTogether(
+            name='coursevideoforordereduser',
+            unique_together=set(),
+        ),
+        migrations.AddConstraint(
+            model_name='coursechapterforordereduser',
+            constraint=models.UniqueConstraint(condition=models.Q(('source_chapter__isnull', False)), fields=('order', 'source_chapter'), name='ordered_chapter_source_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='coursechapterforordereduser',
+            constraint=models.UniqueConstraint(condition=models.Q(('source_chapter__isnull', True)), fields=('order', 'title', 'chapter_order'), name='ordered_chapter_copy_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='coursematerialforordereduser',
+            constraint=models.UniqueConstraint(condition=models.Q(('source_material__isnull', False)), fields=('order', 'source_material'), name='ordered_material_source_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='coursematerialforordereduser',
+            constraint=models.UniqueConstraint(condition=models.Q(('source_material__isnull', True)), fields=('order', 'title', 'material_order'), name='ordered_material_copy_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='coursevideoforordereduser',
+            constraint=models.UniqueConstraint(condition=models.Q(('source_video__isnull', False)), fields=('order', 'source_video'), name='ordered_video_source_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='coursevideoforordereduser',
+            constraint=models.UniqueConstraint(condition=models.Q(('source_video__isnull', True)), fields=('order', 'title', 'video_order'), name='ordered_video_copy_uniq'),
+        ),
+    ]
@@ -1,12 +1,21 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
+from django.urls import reverse
+from django.utils import timezone
 from django.core.exceptions import ValidationError
 from datetime import timedelta
 from apps.accounts.models import CustomUser
+from apps.courses import signed_media
+from apps.order import segments
+from apps.jobs.mail import new_template_email, queue_emails
+from apps.jobs.queue import enqueue_on_commit
 from apps.courses.models import Courses, CourseChapter, CourseChapterVideo, CourseChapterMaterials
 
 
 class CourseOrder(models.Model):
     """Model for course orders"""
+    STATS_FIELDS = ('course_id',)
+
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, verbose_name="Пользователь", null=True, blank=True)
     course = models.ForeignKey(Courses, on_delete=models.CASCADE, verbose_name="Курс")
     sender = models.EmailField(verbose_name="Email отправителя", null=True, blank=True)
@@ -20,29 +29,297 @@ class CourseOrder(models.Model):
         verbose_name_plural = "1. Заказы курсов"
         ordering = ['-order_date']
         unique_together = ['sender', 'course']  # One order per email per course
+        indexes = [
+            # "My courses" and access checks read active orders of a user, newest first
+            models.Index(fields=['user', '-order_date'], condition=models.Q(is_active=True), name='order_user_active_idx'),
+        ]
     
     def __str__(self):
         user_email = self.user.email if self.user else self.sender
         return f"{user_email} - {self.course.name}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored state so re-saving an active order does not activate it again
+        instance._loaded_is_active = instance.__dict__.get('is_active')
+        instance._loaded_user_id = instance.__dict__.get('user_id')
+        # and what the course statistics count, a save then applies the difference
+        instance._loaded_stats = tuple(instance.__dict__.get(field) for field in cls.STATS_FIELDS)
+        return instance
+
+    def needs_activation(self):
+        """Active but not processed yet: just activated, or still waiting for its user to register"""
+        if not self.is_active:
+            return False
+        return not getattr(self, '_loaded_is_active', False) or (self.user_id is None and bool(self.sender))
+
+    @classmethod
+    def activate_orders(cls, orders):
+        """Activate orders with set-based updates, return the orders that got a user assigned.
+
+        Users are resolved by sender email in one query and assigned with one UPDATE,
+        the three content tables are opened with one UPDATE each, and the activation
+        emails of newly assigned users are spooled with one INSERT.
+        """
+        orders = list(orders)
+        if not orders:
+            return []
+        order_ids = [order.id for order in orders]
+
+        with transaction.atomic():
+            cls.objects.filter(id__in=order_ids, is_active=False).update(is_active=True)
+
+            unassigned = [order for order in orders if order.user_id is None and order.sender]
+            users = {
+                user.email: user
+                for user in CustomUser.objects.filter(email__in={order.sender for order in unassigned})
+            }
+            assigned = [order for order in unassigned if order.sender in users]
+            if assigned:
+                cls.objects.filter(id__in=[order.id for order in assigned]).update(user=models.Case(
+                    *[models.When(id=order.id, then=users[order.sender].id) for order in assigned],
+                ))
+
+            cls.set_content_access(order_ids, True)
+
+            for order in orders:
+                order.is_active = order._loaded_is_active = True
+                if order.user_id is None and order.sender in users:
+                    order.user = users[order.sender]
+                order._loaded_user_id = order.user_id
+            OrderProgress.refresh_for_orders(orders)
+
+            queue_emails(
+                new_template_email('order_activated', {
+                    'first_name': order.user.first_name,
+                    'last_name': order.user.last_name,
+                    'email': order.user.email,
+                    'course_name': order.course.name,
+                    'course_url': settings.SITE_URL + reverse('courses:ordered_course_detail', args=[order.id]),
+                }, [order.user.email], idempotency_key=f'order:{order.id}:activated-email')
+                for order in assigned
+            )
+
+        for order in unassigned:
+            if order.sender not in users:
+                print(f"User with email {order.sender} not found")
+        return assigned
+
+    @staticmethod
+    def set_content_access(order_ids, accessible):
+        """Flip is_accessible of the ordered content on activation changes, one UPDATE per table.
+
+        Pages and progress derive access from CourseOrder.is_active; the flags only
+        mirror it for the admin and are never written on the read path.
+        """
+        for model in (CourseChapterForOrderedUser, CourseVideoForOrderedUser, CourseMaterialForOrderedUser):
+            model.objects.filter(order_id__in=order_ids, is_accessible=not accessible).update(is_accessible=accessible)
+
     def activate_access(self):
         """Activate access for all course content"""
-        self.is_active = True
-        self.save()
-        
-        # Update all related content
-        self.coursechapterforordereduser_set.update(is_accessible=True)
-        self.coursevideoforordereduser_set.update(is_accessible=True)
-        self.coursematerialforordereduser_set.update(is_accessible=True)
-        
+        self.activate_orders([self])
         print(f"Activated access for order {self.id} - all content is now accessible")
 
+    def materialize_content(self):
+        """Copy the active course tree into the per-order tables with one insert per table.
+
+        Rows are matched to the course rows by their source reference (copies made before
+        the references existed by title + position), so running it again for the same order
+        only adds what is missing.
+        """
+        chapters = list(
+            CourseChapter.objects.filter(course_id=self.course_id, is_activate=True).order_by('order').prefetch_related(
+                models.Prefetch('coursechaptervideo_set', queryset=CourseChapterVideo.objects.filter(is_activate=True).order_by('order')),
+                models.Prefetch('coursechaptermaterials_set', queryset=CourseChapterMaterials.objects.filter(is_activate=True).order_by('order')),
+            )
+        )
+
+        with transaction.atomic():
+            ordered_chapters = {}
+            copied_chapters = {}
+            for chapter in self.coursechapterforordereduser_set.all():
+                if chapter.source_chapter_id:
+                    ordered_chapters[chapter.source_chapter_id] = chapter
+                else:
+                    copied_chapters[(chapter.title, chapter.chapter_order)] = chapter
+            # Source ids and (title, position) of copies without a source
+            video_rows, video_keys = self.get_ordered_rows(self.coursevideoforordereduser_set, 'source_video_id', 'video_order')
+            material_rows, material_keys = self.get_ordered_rows(
+                self.coursematerialforordereduser_set, 'source_material_id', 'material_order',
+            )
+
+            new_chapters = []
+            for chapter in chapters:
+                if chapter.id in ordered_chapters:
+                    continue
+                ordered_chapters[chapter.id] = copied_chapters.get((chapter.title, chapter.order))
+                if ordered_chapters[chapter.id] is None:
+                    ordered_chapters[chapter.id] = CourseChapterForOrderedUser(
+                        order=self,
+                        source_chapter=chapter,
+                        title=chapter.title,
+                        chapter_order=chapter.order,
+                        description=chapter.description,
+                        is_activate=chapter.is_activate,
+                        is_accessible=self.is_active,  # No access until admin activates
+                    )
+                    new_chapters.append(ordered_chapters[chapter.id])
+            CourseChapterForOrderedUser.objects.bulk_create(new_chapters)
+
+            new_videos = []
+            new_materials = []
+            for chapter in chapters:
+                ordered_chapter = ordered_chapters[chapter.id]
+                for video in chapter.coursechaptervideo_set.all():
+                    if video.id in video_rows or (video.title, video.order) in video_keys:
+                        continue
+                    new_videos.append(CourseVideoForOrderedUser(
+                        order=self,
+                        chapter=ordered_chapter,
+                        source_video=video,
+                        title=video.title,
+                        video_order=video.order,
+                        description=video.description,
+                        video_file=video.video_file,
+                        video_time=video.video_time,
+                        is_activate=video.is_activate,
+                        is_free=video.is_free,
+                        is_accessible=self.is_active,
+                    ))
+                for material in chapter.coursechaptermaterials_set.all():
+                    if material.id in material_rows or (material.title, material.order) in material_keys:
+                        continue
+                    new_materials.append(CourseMaterialForOrderedUser(
+                        order=self,
+                        chapter=ordered_chapter,
+                        source_material=material,
+                        title=material.title,
+                        material_order=material.order,
+                        description=material.description,
+                        material_type=material.material_type,
+                        image_file=material.image_file,
+                        document_file=material.document_file,
+                        is_activate=material.is_activate,
+                        is_free=material.is_free,
+                        is_accessible=self.is_active,
+                    ))
+            CourseVideoForOrderedUser.objects.bulk_create(new_videos)
+            CourseMaterialForOrderedUser.objects.bulk_create(new_materials)
+
+        if new_videos:
+            OrderProgress.refresh_for_orders([self])
+        return len(new_chapters), len(new_videos), len(new_materials)
+
+    @staticmethod
+    def get_ordered_rows(queryset, source_field, position_field):
+        sources = set()
+        keys = set()
+        for source_id, title, position in queryset.values_list(source_field, 'title', position_field):
+            if source_id:
+                sources.add(source_id)
+            else:
+                keys.add((title, position))
+        return sources, keys
+
+    def schedule_materialize_content(self):
+        """Materialize content now, or in a background job once the order is committed"""
+        if not getattr(settings, 'ORDER_CONTENT_MATERIALIZE_ASYNC', False):
+            return self.materialize_content()
+        enqueue_on_commit(
+            'order.materialize_content', {'order_id': self.id}, idempotency_key=f'order:{self.id}:materialize'
+        )
+
+    def build_outline(self, user):
+        """Load the ordered course tree with the user's progress and compute gating in memory.
+
+        Runs a fixed number of queries regardless of the chapter count: chapters,
+        their videos and materials (ordered prefetches), video progress (watched
+        flags and resume positions) and completed chapters of this order.
+
+        Access is derived from CourseOrder.is_active, never from the stored
+        is_accessible flags. Signed media links (file_url, hls_url, poster_url)
+        are only issued for open lessons of an active order; materials of an open
+        chapter get theirs before the first watch, for the page to reveal.
+        """
+        chapters = list(
+            self.coursechapterforordereduser_set.select_related('source_chapter').order_by('chapter_order').prefetch_related(
+                models.Prefetch(
+                    'coursevideoforordereduser_set',
+                    queryset=CourseVideoForOrderedUser.objects.select_related('source_video__transcode').order_by('video_order'),
+                ),
+                models.Prefetch(
+                    'coursematerialforordereduser_set',
+                    queryset=CourseMaterialForOrderedUser.objects.select_related('source_material').order_by('material_order'),
+                ),
+            )
+        )
+        video_progress = {
+            video_id: (is_watched, last_position)
+            for video_id, is_watched, last_position in UserVideoProgress.objects.filter(
+                user=user, video__order=self,
+            ).values_list('video_id', 'is_watched', 'last_position')
+        }
+        completed_chapter_ids = set(
+            UserChapterProgress.objects.filter(user=user, chapter__order=self, is_completed=True).values_list('chapter_id', flat=True)
+        )
+
+        total_lessons = 0
+        total_duration_seconds = 0
+        previous_chapter = None
+        for chapter in chapters:
+            chapter.inherit_from_source()
+
+            # Nothing is open before activation; then chapters unlock one by one once the previous one is completed
+            chapter.is_accessible = self.is_active and (
+                previous_chapter is None or previous_chapter.id in completed_chapter_ids
+            )
+
+            # Videos unlock one by one once the previous video is watched
+            videos = chapter.coursevideoforordereduser_set.all()
+            previous_watched = True
+            for video in videos:
+                video.inherit_from_source()
+                video.is_watched, video.resume_position = video_progress.get(video.id, (False, 0))
+                video.is_accessible = chapter.is_accessible and previous_watched
+                previous_watched = video.is_watched
+                video.file_url = video.get_file_url() if video.is_accessible else None
+                video.hls_url = video.get_hls_url() if video.is_accessible else None
+                video.poster_url = video.get_poster_url() if video.is_accessible else None
+                total_duration_seconds += video.video_time.total_seconds()
+
+            watched_count = sum(1 for video in videos if video.is_watched)
+            chapter.is_completed = len(videos) > 0 and watched_count == len(videos)
+
+            # Materials open once at least one video of the chapter is watched
+            materials = chapter.coursematerialforordereduser_set.all()
+            for material in materials:
+                material.inherit_from_source()
+                material.is_accessible = chapter.is_accessible and watched_count > 0
+                # Locked materials of an open chapter keep a hidden link the page reveals after the first watch
+                material.file_url = material.get_file_url() if chapter.is_accessible else None
+
+            total_lessons += len(videos) + len(materials)
+            previous_chapter = chapter
+
+        return {
+            'chapters': chapters,
+            'total_lessons': total_lessons,
+            'total_duration_hours': int(total_duration_seconds // 3600),
+            'total_duration_minutes': int((total_duration_seconds % 3600) // 60),
+            'all_chapters_completed': all(chapter.is_completed for chapter in chapters),
+        }
+
 
 class CourseChapterForOrderedUser(models.Model):
     """Model for course chapters available to ordered users - with copied fields"""
     order = models.ForeignKey(CourseOrder, on_delete=models.CASCADE, verbose_name="Заказ")
+    source_chapter = models.ForeignKey(
+        CourseChapter, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='ordered_copies', verbose_name="Исходная глава"
+    )
     
-    # Copied fields from CourseChapter
+    # Copied fields from CourseChapter (empty values are read from the source chapter)
     title = models.CharField(max_length=200, verbose_name="Название главы")
     description = models.TextField(blank=True, null=True, verbose_name="Описание главы")
     is_activate = models.BooleanField(default=True, verbose_name="Активна")
@@ -56,23 +333,42 @@ class CourseChapterForOrderedUser(models.Model):
         verbose_name = "Глава для заказанного пользователя"
         verbose_name_plural = "2. Главы для заказанных пользователей"
         ordering = ['chapter_order']
-        unique_together = ['order', 'title', 'chapter_order']  # One record per order per chapter title and order
+        constraints = [
+            # One record per order per course chapter; copies without a source by title and position
+            models.UniqueConstraint(
+                fields=['order', 'source_chapter'], condition=models.Q(source_chapter__isnull=False), name='ordered_chapter_source_uniq',
+            ),
+            models.UniqueConstraint(
+                fields=['order', 'title', 'chapter_order'], condition=models.Q(source_chapter__isnull=True), name='ordered_chapter_copy_uniq',
+            ),
+        ]
     
     def __str__(self):
         user_email = self.order.user.email if self.order.user else self.order.sender
         return f"{user_email} - {self.title}"
 
+    def inherit_from_source(self):
+        """Fill empty copied fields in memory from the source chapter"""
+        source = self.source_chapter if self.source_chapter_id else None
+        if source and not self.description:
+            self.description = source.description
+        return self
+
 
 class CourseVideoForOrderedUser(models.Model):
     """Model for course videos available to ordered users - with copied fields"""
     order = models.ForeignKey(CourseOrder, on_delete=models.CASCADE, verbose_name="Заказ")
     chapter = models.ForeignKey(CourseChapterForOrderedUser, on_delete=models.CASCADE, verbose_name="Глава", null=True, blank=True)
+    source_video = models.ForeignKey(
+        CourseChapterVideo, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='ordered_copies', verbose_name="Исходное видео"
+    )
     
-    # Copied fields from CourseChapterVideo
+    # Copied fields from CourseChapterVideo (empty values are read from the source video)
     title = models.CharField(max_length=200, verbose_name="Название видео")
     description = models.TextField(blank=True, null=True, verbose_name="Описание видео")
-    video_file = models.FileField(upload_to='course_videos/ordered/', verbose_name="Видео файл")
-    video_time = models.DurationField(default=timedelta(hours=0, minutes=0), verbose_name="Длительность видео")
+    video_file = models.FileField(upload_to='course_videos/ordered/', blank=True, verbose_name="Видео файл")
+    video_time = models.DurationField(default=timedelta(hours=0, minutes=0), null=True, blank=True, verbose_name="Длительность видео")
     is_activate = models.BooleanField(default=True, verbose_name="Активен")
     is_free = models.BooleanField(default=False, verbose_name="Бесплатный материал")
     video_order = models.PositiveIntegerField(default=0, verbose_name="Порядок видео")
@@ -85,17 +381,57 @@ class CourseVideoForOrderedUser(models.Model):
         verbose_name = "Видео для заказанного пользователя"
         verbose_name_plural = "3. Видео для заказанных пользователей"
         ordering = ['video_order']
-        unique_together = ['order', 'title', 'video_order']  # One record per order per video title and order
+        constraints = [
+            # One record per order per course video; copies without a source by title and position
+            models.UniqueConstraint(
+                fields=['order', 'source_video'], condition=models.Q(source_video__isnull=False), name='ordered_video_source_uniq',
+            ),
+            models.UniqueConstraint(
+                fields=['order', 'title', 'video_order'], condition=models.Q(source_video__isnull=True), name='ordered_video_copy_uniq',
+            ),
+        ]
     
     def __str__(self):
         user_email = self.order.user.email if self.order.user else self.order.sender
         return f"{user_email} - {self.title}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the order so moving the video refreshes the progress of both orders
+        instance._loaded_order_id = instance.__dict__.get('order_id')
+        return instance
     
+    def inherit_from_source(self):
+        """Fill empty copied fields in memory from the source video"""
+        source = self.source_video if self.source_video_id else None
+        if source:
+            if not self.description:
+                self.description = source.description
+            if not self.video_file:
+                self.video_file = source.video_file
+            if not self.video_time:
+                self.video_time = source.video_time
+        if self.video_time is None:
+            self.video_time = timedelta(0)
+        return self
+
     def get_file_url(self):
-        """Get the video file URL if available"""
-        if self.video_file:
-            return self.video_file.url
-        return None
+        """Get a short-lived signed URL of the video file if available"""
+        video_file = self.video_file or (self.source_video.video_file if self.source_video_id else None)
+        return signed_media.media_url(video_file)
+
+    def plays_source_file(self):
+        """Whether this copy still plays the file of its source video (and can use its renditions)"""
+        if not self.source_video_id:
+            return False
+        return not self.video_file or self.video_file.name == self.source_video.video_file.name
+
+    def get_hls_url(self):
+        return self.source_video.get_hls_url() if self.plays_source_file() else None
+
+    def get_poster_url(self):
+        return self.source_video.get_poster_url() if self.plays_source_file() else None
 
 
 class CourseMaterialForOrderedUser(models.Model):
@@ -107,8 +443,12 @@ class CourseMaterialForOrderedUser(models.Model):
     
     order = models.ForeignKey(CourseOrder, on_delete=models.CASCADE, verbose_name="Заказ")
     chapter = models.ForeignKey(CourseChapterForOrderedUser, on_delete=models.CASCADE, verbose_name="Глава", null=True, blank=True)
+    source_material = models.ForeignKey(
+        CourseChapterMaterials, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='ordered_copies', verbose_name="Исходный материал"
+    )
     
-    # Copied fields from CourseChapterMaterials
+    # Copied fields from CourseChapterMaterials (empty values are read from the source material)
     title = models.CharField(max_length=200, verbose_name="Название материала")
     description = models.TextField(blank=True, null=True, verbose_name="Описание материала")
     material_type = models.CharField(
@@ -141,7 +481,15 @@ class CourseMaterialForOrderedUser(models.Model):
         verbose_name = "Материал для заказанного пользователя"
         verbose_name_plural = "4. Материалы для заказанных пользователей"
         ordering = ['material_order']
-        unique_together = ['order', 'title', 'material_order']  # One record per order per material title and order
+        constraints = [
+            # One record per order per course material; copies without a source by title and position
+            models.UniqueConstraint(
+                fields=['order', 'source_material'], condition=models.Q(source_material__isnull=False), name='ordered_material_source_uniq',
+            ),
+            models.UniqueConstraint(
+                fields=['order', 'title', 'material_order'], condition=models.Q(source_material__isnull=True), name='ordered_material_copy_uniq',
+            ),
+        ]
     
     def __str__(self):
         user_email = self.order.user.email if self.order.user else self.order.sender
@@ -151,8 +499,13 @@ class CourseMaterialForOrderedUser(models.Model):
         """Validate that appropriate fields are filled based on material type"""
         super().clean()
         
+        # Files inherited from the source material count as filled
+        source = self.source_material if self.source_material_id else None
+        document_file = self.document_file or (source.document_file if source else None)
+        image_file = self.image_file or (source.image_file if source else None)
+        
         if self.material_type == 'document':
-            if not self.document_file:
+            if not document_file:
                 raise ValidationError({
                     'document_file': 'Документ обязателен для типа материала "Документ"'
                 })
@@ -161,7 +514,7 @@ class CourseMaterialForOrderedUser(models.Model):
                     'image_file': 'Изображение не должно быть заполнено для типа материала "Документ"'
                 })
         elif self.material_type == 'image':
-            if not self.image_file:
+            if not image_file:
                 raise ValidationError({
                     'image_file': 'Изображение обязательно для типа материала "Изображение"'
                 })
@@ -170,12 +523,25 @@ class CourseMaterialForOrderedUser(models.Model):
                     'document_file': 'Документ не должен быть заполнен для типа материала "Изображение"'
                 })
 
+    def inherit_from_source(self):
+        """Fill empty copied fields in memory from the source material"""
+        source = self.source_material if self.source_material_id else None
+        if source:
+            if not self.description:
+                self.description = source.description
+            if not self.image_file:
+                self.image_file = source.image_file
+            if not self.document_file:
+                self.document_file = source.document_file
+        return self
+
     def get_file_url(self):
         """Get the appropriate file URL based on material type"""
+        self.inherit_from_source()
         if self.material_type == 'document' and self.document_file:
-            return self.document_file.url
+            return signed_media.media_url(self.document_file)
         elif self.material_type == 'image' and self.image_file:
-            return self.image_file.url
+            return signed_media.media_url(self.image_file)
         return None
 
 
@@ -186,6 +552,11 @@ class UserVideoProgress(models.Model):
     is_watched = models.BooleanField(default=False, verbose_name="Просмотрено")
     watched_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата просмотра")
     watch_duration = models.DurationField(default=timedelta(seconds=0), verbose_name="Время просмотра")
+    # Written in bulk from buffered player heartbeats (apps/order/telemetry.py)
+    last_position = models.PositiveIntegerField(default=0, verbose_name="Позиция для продолжения, с")
+    position_updated_at = models.DateTimeField(null=True, blank=True, verbose_name="Позиция обновлена")
+    # One bit per VIDEO_SEGMENT_SECONDS bucket played (apps/order/segments.py)
+    watched_segments = models.BinaryField(default=b'', blank=True, verbose_name="Просмотренные отрезки")
     
     class Meta:
         verbose_name = "Прогресс просмотра видео"
@@ -195,6 +566,30 @@ class UserVideoProgress(models.Model):
     def __str__(self):
         return f"{self.user.email} - {self.video.title} - {'Просмотрено' if self.is_watched else 'Не просмотрено'}"
 
+    @classmethod
+    def mark_watched(cls, user, video):
+        """Mark a video of the user's order as watched, return True when the state changed.
+
+        Repeats are a single read. The first watch is one INSERT ... ON CONFLICT DO UPDATE
+        followed by incremental updates of the chapter completion and the order snapshot
+        in the same transaction; bulk_create skips the post_save full progress refresh.
+        """
+        if cls.objects.filter(user=user, video=video, is_watched=True).exists():
+            return False
+
+        now = timezone.now()
+        with transaction.atomic():
+            cls.objects.bulk_create(
+                [cls(user=user, video=video, is_watched=True, watched_at=now)],
+                update_conflicts=True,
+                unique_fields=['user', 'video'],
+                update_fields=['is_watched', 'watched_at'],
+            )
+            if video.chapter_id:
+                UserChapterProgress.complete_if_watched(user, video.chapter_id, now)
+            OrderProgress.record_watched(video.order, now)
+        return True
+
 
 class UserChapterProgress(models.Model):
     """Model to track user's chapter completion progress"""
@@ -209,4 +604,319 @@ class UserChapterProgress(models.Model):
         unique_together = ['user', 'chapter']  # One progress record per user per chapter
     
     def __str__(self):
-        return f"{self.user.email} - {self.chapter.title} - {'Завершена' if self.is_completed else 'В процессе'}"
\ No newline at end of file
+        return f"{self.user.email} - {self.chapter.title} - {'Завершена' if self.is_completed else 'В процессе'}"
+
+    @classmethod
+    def complete_if_watched(cls, user, chapter_id, now):
+        """Upsert the chapter as completed once all its videos are watched"""
+        total = CourseVideoForOrderedUser.objects.filter(chapter_id=chapter_id).count()
+        watched = UserVideoProgress.objects.filter(user=user, video__chapter_id=chapter_id, is_watched=True).count()
+        if not total or watched < total:
+            return False
+        cls.objects.bulk_create(
+            [cls(user=user, chapter_id=chapter_id, is_completed=True, completed_at=now)],
+            update_conflicts=True,
+            unique_fields=['user', 'chapter'],
+            update_fields=['is_completed', 'completed_at'],
+        )
+        return True
+
+
+class OrderProgress(models.Model):
+    """Persisted progress snapshot for a course order"""
+    order = models.OneToOneField(CourseOrder, on_delete=models.CASCADE, related_name='progress', verbose_name="Заказ")
+    watched_videos = models.PositiveIntegerField(default=0, verbose_name="Просмотрено видео")
+    total_videos = models.PositiveIntegerField(default=0, verbose_name="Всего видео")
+    has_quiz = models.BooleanField(default=False, verbose_name="Есть тест")
+    quiz_passed = models.BooleanField(default=False, verbose_name="Тест пройден")
+    percentage = models.FloatField(default=0.0, verbose_name="Процент прохождения")
+    last_activity_at = models.DateTimeField(null=True, blank=True, verbose_name="Последняя активность")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
+
+    class Meta:
+        verbose_name = "Прогресс по заказу"
+        verbose_name_plural = "7. Прогресс по заказам"
+
+    def __str__(self):
+        return f"{self.order} - {self.percentage}%"
+
+    @property
+    def is_completed(self):
+        return self.percentage >= 100
+
+    @staticmethod
+    def calculate_percentage(watched_videos, total_videos, has_quiz, quiz_passed):
+        """Progress percentage: videos count up to 90% while the course quiz is not passed"""
+        if total_videos <= 0:
+            return 0
+        video_progress = watched_videos / total_videos * 100
+        if has_quiz:
+            progress_percentage = 100 if quiz_passed else min(90, video_progress)
+        else:
+            progress_percentage = video_progress
+        return round(max(0, min(100, progress_percentage)), 1)
+
+    @classmethod
+    def build_for_orders(cls, orders):
+        """Compute unsaved snapshots for the given orders with a fixed number of queries"""
+        from apps.courses.models import CourseQuiz, QuizAttempt
+
+        orders = list(orders)
+        if not orders:
+            return []
+        # Content of an order is accessible exactly while the order is active
+        order_ids = [order.id for order in orders if order.is_active]
+
+        total_map = dict(
+            CourseVideoForOrderedUser.objects.filter(order_id__in=order_ids)
+            .values('order_id').annotate(total=models.Count('id')).values_list('order_id', 'total')
+        )
+        watched_rows = (
+            UserVideoProgress.objects.filter(
+                video__order_id__in=order_ids,
+                is_watched=True,
+                user_id=models.F('video__order__user_id'),
+            )
+            .values('video__order_id')
+            .annotate(watched=models.Count('id'), last_watched=models.Max('watched_at'))
+        )
+        watched_map = {row['video__order_id']: row for row in watched_rows}
+
+        # One active quiz per course; the latest attempt decides whether it is passed
+        quiz_map = {}
+        for quiz in CourseQuiz.objects.filter(course_id__in={order.course_id for order in orders}, is_active=True):
+            quiz_map.setdefault(quiz.course_id, quiz)
+        attempt_map = {}
+        attempts = QuizAttempt.objects.filter(
+            quiz__in=quiz_map.values(),
+            user_id__in={order.user_id for order in orders if order.user_id},
+        ).order_by('user_id', 'quiz_id', '-started_at')
+        for attempt in attempts:
+            attempt_map.setdefault((attempt.user_id, attempt.quiz_id), attempt)
+
+        snapshots = []
+        for order in orders:
+            quiz = quiz_map.get(order.course_id)
+            attempt = attempt_map.get((order.user_id, quiz.id)) if quiz and order.user_id else None
+            watched = watched_map.get(order.id, {})
+            watched_videos = watched.get('watched', 0)
+            total_videos = total_map.get(order.id, 0)
+            quiz_passed = bool(attempt and attempt.is_passed)
+
+            activity = [watched.get('last_watched')]
+            if attempt:
+                activity.extend([attempt.started_at, attempt.completed_at])
+            activity = [moment for moment in activity if moment]
+
+            snapshots.append(cls(
+                order=order,
+                watched_videos=watched_videos,
+                total_videos=total_videos,
+                has_quiz=quiz is not None,
+                quiz_passed=quiz_passed,
+                percentage=cls.calculate_percentage(watched_videos, total_videos, quiz is not None, quiz_passed),
+                last_activity_at=max(activity) if activity else None,
+            ))
+        return snapshots
+
+    @classmethod
+    def refresh_for_orders(cls, orders, touch=False):
+        """Recompute and persist snapshots for the given orders in a single transaction"""
+        snapshots = cls.build_for_orders(orders)
+        if not snapshots:
+            return []
+        if touch:
+            now = timezone.now()
+            for snapshot in snapshots:
+                snapshot.last_activity_at = now
+        with transaction.atomic():
+            cls.objects.bulk_create(
+                snapshots,
+                update_conflicts=True,
+                unique_fields=['order'],
+                update_fields=[
+                    'watched_videos', 'total_videos', 'has_quiz', 'quiz_passed',
+                    'percentage', 'last_activity_at', 'updated_at',
+                ],
+            )
+        return snapshots
+
+    @classmethod
+    def get_for_order(cls, order):
+        """Return the stored snapshot for the order, building it on first access"""
+        try:
+            return order.progress
+        except cls.DoesNotExist:
+            snapshot = cls.refresh_for_orders([order])[0]
+            order.progress = snapshot
+            return snapshot
+
+    @classmethod
+    def record_watched(cls, order, now):
+        """Update the snapshot after a newly watched video without rebuilding it.
+
+        Only the watched count is re-read (an indexed count, exact under concurrent
+        requests); totals and quiz state are kept from the stored snapshot.
+        """
+        try:
+            snapshot = order.progress
+        except cls.DoesNotExist:
+            order.progress = cls.refresh_for_orders([order], touch=True)[0]
+            return order.progress
+        snapshot.watched_videos = UserVideoProgress.objects.filter(
+            user_id=order.user_id, video__order=order, is_watched=True,
+        ).count() if order.is_active else 0
+        snapshot.percentage = cls.calculate_percentage(
+            snapshot.watched_videos, snapshot.total_videos, snapshot.has_quiz, snapshot.quiz_passed,
+        )
+        snapshot.last_activity_at = now
+        snapshot.save(update_fields=['watched_videos', 'percentage', 'last_activity_at', 'updated_at'])
+        return snapshot
+
+    @classmethod
+    def get_or_build_for(cls, order_ids):
+        """Stored snapshots of the orders for an incremental update; missing ones are built in full instead"""
+        snapshots = list(cls.objects.filter(order_id__in=order_ids).select_related('order'))
+        missing = set(order_ids) - {snapshot.order_id for snapshot in snapshots}
+        if missing:
+            cls.refresh_for_orders(CourseOrder.objects.filter(id__in=missing), touch=True)
+        return snapshots
+
+    @classmethod
+    def save_incremental(cls, snapshots, now, fields):
+        for snapshot in snapshots:
+            snapshot.percentage = cls.calculate_percentage(
+                snapshot.watched_videos, snapshot.total_videos, snapshot.has_quiz, snapshot.quiz_passed,
+            )
+            snapshot.last_activity_at = snapshot.updated_at = now
+        cls.objects.bulk_update(snapshots, [*fields, 'percentage', 'last_activity_at', 'updated_at'])
+
+    @classmethod
+    def record_video_change(cls, order_ids, now=None):
+        """Update snapshots after UserVideoProgress rows of the orders changed.
+
+        Only the watched counts are re-read (one grouped, indexed count); totals and
+        quiz state are kept from the stored snapshots.
+        """
+        now = now or timezone.now()
+        snapshots = cls.get_or_build_for(order_ids)
+        if not snapshots:
+            return []
+        watched_map = dict(
+            UserVideoProgress.objects.filter(
+                video__order_id__in=[snapshot.order_id for snapshot in snapshots if snapshot.order.is_active],
+                is_watched=True,
+                user_id=models.F('video__order__user_id'),
+            ).values('video__order_id').annotate(watched=models.Count('id')).values_list('video__order_id', 'watched')
+        )
+        for snapshot in snapshots:
+            snapshot.watched_videos = watched_map.get(snapshot.order_id, 0)
+        cls.save_incremental(snapshots, now, ['watched_videos'])
+        return snapshots
+
+    @classmethod
+    def record_quiz_change(cls, order_ids, user_id, quiz_id, now=None):
+        """Update snapshots after a QuizAttempt of the user changed.
+
+        Only the latest attempt for the quiz is re-read; watched counts and totals are
+        kept. Orders whose course is graded by another quiz only get their activity touched.
+        """
+        from apps.courses.models import CourseQuiz, QuizAttempt
+
+        now = now or timezone.now()
+        snapshots = cls.get_or_build_for(order_ids)
+        if not snapshots:
+            return []
+        # Same choice as build_for_orders: the first active quiz of the course
+        quiz_map = {}
+        for quiz in CourseQuiz.objects.filter(course_id__in={snapshot.order.course_id for snapshot in snapshots}, is_active=True):
+            quiz_map.setdefault(quiz.course_id, quiz)
+        passed = QuizAttempt.objects.filter(user_id=user_id, quiz_id=quiz_id).order_by('-started_at').values_list(
+            'is_passed', flat=True,
+        ).first()
+        for snapshot in snapshots:
+            quiz = quiz_map.get(snapshot.order.course_id)
+            if quiz is not None and quiz.id == quiz_id:
+                snapshot.has_quiz = True
+                snapshot.quiz_passed = bool(passed)
+        cls.save_incremental(snapshots, now, ['has_quiz', 'quiz_passed'])
+        return snapshots
+
+    def differs_from(self, other):
+        """Names of snapshot fields whose values differ from another snapshot"""
+        fields = ['watched_videos', 'total_videos', 'has_quiz', 'quiz_passed', 'percentage']
+        return [field for field in fields if getattr(self, field) != getattr(other, field)]
+
+
+class VideoHeatmap(models.Model):
+    """Viewers per segment of a course video over all its ordered copies, rebuilt nightly (build_video_heatmaps)"""
+    video = models.OneToOneField(CourseChapterVideo, on_delete=models.CASCADE, related_name='heatmap', verbose_name="Видео")
+    segment_seconds = models.PositiveIntegerField(verbose_name="Длина отрезка, с")
+    viewers = models.PositiveIntegerField(default=0, verbose_name="Зрителей")
+    counts = models.JSONField(default=list, blank=True, verbose_name="Зрителей по отрезкам")
+    computed_at = models.DateTimeField(verbose_name="Дата расчета")
+
+    class Meta:
+        verbose_name = "Тепловая карта просмотра"
+        verbose_name_plural = "8. Тепловые карты просмотра"
+
+    def __str__(self):
+        return f"{self.video.title} ({self.viewers})"
+
+    @staticmethod
+    def get_segment_count(video_time):
+        if not video_time:
+            return None
+        return min(-(-int(video_time.total_seconds()) // settings.VIDEO_SEGMENT_SECONDS), segments.get_max_segments()) or None
+
+    @classmethod
+    def rebuild(cls, video_ids=None):
+        """Aggregate the bitmaps of every source video with one pass over the progress rows, return the heatmaps"""
+        videos = CourseChapterVideo.objects.order_by('id')
+        if video_ids is not None:
+            videos = videos.filter(id__in=video_ids)
+        lengths = dict(videos.values_list('id', 'video_time'))
+        if not lengths:
+            return []
+
+        # Rows come sorted by video, so only one video's bitmaps are held at a time
+        rows = UserVideoProgress.objects.filter(
+            video__source_video_id__in=lengths,
+        ).exclude(watched_segments=b'').order_by('video__source_video_id').values_list(
+            'video__source_video_id', 'watched_segments',
+        ).iterator(chunk_size=settings.HEATMAP_BATCH_SIZE)
+
+        now = timezone.now()
+        heatmaps = {}
+
+        def add(video_id, bitmaps):
+            counts = segments.aggregate(bitmaps, cls.get_segment_count(lengths[video_id]))
+            heatmaps[video_id] = cls(
+                video_id=video_id, segment_seconds=settings.VIDEO_SEGMENT_SECONDS,
+                viewers=len(bitmaps), counts=counts.tolist(), computed_at=now,
+            )
+
+        current, bitmaps = None, []
+        for video_id, bitmap in rows:
+            if video_id != current:
+                if bitmaps:
+                    add(current, bitmaps)
+                current, bitmaps = video_id, []
+            bitmaps.append(bitmap)
+        if bitmaps:
+            add(current, bitmaps)
+        for video_id in lengths.keys() - heatmaps.keys():
+            add(video_id, [])
+
+        heatmaps = [heatmaps[video_id] for video_id in lengths]
+        cls.objects.bulk_create(
+            heatmaps,
+            update_conflicts=True,
+            unique_fields=['video'],
+            update_fields=['segment_seconds', 'viewers', 'counts', 'computed_at'],
+        )
+        return heatmaps
+
+    @property
+    def peak(self):
+        return max(self.counts, default=0)
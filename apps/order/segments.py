@@ -0,0 +1,67 @@
+"""Watched-segment bitmaps.
+
+A video is split into VIDEO_SEGMENT_SECONDS buckets and UserVideoProgress keeps one
+bit per bucket (little-endian bit order within a byte: bucket 0 is the lowest bit
+of byte 0). A bucket counts as watched when a played interval covers its middle.
+A 1 hour video takes 90 bytes.
+"""
+import numpy as np
+from django.conf import settings
+
+
+def get_max_segments():
+    return settings.VIDEO_MAX_DURATION // settings.VIDEO_SEGMENT_SECONDS
+
+
+def intervals_to_mask(intervals):
+    """Boolean array of the buckets covered by [start, end] intervals (in seconds)"""
+    if not intervals:
+        return np.zeros(0, dtype=bool)
+    bounds = np.asarray(intervals, dtype=float) / settings.VIDEO_SEGMENT_SECONDS - 0.5
+    # Bucket i is covered when start <= its middle (i + 0.5) < end
+    first = np.clip(np.ceil(bounds[:, 0]), 0, get_max_segments()).astype(np.int64)
+    last = np.clip(np.ceil(bounds[:, 1]), 0, get_max_segments()).astype(np.int64)
+    size = int(last.max())
+    if size == 0:
+        return np.zeros(0, dtype=bool)
+    # Difference array: +1 where an interval opens, -1 where it closes
+    edges = np.zeros(size + 1, dtype=np.int64)
+    np.add.at(edges, first, 1)
+    np.add.at(edges, last, -1)
+    return np.cumsum(edges[:-1]) > 0
+
+
+def to_bits(bitmap):
+    """Unpacked bits of a stored bitmap"""
+    return np.unpackbits(np.frombuffer(bytes(bitmap or b''), dtype=np.uint8), bitorder='little')
+
+
+def merge(bitmap, intervals):
+    """OR played intervals into a stored bitmap, return the new bitmap bytes"""
+    added = np.packbits(intervals_to_mask(intervals), bitorder='little')
+    current = np.frombuffer(bytes(bitmap or b''), dtype=np.uint8)
+    size = max(len(added), len(current))
+    merged = np.zeros(size, dtype=np.uint8)
+    merged[:len(current)] |= current
+    merged[:len(added)] |= added
+    return merged.tobytes()
+
+
+def count_watched(bitmap):
+    return int(to_bits(bitmap).sum())
+
+
+def aggregate(bitmaps, segments=None):
+    """Viewers per bucket over many bitmaps, as an int array of `segments` (or the longest bitmap) entries"""
+    bitmaps = [bytes(bitmap) for bitmap in bitmaps if bitmap]
+    if segments is None:
+        segments = max((len(bitmap) for bitmap in bitmaps), default=0) * 8
+    if not bitmaps or not segments:
+        return np.zeros(segments, dtype=np.int64)
+    width = (segments + 7) // 8
+    matrix = np.zeros((len(bitmaps), width), dtype=np.uint8)
+    for row, bitmap in enumerate(bitmaps):
+        data = np.frombuffer(bitmap[:width], dtype=np.uint8)
+        matrix[row, :len(data)] = data
+    bits = np.unpackbits(matrix, axis=1, bitorder='little')[:, :segments]
+    return bits.sum(axis=0, dtype=np.int64)
@@ -1,72 +1,104 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from django.core.mail import send_mail
-from django.conf import settings
-from .models import CourseOrder
-from apps.accounts.models import CustomUser
+from django.db import transaction
+from .models import CourseOrder, CourseVideoForOrderedUser, OrderProgress, UserVideoProgress
+from apps.courses.models import CourseQuiz, QuizAttempt
+from apps.courses.signals import update_course_stats_for_row
 
 
 @receiver(post_save, sender=CourseOrder)
 def handle_course_order_activation(sender, instance, created, **kwargs):
-    """Handle CourseOrder activation and assign user if sender email matches"""
-    if not created and instance.is_active:
-        # If order is activated and user is not assigned yet
-        if not instance.user and instance.sender:
-            try:
-                # Find user by sender email
-                user = CustomUser.objects.get(email=instance.sender)
-                # Assign user to the order
-                instance.user = user
-                instance.save(update_fields=['user'])
-                
-                # Send email notification to user
-                subject = f'Доступ к курсу "{instance.course.name}" активирован'
-                
-                message = f'''
-Здравствуйте, {user.first_name} {user.last_name}!
-
-Ваш доступ к курсу "{instance.course.name}" был активирован администратором.
-
-Теперь вы можете:
-- Просматривать все материалы курса
-- Смотреть видеоуроки
-- Скачивать дополнительные материалы
-- Отслеживать свой прогресс
-
-Для входа в систему используйте:
-Email: {user.email}
-Пароль: (ваш текущий пароль)
-
-С уважением,
-Команда Profactive
-                '''
-                
-                try:
-                    send_mail(
-                        subject=subject,
-                        message=message,
-                        from_email=settings.EMAIL_HOST_USER,
-                        recipient_list=[user.email],
-                        fail_silently=False,
-                    )
-                except Exception as e:
-                    print(f"Error sending activation email: {e}")
-                    
-            except CustomUser.DoesNotExist:
-                print(f"User with email {instance.sender} not found")
-            except Exception as e:
-                print(f"Error assigning user to order: {e}")
-        
-        # Always update access for all related content when order is activated
+    """Grant access and assign the user by sender email when an order gets activated"""
+    if created:
+        return
+    if instance.needs_activation():
         try:
-            from .models import CourseChapterForOrderedUser, CourseVideoForOrderedUser, CourseMaterialForOrderedUser
-            
-            # Update all related content to be accessible
-            CourseChapterForOrderedUser.objects.filter(order=instance).update(is_accessible=True)
-            CourseVideoForOrderedUser.objects.filter(order=instance).update(is_accessible=True)
-            CourseMaterialForOrderedUser.objects.filter(order=instance).update(is_accessible=True)
-            
-            print(f"Updated access for order {instance.id} - all content is now accessible")
-            
+            # Savepoint: a failure must not break the admin's transaction
+            with transaction.atomic():
+                CourseOrder.activate_orders([instance])
         except Exception as e:
-            print(f"Error updating content access for order {instance.id}: {e}")
\ No newline at end of file
+            print(f"Error activating order {instance.id}: {e}")
+    elif not instance.is_active and getattr(instance, '_loaded_is_active', None):
+        CourseOrder.set_content_access([instance.id], False)
+        OrderProgress.refresh_for_orders([instance])
+    elif (instance.is_active, instance.user_id) != (
+        getattr(instance, '_loaded_is_active', None), getattr(instance, '_loaded_user_id', None)
+    ):
+        # Progress totals depend on activation and the owner, keep the snapshot in sync
+        OrderProgress.refresh_for_orders([instance])
+    instance._loaded_is_active = instance.is_active
+    instance._loaded_user_id = instance.user_id
+
+
+def update_order_progress(update, order_ids, deleted=False):
+    """Update snapshots inside the current transaction, or after commit for deletions"""
+    order_ids = list(order_ids)
+    if not order_ids:
+        return
+    if deleted:
+        # Cascading deletes may be removing the orders themselves, re-read them once committed
+        transaction.on_commit(lambda: update(order_ids))
+    else:
+        update(order_ids)
+
+
+@receiver(post_save, sender=UserVideoProgress)
+@receiver(post_delete, sender=UserVideoProgress)
+def update_order_progress_for_video(sender, instance, **kwargs):
+    """Re-read the watched count of the order the video belongs to"""
+    order_ids = CourseOrder.objects.filter(
+        coursevideoforordereduser__id=instance.video_id,
+        user_id=instance.user_id,
+    ).values_list('id', flat=True)
+    update_order_progress(OrderProgress.record_video_change, order_ids, deleted=kwargs['signal'] is post_delete)
+
+
+@receiver(post_save, sender=QuizAttempt)
+@receiver(post_delete, sender=QuizAttempt)
+def update_order_progress_for_quiz(sender, instance, **kwargs):
+    """Re-read the quiz result for the user's orders of the quiz course"""
+    order_ids = CourseOrder.objects.filter(
+        user_id=instance.user_id,
+        course__coursequiz__id=instance.quiz_id,
+    ).values_list('id', flat=True)
+    update_order_progress(
+        lambda order_ids: OrderProgress.record_quiz_change(order_ids, instance.user_id, instance.quiz_id),
+        order_ids, deleted=kwargs['signal'] is post_delete,
+    )
+
+
+def refresh_order_progress_on_commit(**order_filter):
+    """Rebuild the snapshots of the matching orders once the change is committed"""
+    transaction.on_commit(lambda: OrderProgress.refresh_for_orders(CourseOrder.objects.filter(**order_filter)))
+
+
+@receiver(post_save, sender=CourseQuiz)
+@receiver(post_delete, sender=CourseQuiz)
+def update_order_progress_for_course_quiz(sender, instance, created=False, **kwargs):
+    """A quiz added, removed, moved or (de)activated changes the progress of every order of its course"""
+    loaded = (getattr(instance, '_loaded_course_id', None), getattr(instance, '_loaded_is_active', None))
+    current = (instance.course_id, instance.is_active)
+    instance._loaded_course_id, instance._loaded_is_active = current
+    if not created and kwargs['signal'] is post_save and loaded == current:
+        return
+    refresh_order_progress_on_commit(course_id__in={course_id for course_id, _ in (loaded, current) if course_id})
+
+
+@receiver(post_save, sender=CourseVideoForOrderedUser)
+@receiver(post_delete, sender=CourseVideoForOrderedUser)
+def update_order_progress_for_ordered_video(sender, instance, created=False, **kwargs):
+    """Videos added to or removed from an order change its total"""
+    loaded_order_id = getattr(instance, '_loaded_order_id', None)
+    instance._loaded_order_id = instance.order_id
+    if not created and kwargs['signal'] is post_save and loaded_order_id == instance.order_id:
+        return
+    refresh_order_progress_on_commit(id__in={order_id for order_id in (loaded_order_id, instance.order_id) if order_id})
+
+
+@receiver(post_save, sender=CourseOrder)
+@receiver(post_delete, sender=CourseOrder)
+def update_course_orders_count(sender, instance, created=False, **kwargs):
+    """Order counts are part of the course statistics"""
+    update_course_stats_for_row(
+        instance, lambda: {'orders_count': 1}, created=created, deleted=kwargs['signal'] is post_delete,
+    )
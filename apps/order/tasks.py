@@ -0,0 +1,11 @@
+from apps.jobs.queue import task
+from .models import CourseOrder
+
+
+@task('order.materialize_content')
+def materialize_content(order_id):
+    """Background entry point for CourseOrder.materialize_content"""
+    order = CourseOrder.objects.filter(id=order_id).first()
+    if order:
+        order.materialize_content()
+
@@ -0,0 +1,236 @@
+"""Buffered playback telemetry.
+
+The player posts batches of heartbeats (`video_telemetry` view): for every video the
+current position and the intervals played since the last batch. `record` merges them
+into an in-process buffer keyed by (user, video): the latest position wins and
+intervals are unioned, so retries and overlapping heartbeats are counted once.
+
+The buffer is written to UserVideoProgress when it holds VIDEO_TELEMETRY_MAX_BUFFER
+entries (checked on every batch), by a timer thread once it is
+VIDEO_TELEMETRY_FLUSH_INTERVAL seconds old (also when the worker gets no further
+requests), and at process exit. A worker killed without running its exit handlers
+(SIGKILL, OOM kill) loses at most the last VIDEO_TELEMETRY_FLUSH_INTERVAL seconds of
+its heartbeats, and resume positions read by other workers lag by as much. Every chunk of FLUSH_CHUNK_SIZE
+entries is written with three statements: an INSERT OR IGNORE of missing progress
+rows, a read of the watched-segment bitmaps to OR the played intervals into (see
+segments.py), and one UPDATE adding watch time, storing the bitmaps and moving the
+resume position. Positions carry the time they were reported, so a late flush
+from another worker process never moves a position back.
+"""
+import atexit
+import math
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.utils import timezone
+
+from . import segments
+
+# Keeps the OR of (user, video) pairs well below SQLite's expression depth limit
+FLUSH_CHUNK_SIZE = 200
+# Largest value a database integer column holds
+MAX_ID = 2 ** 63 - 1
+
+_lock = threading.Lock()
+_buffer = {}
+_buffer_started = None
+_timer = None
+
+
+def merge_intervals(intervals):
+    """Union of [start, end] intervals in seconds, sorted and non-overlapping"""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def get_watched_seconds(intervals):
+    return sum(end - start for start, end in intervals)
+
+
+def to_seconds(value):
+    """Finite number of seconds from a JSON value (json.loads accepts Infinity and NaN)"""
+    value = float(value)
+    if not math.isfinite(value):
+        raise ValueError(f'Not a finite number: {value}')
+    return value
+
+
+def parse_events(events):
+    """Validated heartbeats: [(video_id, position or None, intervals)], malformed entries dropped"""
+    parsed = []
+    for event in events if isinstance(events, list) else []:
+        if not isinstance(event, dict):
+            continue
+        try:
+            video_id = int(event['video_id'])
+            position = event.get('position')
+            if position is not None:
+                position = int(min(max(0.0, to_seconds(position)), settings.VIDEO_MAX_DURATION))
+            intervals = [
+                [max(0.0, to_seconds(start)), to_seconds(end)]
+                for start, end in event.get('intervals') or []
+            ]
+        except (KeyError, TypeError, ValueError, OverflowError):
+            continue
+        if not 0 < video_id <= MAX_ID:
+            continue
+        # A heartbeat batch covers at most a few minutes of playback of a video of bounded length
+        max_length = settings.VIDEO_TELEMETRY_MAX_INTERVAL
+        intervals = [
+            [start, min(end, start + max_length, settings.VIDEO_MAX_DURATION)]
+            for start, end in intervals if start < end and start < settings.VIDEO_MAX_DURATION
+        ]
+        parsed.append((video_id, position, intervals))
+    return parsed
+
+
+def record(user_id, events, now=None):
+    """Merge parsed heartbeats into the buffer, flushing it when due"""
+    global _buffer_started, _timer
+    now = now or timezone.now()
+    with _lock:
+        if _buffer_started is None:
+            _buffer_started = time.monotonic()
+            # Flush an idle buffer too, not only when the next batch arrives
+            _timer = threading.Timer(settings.VIDEO_TELEMETRY_FLUSH_INTERVAL, flush_in_background)
+            _timer.daemon = True
+            _timer.start()
+        for video_id, position, intervals in events:
+            entry = _buffer.setdefault((user_id, video_id), {'position': None, 'position_at': None, 'intervals': []})
+            if position is not None:
+                entry['position'] = position
+                entry['position_at'] = now
+            if intervals:
+                entry['intervals'] = merge_intervals(entry['intervals'] + intervals)
+        due = (
+            len(_buffer) >= settings.VIDEO_TELEMETRY_MAX_BUFFER
+            or time.monotonic() - _buffer_started >= settings.VIDEO_TELEMETRY_FLUSH_INTERVAL
+        )
+    if due:
+        flush()
+
+
+def take_buffer():
+    """Detach the buffered entries so new heartbeats go to a fresh buffer"""
+    global _buffer, _buffer_started, _timer
+    with _lock:
+        entries, _buffer, _buffer_started = _buffer, {}, None
+        if _timer is not None and _timer is not threading.current_thread():
+            _timer.cancel()
+        _timer = None
+    return entries
+
+
+def flush_in_background():
+    """Timer callback: flush the buffer and close the connection of the timer thread"""
+    try:
+        flush()
+    finally:
+        connection.close()
+
+
+def flush():
+    """Write buffered telemetry, return the number of progress rows touched"""
+    from .models import CourseVideoForOrderedUser
+
+    entries = take_buffer()
+    if not entries:
+        return 0
+    try:
+        # Videos deleted since their heartbeats were accepted would fail the whole insert
+        existing = set(CourseVideoForOrderedUser.objects.filter(
+            id__in={video_id for _, video_id in entries},
+        ).values_list('id', flat=True))
+    except Exception as e:
+        # Telemetry is best effort: a failed flush must not fail the player's request
+        print(f"Error flushing video telemetry ({len(entries)} entries): {e}")
+        return 0
+    entries = [(key, entry) for key, entry in entries.items() if key[1] in existing]
+    written = 0
+    for start in range(0, len(entries), FLUSH_CHUNK_SIZE):
+        chunk = entries[start:start + FLUSH_CHUNK_SIZE]
+        try:
+            write_chunk(chunk)
+            written += len(chunk)
+        except Exception as e:
+            print(f"Error flushing video telemetry, retrying {len(chunk)} entries one by one: {e}")
+            # A bad entry only loses its own data, not the rest of the chunk
+            for entry in chunk:
+                try:
+                    write_chunk([entry])
+                    written += 1
+                except Exception as e:
+                    print(f"Error flushing video telemetry of user {entry[0][0]}, video {entry[0][1]}: {e}")
+    return written
+
+
+def pair(user_id, video_id):
+    return models.Q(user_id=user_id, video_id=video_id)
+
+
+def match_any(keys):
+    condition = models.Q()
+    for user_id, video_id in keys:
+        condition |= pair(user_id, video_id)
+    return condition
+
+
+def write_chunk(entries):
+    """INSERT OR IGNORE the missing rows, read the bitmaps to merge, then one UPDATE for the chunk"""
+    from .models import UserVideoProgress
+
+    with transaction.atomic():
+        UserVideoProgress.objects.bulk_create(
+            [UserVideoProgress(user_id=user_id, video_id=video_id) for (user_id, video_id), _ in entries],
+            ignore_conflicts=True,
+        )
+        played = {key: entry['intervals'] for key, entry in entries if entry['intervals']}
+        # Read after the insert: the write lock is held, so no other flush merges in between
+        bitmaps = {
+            (user_id, video_id): segments.merge(bitmap, played[(user_id, video_id)])
+            for user_id, video_id, bitmap in UserVideoProgress.objects.select_for_update().filter(
+                match_any(played),
+            ).values_list('user_id', 'video_id', 'watched_segments')
+        } if played else {}
+
+        updates = {}
+        if played:
+            updates['watch_duration'] = models.F('watch_duration') + models.Case(
+                *[models.When(pair(*key), then=models.Value(timedelta(seconds=get_watched_seconds(intervals))))
+                  for key, intervals in played.items()],
+                default=models.Value(timedelta(0)), output_field=models.DurationField(),
+            )
+            updates['watched_segments'] = models.Case(
+                *[models.When(pair(*key), then=models.Value(bitmap)) for key, bitmap in bitmaps.items()],
+                default=models.F('watched_segments'), output_field=models.BinaryField(),
+            )
+
+        positions = []
+        for key, entry in entries:
+            if entry['position'] is not None:
+                # Only move the position forward in time (flushes of several processes may interleave)
+                newer = models.Q(position_updated_at__isnull=True) | models.Q(position_updated_at__lt=entry['position_at'])
+                positions.append((pair(*key) & newer, entry))
+        if positions:
+            updates['last_position'] = models.Case(
+                *[models.When(condition, then=models.Value(entry['position'])) for condition, entry in positions],
+                default=models.F('last_position'), output_field=models.PositiveIntegerField(),
+            )
+            updates['position_updated_at'] = models.Case(
+                *[models.When(condition, then=models.Value(entry['position_at'])) for condition, entry in positions],
+                default=models.F('position_updated_at'), output_field=models.DateTimeField(),
+            )
+
+        if updates:
+            UserVideoProgress.objects.filter(match_any(key for key, _ in entries)).update(**updates)
+
+
+atexit.register(flush)
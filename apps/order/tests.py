@@ -1,3 +1,722 @@
-from django.test import TestCase
+import importlib
+import threading
+from datetime import timedelta
 
-# Create your tests here.
+from io import StringIO
+from unittest import mock
+
+from django.apps import apps
+from django.conf import settings
+from django.core import mail
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from apps.accounts.models import CustomUser
+from apps.courses.models import (
+    Categories, Courses, CourseChapter, CourseChapterVideo, CourseChapterMaterials, CourseQuiz, QuizAttempt,
+)
+from .models import (
+    CourseOrder,
+    CourseChapterForOrderedUser,
+    CourseVideoForOrderedUser,
+    CourseMaterialForOrderedUser,
+    UserVideoProgress,
+    UserChapterProgress,
+    OrderProgress,
+    VideoHeatmap,
+)
+from apps.jobs.models import Job, OutboundEmail
+from apps.website.models import ReferralRequest
+from . import segments, telemetry
+
+
+class OrderProgressTest(TestCase):
+    """Snapshots follow progress, quiz and activation changes without a full rebuild"""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email='learner@example.com', password='secret')
+        category = Categories.objects.create(name='Категория')
+        course = Courses.objects.create(
+            name='Курс', description='Описание', image='courses/course.jpg', author='Автор', user=self.user, category=category,
+        )
+        self.quiz = CourseQuiz.objects.create(course=course, title='Тест')
+        self.order = CourseOrder.objects.create(user=self.user, course=course, sender=self.user.email)
+        chapter = CourseChapterForOrderedUser.objects.create(order=self.order, title='Глава', chapter_order=0)
+        self.videos = [
+            CourseVideoForOrderedUser.objects.create(
+                order=self.order, chapter=chapter, title=f'Видео {index}', video_file='course_videos/video.mp4', video_order=index,
+            )
+            for index in range(4)
+        ]
+        OrderProgress.refresh_for_orders([self.order])
+
+    def get_progress(self):
+        return OrderProgress.objects.get(order=self.order)
+
+    def assertConsistent(self):
+        output = StringIO()
+        call_command('check_order_progress', stdout=output)
+        self.assertIn('Checked 1 snapshots', output.getvalue())
+
+    def test_watch_and_delete(self):
+        UserVideoProgress.objects.create(user=self.user, video=self.videos[0], is_watched=True)
+        # Insert, order lookup, snapshot, one grouped count and the snapshot update
+        with self.assertNumQueries(5):
+            progress = UserVideoProgress.objects.create(user=self.user, video=self.videos[1], is_watched=True)
+        snapshot = self.get_progress()
+        self.assertEqual((snapshot.watched_videos, snapshot.total_videos, snapshot.percentage), (2, 4, 50))
+        self.assertIsNotNone(snapshot.last_activity_at)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            progress.delete()
+        self.assertEqual((self.get_progress().watched_videos, self.get_progress().percentage), (1, 25))
+        self.assertConsistent()
+
+    def test_quiz_pass(self):
+        for video in self.videos:
+            UserVideoProgress.objects.create(user=self.user, video=video, is_watched=True)
+        # Videos count up to 90% while the quiz is not passed
+        self.assertEqual(self.get_progress().percentage, 90)
+
+        QuizAttempt.objects.create(user=self.user, quiz=self.quiz, is_completed=True, is_passed=True)
+        self.assertEqual((self.get_progress().quiz_passed, self.get_progress().percentage), (True, 100))
+        # The latest attempt decides
+        failed = QuizAttempt.objects.create(user=self.user, quiz=self.quiz, is_completed=True, is_passed=False)
+        self.assertEqual((self.get_progress().quiz_passed, self.get_progress().percentage), (False, 90))
+        with self.captureOnCommitCallbacks(execute=True):
+            failed.delete()
+        self.assertTrue(self.get_progress().quiz_passed)
+        self.assertConsistent()
+
+    def test_deactivation(self):
+        UserVideoProgress.objects.create(user=self.user, video=self.videos[0], is_watched=True)
+        self.order.is_active = False
+        self.order.save()
+        snapshot = self.get_progress()
+        self.assertEqual((snapshot.watched_videos, snapshot.total_videos, snapshot.percentage), (0, 0, 0))
+        # Progress made while inactive does not count
+        UserVideoProgress.objects.create(user=self.user, video=self.videos[1], is_watched=True)
+        self.assertEqual(self.get_progress().watched_videos, 0)
+        self.assertConsistent()
+
+        self.order.is_active = True
+        self.order.save()
+        self.assertEqual(self.get_progress().watched_videos, 2)
+
+    def test_course_quiz_changes(self):
+        for video in self.videos:
+            UserVideoProgress.objects.create(user=self.user, video=video, is_watched=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.quiz.delete()
+        self.assertEqual((self.get_progress().has_quiz, self.get_progress().percentage), (False, 100))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            quiz = CourseQuiz.objects.create(course=self.order.course, title='Новый тест')
+        self.assertEqual((self.get_progress().has_quiz, self.get_progress().percentage), (True, 90))
+
+        quiz = CourseQuiz.objects.get(pk=quiz.pk)
+        quiz.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            quiz.save()
+        self.assertEqual(self.get_progress().percentage, 100)
+        # Edits that do not change the course quiz leave the snapshots alone
+        quiz.title = 'Тест'
+        with self.captureOnCommitCallbacks() as callbacks:
+            quiz.save()
+        self.assertEqual(callbacks, [])
+        self.assertConsistent()
+
+    def test_ordered_video_changes(self):
+        UserVideoProgress.objects.create(user=self.user, video=self.videos[0], is_watched=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            video = CourseVideoForOrderedUser.objects.create(
+                order=self.order, chapter=self.videos[0].chapter, title='Видео 4', video_file='course_videos/video.mp4', video_order=4,
+            )
+        self.assertEqual((self.get_progress().total_videos, self.get_progress().percentage), (5, 20))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            video.delete()
+        self.assertEqual((self.get_progress().total_videos, self.get_progress().percentage), (4, 25))
+        self.assertConsistent()
+
+    def test_missing_snapshot_is_built_and_commands(self):
+        OrderProgress.objects.all().delete()
+        UserVideoProgress.objects.create(user=self.user, video=self.videos[0], is_watched=True)
+        self.assertEqual(self.get_progress().watched_videos, 1)
+
+        OrderProgress.objects.filter(order=self.order).update(watched_videos=3)
+        output = StringIO()
+        call_command('check_order_progress', stdout=output)
+        self.assertIn('watched_videos is 3, expected 1', output.getvalue())
+        call_command('rebuild_order_progress', stdout=output)
+        self.assertEqual(self.get_progress().watched_videos, 1)
+
+
+class OrderedCourseDetailQueriesTest(TestCase):
+    """The learning page must not issue queries per chapter, video or material"""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email='learner@example.com', password='secret', first_name='Иван', last_name='Петров')
+        category = Categories.objects.create(name='Категория')
+        self.course = Courses.objects.create(
+            name='Курс', description='Описание', image='courses/course.jpg', author='Автор',
+            user=self.user, category=category,
+        )
+        self.client.force_login(self.user)
+
+    def create_order(self, chapters_count):
+        order = CourseOrder.objects.create(user=self.user, course=self.course, sender=f'{chapters_count}@example.com')
+        for chapter_index in range(chapters_count):
+            chapter = CourseChapterForOrderedUser.objects.create(order=order, title=f'Глава {chapter_index}', chapter_order=chapter_index)
+            for video_index in range(3):
+                video = CourseVideoForOrderedUser.objects.create(
+                    order=order, chapter=chapter, title=f'Видео {chapter_index}.{video_index}',
+                    video_file='course_videos/video.mp4', video_time=timedelta(minutes=10), video_order=video_index,
+                )
+                if chapter_index == 0:
+                    UserVideoProgress.objects.create(user=self.user, video=video, is_watched=True)
+            CourseMaterialForOrderedUser.objects.create(
+                order=order, chapter=chapter, title=f'Материал {chapter_index}',
+                document_file='course_materials/documents/file.docx', material_order=0,
+            )
+            if chapter_index == 0:
+                UserChapterProgress.objects.create(user=self.user, chapter=chapter, is_completed=True)
+        return order
+
+    def count_page_queries(self, order):
+        url = reverse('courses:ordered_course_detail', args=[order.id])
+        # Warm up once so lazily created rows (progress snapshot) do not skew the count
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries), response
+
+    def test_query_count_does_not_grow_with_chapters(self):
+        small_queries, _ = self.count_page_queries(self.create_order(2))
+        large_queries, response = self.count_page_queries(self.create_order(30))
+        self.assertEqual(small_queries, large_queries)
+
+        chapters = response.context['chapters']
+        self.assertEqual(len(chapters), 30)
+        self.assertEqual(response.context['total_lessons'], 30 * 4)
+        self.assertTrue(chapters[0].is_completed)
+        self.assertTrue(chapters[1].is_accessible)
+        self.assertFalse(chapters[2].is_accessible)
+
+    def test_page_is_a_pure_read(self):
+        order = self.create_order(2)
+        CourseVideoForOrderedUser.objects.filter(order=order).update(is_accessible=False)
+        _, response = self.count_page_queries(order)
+
+        url = reverse('courses:ordered_course_detail', args=[order.id])
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(url)
+        writes = [query['sql'] for query in context.captured_queries if query['sql'].startswith(('UPDATE', 'INSERT', 'DELETE'))]
+        # Only the session of the test client may be written
+        self.assertFalse([sql for sql in writes if 'django_session' not in sql])
+        # Access follows the order, not the stored flags
+        self.assertTrue(response.context['chapters'][0].coursevideoforordereduser_set.all()[0].is_accessible)
+        self.assertEqual(OrderProgress.build_for_orders([order])[0].total_videos, 6)
+
+    def test_inactive_order_gets_no_media_links(self):
+        order = self.create_order(2)
+        response = self.client.get(reverse('courses:ordered_course_detail', args=[order.id]))
+        self.assertContains(response, '/secure-media/')
+
+        CourseOrder.objects.filter(id=order.id).update(is_active=False)
+        response = self.client.get(reverse('courses:ordered_course_detail', args=[order.id]))
+        self.assertNotContains(response, '/secure-media/')
+
+    def test_locked_chapters_get_no_material_links(self):
+        order = self.create_order(3)
+        chapters = order.build_outline(self.user)['chapters']
+        materials = [chapter.coursematerialforordereduser_set.all()[0] for chapter in chapters]
+        self.assertEqual([material.is_accessible for material in materials], [True, False, False])
+        # The open chapter keeps a hidden link for the page to reveal, the locked one gets none
+        self.assertTrue(materials[1].file_url)
+        self.assertIsNone(materials[2].file_url)
+
+    def test_inactive_order_opens_no_lessons(self):
+        order = self.create_order(2)
+        # Flags left accessible by legacy data must not open anything
+        CourseOrder.objects.filter(id=order.id).update(is_active=False)
+        response = self.client.get(reverse('courses:ordered_course_detail', args=[order.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.context['is_enrolled'])
+        for chapter in response.context['chapters']:
+            self.assertFalse(chapter.is_accessible)
+            self.assertFalse(any(video.is_accessible for video in chapter.coursevideoforordereduser_set.all()))
+            self.assertFalse(any(material.is_accessible for material in chapter.coursematerialforordereduser_set.all()))
+
+
+class MaterializeContentTest(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email='learner@example.com', password='secret')
+        category = Categories.objects.create(name='Категория')
+        self.course = Courses.objects.create(
+            name='Курс', description='Описание', image='courses/course.jpg', author='Автор', user=self.user, category=category,
+        )
+
+    def add_chapters(self, count, start=0):
+        for index in range(start, start + count):
+            chapter = CourseChapter.objects.create(course=self.course, title=f'Глава {index}', order=index)
+            for video_index in range(2):
+                CourseChapterVideo.objects.create(
+                    chapter=chapter, title=f'Видео {index}.{video_index}', order=video_index, video_file='course_videos/video.mp4',
+                )
+            CourseChapterMaterials.objects.create(
+                chapter=chapter, title=f'Материал {index}', order=0, document_file='course_materials/documents/file.docx',
+            )
+
+    def materialize(self, sender):
+        order = CourseOrder.objects.create(course=self.course, sender=sender, is_active=False)
+        with CaptureQueriesContext(connection) as context:
+            created = order.materialize_content()
+        return order, created, len(context.captured_queries)
+
+    def test_one_insert_per_table(self):
+        self.add_chapters(2)
+        _, created, small_queries = self.materialize('small@example.com')
+        self.assertEqual(created, (2, 4, 2))
+
+        self.add_chapters(10, start=2)
+        hidden = CourseChapter.objects.create(course=self.course, title='Скрытая глава', order=99, is_activate=False)
+        CourseChapterVideo.objects.create(chapter=hidden, title='Скрытое видео', video_file='course_videos/video.mp4')
+        order, created, large_queries = self.materialize('large@example.com')
+        self.assertEqual(created, (12, 24, 12))
+        self.assertEqual(small_queries, large_queries)
+
+        video = CourseVideoForOrderedUser.objects.get(order=order, title='Видео 5.1')
+        self.assertEqual((video.chapter.title, video.source_video.title), ('Глава 5', 'Видео 5.1'))
+        # Content of an order waiting for activation stays closed
+        self.assertFalse(CourseVideoForOrderedUser.objects.filter(order=order, is_accessible=True).exists())
+
+    def test_running_again_adds_only_new_content(self):
+        self.add_chapters(2)
+        order, _, _ = self.materialize('learner@example.com')
+        self.assertEqual(order.materialize_content(), (0, 0, 0))
+        CourseChapterVideo.objects.create(
+            chapter=CourseChapter.objects.get(course=self.course, order=1), title='Новое видео', order=5,
+            video_file='course_videos/video.mp4',
+        )
+        self.assertEqual(order.materialize_content(), (0, 1, 0))
+
+    @override_settings(ORDER_CONTENT_MATERIALIZE_ASYNC=True, JOBS_RUN_INLINE=False)
+    def test_checkout_materializes_in_a_background_job(self):
+        self.add_chapters(2)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('courses:create_order', args=[self.course.id]), {
+                'first_name': 'Иван', 'last_name': 'Петров', 'email': 'buyer@example.com', 'phone_number': '123',
+            })
+        self.assertTrue(response.json()['success'])
+        order = CourseOrder.objects.get(sender='buyer@example.com')
+        self.assertFalse(CourseVideoForOrderedUser.objects.filter(order=order).exists())
+
+        job = Job.objects.get(name='order.materialize_content')
+        self.assertEqual((job.payload, job.idempotency_key), ({'order_id': order.id}, f'order:{order.id}:materialize'))
+        call_command('run_jobs', '--once', stdout=StringIO())
+        self.assertEqual(CourseVideoForOrderedUser.objects.filter(order=order).count(), 4)
+
+
+class OrderContentSourceTest(TestCase):
+    """Per-order copies keep a link to the course rows they were copied from"""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email='learner@example.com', password='secret')
+        category = Categories.objects.create(name='Категория')
+        self.course = Courses.objects.create(
+            name='Курс', description='Описание', image='courses/course.jpg', author='Автор', user=self.user, category=category,
+        )
+        # Both chapters start with a lesson of the same title and position
+        self.videos = []
+        self.materials = []
+        for index in range(2):
+            chapter = CourseChapter.objects.create(course=self.course, title=f'Глава {index}', description=f'Глава {index}', order=index)
+            self.videos.append(CourseChapterVideo.objects.create(
+                chapter=chapter, title='Введение', description=f'Введение {index}', order=0,
+                video_file=f'course_videos/intro{index}.mp4', video_time=timedelta(minutes=5 + index),
+            ))
+            self.materials.append(CourseChapterMaterials.objects.create(
+                chapter=chapter, title='Конспект', order=0, document_file=f'course_materials/documents/notes{index}.docx',
+            ))
+        self.order = CourseOrder.objects.create(user=self.user, course=self.course, sender=self.user.email)
+
+    def test_lessons_are_matched_by_their_source(self):
+        # Lessons of the same title and position in different chapters are both copied
+        self.assertEqual(self.order.materialize_content(), (2, 2, 2))
+        video = CourseVideoForOrderedUser.objects.get(order=self.order, source_video=self.videos[1])
+        self.assertEqual((video.chapter.title, video.video_file.name), ('Глава 1', 'course_videos/intro1.mp4'))
+        self.assertEqual(self.order.materialize_content(), (0, 0, 0))
+
+    def get_lessons(self):
+        return [
+            (chapter.title, [video.title for video in chapter.coursevideoforordereduser_set.all()])
+            for chapter in self.order.build_outline(self.user)['chapters']
+        ]
+
+    def test_course_edits_leave_copies_unchanged(self):
+        self.order.materialize_content()
+        self.videos[1].title = 'Обзор'
+        self.videos[1].save()
+        self.videos[1].delete()
+        self.assertEqual(self.get_lessons(), [('Глава 0', ['Введение']), ('Глава 1', ['Введение'])])
+        self.assertEqual(self.order.materialize_content(), (0, 0, 0))
+
+    def link_sources(self):
+        migration = importlib.import_module('apps.order.migrations.0008_link_ordered_content_sources')
+        migration.link_sources(apps, None)
+
+    def test_migration_matches_lessons_within_their_chapter(self):
+        chapter = CourseChapterForOrderedUser.objects.create(order=self.order, title='Глава 1', chapter_order=1)
+        video = CourseVideoForOrderedUser.objects.create(
+            order=self.order, chapter=chapter, title='Введение', video_order=0, video_file='course_videos/intro1.mp4',
+            video_time=timedelta(minutes=6),
+        )
+        material = CourseMaterialForOrderedUser.objects.create(
+            order=self.order, chapter=chapter, title='Конспект', material_order=0,
+            document_file='course_materials/documents/notes1.docx',
+        )
+        self.link_sources()
+        video.refresh_from_db()
+        material.refresh_from_db()
+        self.assertEqual((video.source_video, material.source_material), (self.videos[1], self.materials[1]))
+        # The copied payload is kept
+        self.assertEqual((video.video_file.name, video.video_time), ('course_videos/intro1.mp4', timedelta(minutes=6)))
+
+
+@override_settings(JOBS_RUN_INLINE=False)
+class BulkActivationTest(TestCase):
+    def setUp(self):
+        self.admin = CustomUser.objects.create_superuser(email='admin@example.com', password='secret')
+        category = Categories.objects.create(name='Категория')
+        self.course = Courses.objects.create(
+            name='Курс', description='Описание', image='courses/course.jpg', author='Автор',
+            user=self.admin, category=category,
+        )
+        self.client.force_login(self.admin)
+
+    def create_order(self, index, **kwargs):
+        order = CourseOrder.objects.create(course=self.course, sender=f'buyer{index}@example.com', is_active=False, **kwargs)
+        chapter = CourseChapterForOrderedUser.objects.create(order=order, title='Глава', chapter_order=0)
+        CourseVideoForOrderedUser.objects.create(
+            order=order, chapter=chapter, title='Видео', video_file='course_videos/video.mp4', video_order=0,
+        )
+        return order
+
+    def activate(self, orders):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('admin:order_courseorder_changelist'), {
+                'action': 'activate_selected', '_selected_action': [order.id for order in orders],
+            })
+
+    def test_activation_query_count_does_not_grow_with_orders(self):
+        buyers = [CustomUser.objects.create_user(email=f'buyer{index}@example.com', password='secret') for index in range(5)]
+        orders = [self.create_order(index) for index in range(5)]
+
+        counts = []
+        for batch in (orders[:1], orders[1:]):
+            # Emails are spooled once the transaction commits, outside the counted block
+            with self.captureOnCommitCallbacks(execute=True):
+                with CaptureQueriesContext(connection) as context:
+                    CourseOrder.activate_orders(
+                        CourseOrder.objects.filter(id__in=[order.id for order in batch]).select_related('course')
+                    )
+            counts.append(len(context.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+
+        self.assertEqual(
+            list(CourseOrder.objects.order_by('id').values_list('user_id', 'is_active')),
+            [(buyer.id, True) for buyer in buyers],
+        )
+        self.assertFalse(CourseVideoForOrderedUser.objects.filter(is_accessible=False).exists())
+        self.assertEqual(OutboundEmail.objects.count(), 5)
+
+    def test_admin_action_skips_active_orders(self):
+        CustomUser.objects.create_user(email='buyer0@example.com', password='secret')
+        order = self.create_order(0)
+        self.activate([order])
+        self.assertEqual(OutboundEmail.objects.count(), 1)
+
+        with CaptureQueriesContext(connection) as context:
+            self.activate([order])
+        self.assertFalse([query for query in context.captured_queries if query['sql'].startswith('UPDATE')])
+        self.assertEqual(OutboundEmail.objects.count(), 1)
+
+    def test_order_waits_for_its_user_to_register(self):
+        order = self.create_order(0)
+        self.activate([order])
+        self.assertIsNone(CourseOrder.objects.get(id=order.id).user_id)
+
+        buyer = CustomUser.objects.create_user(email='buyer0@example.com', password='secret')
+        self.activate([order])
+        self.assertEqual(CourseOrder.objects.get(id=order.id).user_id, buyer.id)
+        self.assertEqual(OrderProgress.objects.get(order=order).total_videos, 1)
+
+
+class HotPathIndexTest(TestCase):
+    """The hottest filters must be answered from their purpose-built indexes"""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email='learner@example.com', password='secret')
+        category = Categories.objects.create(name='Категория')
+        self.course = Courses.objects.create(
+            name='Курс', description='Описание', image='courses/course.jpg', author='Автор',
+            user=self.user, category=category,
+        )
+        self.order = CourseOrder.objects.create(user=self.user, course=self.course, sender=self.user.email)
+        self.chapter = CourseChapterForOrderedUser.objects.create(order=self.order, title='Глава', chapter_order=0)
+        self.quiz = CourseQuiz.objects.create(course=self.course, title='Тест')
+
+    def assertUsesIndex(self, queryset, index_name):
+        if connection.vendor != 'sqlite':
+            self.skipTest('EXPLAIN QUERY PLAN output is SQLite specific')
+        plan = queryset.explain()
+        self.assertIn(f'USING INDEX {index_name}', plan.replace('COVERING INDEX', 'INDEX'), plan)
+        self.assertNotIn('USE TEMP B-TREE', plan)
+
+    def test_progress_lookups(self):
+        # unique_together indexes double as the lookup indexes of get_or_create
+        self.assertUsesIndex(
+            UserVideoProgress.objects.filter(user=self.user, video_id=1, is_watched=True),
+            'order_uservideoprogress_user_id_video_id_',
+        )
+        self.assertUsesIndex(
+            UserChapterProgress.objects.filter(user=self.user, chapter=self.chapter),
+            'order_userchapterprogress_user_id_chapter_id_',
+        )
+
+    def test_latest_quiz_attempt(self):
+        self.assertUsesIndex(
+            QuizAttempt.objects.filter(user=self.user, quiz=self.quiz).order_by('-started_at')[:1],
+            'courses_attempt_latest_idx',
+        )
+
+    def test_active_orders_of_user(self):
+        # Partial index: SQLite cannot use `WHERE "is_active"` as an equality on an index column
+        self.assertUsesIndex(CourseOrder.objects.filter(user=self.user, is_active=True), 'order_user_active_idx')
+        self.assertUsesIndex(
+            CourseOrder.objects.filter(user=self.user, course=self.course, is_active=True), 'order_user_active_idx'
+        )
+
+    def test_unique_lookups(self):
+        self.assertUsesIndex(
+            CourseOrder.objects.filter(sender='buyer@example.com', course=self.course),
+            'order_courseorder_sender_course_',
+        )
+        # get() / get_or_create() drop the default ordering
+        self.assertUsesIndex(
+            ReferralRequest.objects.filter(email='buyer@example.com').order_by(), 'website_referral_email_idx'
+        )
+        self.assertUsesIndex(
+            ReferralRequest.objects.filter(promo_code='REF12345', is_active=True), 'sqlite_autoindex_website_referralrequest_'
+        )
+
+
+class MarkVideoWatchedTest(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email='learner@example.com', password='secret')
+        category = Categories.objects.create(name='Категория')
+        course = Courses.objects.create(
+            name='Курс', description='Описание', image='courses/course.jpg', author='Автор',
+            user=self.user, category=category,
+        )
+        self.order = CourseOrder.objects.create(user=self.user, course=course, sender=self.user.email)
+        chapter = CourseChapterForOrderedUser.objects.create(order=self.order, title='Глава', chapter_order=0)
+        self.videos = [
+            CourseVideoForOrderedUser.objects.create(
+                order=self.order, chapter=chapter, title=f'Видео {index}', video_file='course_videos/video.mp4', video_order=index,
+            )
+            for index in range(2)
+        ]
+        OrderProgress.refresh_for_orders([self.order])
+        self.client.force_login(self.user)
+
+    def mark(self, video):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(
+                reverse('courses:mark_video_watched'), {'video_id': video.id}, content_type='application/json',
+            )
+        writes = [query['sql'] for query in context.captured_queries if query['sql'].startswith(('INSERT', 'UPDATE'))]
+        return response.json(), [sql for sql in writes if 'django_session' not in sql]
+
+    def test_first_watch_updates_progress_incrementally(self):
+        data, writes = self.mark(self.videos[0])
+        self.assertTrue(data['changed'])
+        self.assertEqual(data['progress']['watched_videos'], 1)
+        self.assertEqual(len(writes), 2)  # Progress upsert and snapshot update
+        self.assertFalse(UserChapterProgress.objects.exists())
+
+        data, writes = self.mark(self.videos[1])
+        self.assertEqual(data['progress']['percentage'], 100)
+        self.assertTrue(UserChapterProgress.objects.get().is_completed)
+
+        stored = OrderProgress.objects.get(order=self.order)
+        self.assertEqual(stored.differs_from(OrderProgress.build_for_orders([self.order])[0]), [])
+
+    def test_repeat_is_a_pure_read(self):
+        self.mark(self.videos[0])
+        data, writes = self.mark(self.videos[0])
+        self.assertFalse(data['changed'])
+        self.assertEqual(writes, [])
+        self.assertEqual(data['progress']['watched_videos'], 1)
+
+
+@override_settings(VIDEO_TELEMETRY_FLUSH_INTERVAL=3600)
+class VideoTelemetryTest(TestCase):
+    def setUp(self):
+        telemetry.take_buffer()
+        self.user = CustomUser.objects.create_user(email='learner@example.com', password='secret')
+        category = Categories.objects.create(name='Категория')
+        course = Courses.objects.create(
+            name='Курс', description='Описание', image='courses/course.jpg', author='Автор',
+            user=self.user, category=category,
+        )
+        self.order = CourseOrder.objects.create(user=self.user, course=course, sender=self.user.email)
+        chapter = CourseChapterForOrderedUser.objects.create(order=self.order, title='Глава', chapter_order=0)
+        self.videos = [
+            CourseVideoForOrderedUser.objects.create(
+                order=self.order, chapter=chapter, title=f'Видео {index}', video_file='course_videos/video.mp4', video_order=index,
+            )
+            for index in range(3)
+        ]
+        self.client.force_login(self.user)
+
+    def send(self, events):
+        return self.client.post(reverse('courses:video_telemetry'), {'events': events}, content_type='application/json').json()
+
+    def test_heartbeats_are_coalesced_and_flushed_in_bulk(self):
+        first, second, third = self.videos
+        self.send([
+            {'video_id': first.id, 'position': 30, 'intervals': [[0, 30]]},
+            {'video_id': second.id, 'position': 12, 'intervals': [[0, 12]]},
+        ])
+        # A retried batch and an overlapping interval add nothing twice
+        self.send([
+            {'video_id': first.id, 'position': 45, 'intervals': [[0, 30], [20, 45]]},
+            {'video_id': third.id, 'position': 5},
+        ])
+        self.assertFalse(UserVideoProgress.objects.exists())
+
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(telemetry.flush(), 3)
+        writes = [query['sql'] for query in context.captured_queries if query['sql'].startswith(('INSERT', 'UPDATE'))]
+        self.assertEqual(len(writes), 2)
+
+        rows = {row.video_id: row for row in UserVideoProgress.objects.all()}
+        self.assertEqual((rows[first.id].last_position, rows[first.id].watch_duration), (45, timedelta(seconds=45)))
+        self.assertEqual(rows[second.id].watch_duration, timedelta(seconds=12))
+        self.assertEqual((rows[third.id].last_position, rows[third.id].watch_duration), (5, timedelta(0)))
+        self.assertFalse(any(row.is_watched for row in rows.values()))
+
+        # Watch time accumulates over flushes; the outline exposes the resume position
+        self.send([{'video_id': first.id, 'position': 50, 'intervals': [[45, 50]]}])
+        telemetry.flush()
+        self.assertEqual(UserVideoProgress.objects.get(video=first).watch_duration, timedelta(seconds=50))
+        # 5 second buckets: [0, 45] covered 9 of them, [45, 50] ORs in the 10th
+        self.assertEqual(segments.count_watched(UserVideoProgress.objects.get(video=first).watched_segments), 10)
+        self.assertEqual(segments.count_watched(UserVideoProgress.objects.get(video=third).watched_segments), 0)
+        outline = self.order.build_outline(self.user)
+        self.assertEqual(outline['chapters'][0].coursevideoforordereduser_set.all()[0].resume_position, 50)
+
+    def test_idle_buffer_is_flushed_by_a_timer(self):
+        flushed = threading.Event()
+        with override_settings(VIDEO_TELEMETRY_FLUSH_INTERVAL=0.05), \
+                mock.patch.object(telemetry, 'flush', side_effect=flushed.set):
+            self.send([{'video_id': self.videos[0].id, 'position': 30}])
+            self.assertTrue(flushed.wait(5))
+        telemetry.take_buffer()
+
+        # A buffer flushed in time cancels its timer
+        self.send([{'video_id': self.videos[0].id, 'position': 30}])
+        timer = telemetry._timer
+        self.assertEqual(telemetry.flush(), 1)
+        timer.join(1)
+        self.assertFalse(timer.is_alive())
+
+    def test_foreign_and_malformed_events_are_dropped(self):
+        other = CustomUser.objects.create_user(email='other@example.com', password='secret')
+        self.client.force_login(other)
+        data = self.send([{'video_id': self.videos[0].id, 'position': 10}, {'video_id': 'x'}, 'junk'])
+        self.assertEqual(data['accepted'], 0)
+        self.assertEqual(telemetry.flush(), 0)
+
+    def test_out_of_range_values_do_not_drop_other_users_data(self):
+        other = CustomUser.objects.create_user(email='other@example.com', password='secret')
+        other_order = CourseOrder.objects.create(user=other, course=self.order.course, sender=other.email)
+        other_video = CourseVideoForOrderedUser.objects.create(
+            order=other_order, title='Видео', video_file='course_videos/video.mp4', video_order=0,
+        )
+        self.client.force_login(other)
+        self.send([{'video_id': other_video.id, 'position': 20, 'intervals': [[0, 20]]}])
+
+        # json.loads accepts Infinity; huge numbers overflow int() or the database integer
+        self.client.force_login(self.user)
+        video_id = self.videos[0].id
+        response = self.client.post(reverse('courses:video_telemetry'), (
+            '{"events": [{"video_id": %d, "position": Infinity}, {"video_id": 1e400}, {"video_id": 1e30},'
+            ' {"video_id": %d, "intervals": [[0, NaN]]}, {"video_id": %d, "position": 1e30, "intervals": [[-5, 10]]}]}'
+            % (video_id, video_id, video_id)
+        ), content_type='application/json')
+        self.assertEqual(response.json()['accepted'], 1)
+
+        # An entry that still fails to write only loses its own data
+        telemetry.record(self.user.id, [(self.videos[1].id, 10 ** 30, [])])
+        self.assertEqual(telemetry.flush(), 2)
+        self.assertEqual(UserVideoProgress.objects.get(user=other).last_position, 20)
+        progress = UserVideoProgress.objects.get(user=self.user)
+        self.assertEqual((progress.last_position, progress.watch_duration), (settings.VIDEO_MAX_DURATION, timedelta(seconds=10)))
+
+
+class WatchedSegmentsTest(TestCase):
+    def test_merge_and_aggregate(self):
+        # A bucket counts when an interval covers its middle
+        bitmap = segments.merge(b'', [[0, 12], [40, 41]])
+        self.assertEqual(segments.to_bits(bitmap).tolist(), [1, 1, 0, 0, 0, 0, 0, 0])
+        bitmap = segments.merge(bitmap, [[10, 25], [70, 80]])
+        self.assertEqual(segments.count_watched(bitmap), 7)
+        self.assertEqual(segments.merge(bitmap, [[0, 25]]), bitmap)
+        self.assertEqual(len(segments.merge(b'', [[0, 10 ** 9]])), segments.get_max_segments() // 8)
+
+        counts = segments.aggregate([bitmap, segments.merge(b'', [[0, 10]]), b''], segments=6)
+        self.assertEqual(counts.tolist(), [2, 2, 1, 1, 1, 0])
+
+    def test_heatmap_rebuild(self):
+        user = CustomUser.objects.create_user(email='author@example.com', password='secret')
+        category = Categories.objects.create(name='Категория')
+        course = Courses.objects.create(
+            name='Курс', description='Описание', image='courses/course.jpg', author='Автор', user=user, category=category,
+        )
+        chapter = CourseChapter.objects.create(course=course, title='Глава')
+        source = CourseChapterVideo.objects.create(
+            chapter=chapter, title='Видео', video_file='course_videos/video.mp4', video_time=timedelta(seconds=30),
+        )
+        unwatched = CourseChapterVideo.objects.create(chapter=chapter, title='Другое', video_file='course_videos/other.mp4')
+        for index, intervals in enumerate([[[0, 30]], [[0, 10]], []]):
+            learner = CustomUser.objects.create_user(email=f'learner{index}@example.com', password='secret')
+            order = CourseOrder.objects.create(user=learner, course=course, sender=learner.email)
+            video, _ = CourseVideoForOrderedUser.objects.get_or_create(order=order, source_video=source, title='Видео')
+            UserVideoProgress.objects.create(user=learner, video=video, watched_segments=segments.merge(b'', intervals))
+
+        with self.assertNumQueries(3):
+            VideoHeatmap.rebuild()
+        heatmap = VideoHeatmap.objects.get(video=source)
+        self.assertEqual((heatmap.viewers, heatmap.counts, heatmap.peak), (2, [2, 2, 1, 1, 1, 1], 2))
+        self.assertEqual(VideoHeatmap.objects.get(video=unwatched).counts, [])
+
+        # A rebuild replaces the stored heatmap
+        UserVideoProgress.objects.filter(user__email='learner1@example.com').delete()
+        VideoHeatmap.rebuild([source.id])
+        self.assertEqual(VideoHeatmap.objects.get(video=source).counts, [1] * 6)
+
+
+class TestEmailCommandTest(TestCase):
+    def test_goes_through_the_spool(self):
+        out = StringIO()
+        call_command('test_email', stdout=out)
+        self.assertIn('Email sent successfully', out.getvalue())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(OutboundEmail.objects.get().status, OutboundEmail.STATUS_SENT)
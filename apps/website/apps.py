@@ -5,3 +5,5 @@ class WebsiteConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.website'
     
+    def ready(self):
+        import apps.website.signals
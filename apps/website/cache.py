@@ -0,0 +1,55 @@
+import threading
+import time
+
+from django.core.cache import caches
+from django.utils.connection import ConnectionProxy
+
+from config.cache_backends import is_shared
+
+
+cache = ConnectionProxy(caches, 'querysets')
+
+# Singletons are kept in process memory for a few seconds on top of the shared cache,
+# so a burst of renders in one worker does not hit the cache backend either.
+# Signals can only invalidate what the saving process sees: with a per-process
+# backend (locmem) the entries live no longer than the local layer.
+LOCAL_TIMEOUT = 5
+SHARED_TIMEOUT = 60 * 60
+
+FAQS_KEY = 'website:faqs'
+REFERRAL_DISCOUNT_KEY = 'website:referral-discount'
+MAIN_HEADER_KEY = 'website:main-header'
+
+_MISSING = object()
+_local = {}
+_lock = threading.Lock()
+
+
+def get_shared_timeout():
+    """Время жизни значения в общем кэше"""
+    return SHARED_TIMEOUT if is_shared(caches['querysets']) else LOCAL_TIMEOUT
+
+
+def get_cached(key, loader):
+    """Возвращает значение из локального/общего кэша, загружая его при промахе"""
+    now = time.monotonic()
+    entry = _local.get(key)
+    if entry is not None and entry[0] > now:
+        return entry[1]
+
+    value = cache.get(key, _MISSING)
+    if value is _MISSING:
+        value = loader()
+        cache.set(key, value, get_shared_timeout())
+
+    with _lock:
+        _local[key] = (now + LOCAL_TIMEOUT, value)
+    return value
+
+
+def invalidate(*keys):
+    """Сбрасывает значения в общем кэше и в памяти текущего процесса"""
+    cache.delete_many(keys)
+    with _lock:
+        for key in keys:
+            _local.pop(key, None)
@@ -1,21 +1,23 @@
+from django.utils.functional import SimpleLazyObject
+
 from .models import FAQ, DiscountForReferral, MainHeader
 
+# Values are lazy: the cached lookup runs only if a template actually uses the variable.
+
 def faq_context(request):
     """Add FAQ context to all templates"""
     return {
-        'faqs': FAQ.objects.filter(is_active=True).order_by('order', 'created_at')
+        'faqs': SimpleLazyObject(FAQ.get_active_faqs)
     }
 
 def discount_context(request):
     """Add discount context to all templates"""
-    discount = DiscountForReferral.get_active_discount()
     return {
-        'referral_discount': discount
+        'referral_discount': SimpleLazyObject(DiscountForReferral.get_active_discount)
     }
 
 def main_header_context(request):
     """Add main header context to all templates"""
-    main_header = MainHeader.get_active_header()
     return {
-        'main_header': main_header
-    }
\ No newline at end of file
+        'main_header': SimpleLazyObject(MainHeader.get_active_header)
+    }
@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Show hit/miss rates for every configured cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Reset the counters after printing them')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Backend: {settings.CACHE_BACKEND}')
+        for alias in settings.CACHES:
+            cache = caches[alias]
+            if not hasattr(cache, 'get_stats'):
+                self.stdout.write(self.style.WARNING(f'{alias}: backend does not collect statistics'))
+                continue
+
+            stats = cache.get_stats()
+            lookups = stats['hits'] + stats['misses']
+            hit_rate = stats['hits'] / lookups * 100 if lookups else 0
+            self.stdout.write(
+                f'{alias:<10} hits: {stats["hits"]:<8} misses: {stats["misses"]:<8} hit rate: {hit_rate:.1f}%'
+            )
+            if options['reset']:
+                cache.reset_stats()
+
+        if settings.CACHE_BACKEND == 'locmem':
+            self.stdout.write(self.style.WARNING('locmem caches are per process: only this command\'s lookups are counted'))
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-17 13:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0021_service'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='referralrequest',
+            index=models.Index(fields=['email'], name='website_referral_email_idx'),
+        ),
+    ]
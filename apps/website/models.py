@@ -3,6 +3,8 @@ from django.utils import timezone
 import secrets
 import string
 
+from .cache import FAQS_KEY, MAIN_HEADER_KEY, REFERRAL_DISCOUNT_KEY, get_cached
+
 class FAQ(models.Model):
     """FAQ (Frequently Asked Questions) model"""
     question = models.CharField(
@@ -48,6 +50,11 @@ class FAQ(models.Model):
     def __str__(self):
         return self.question[:50] + "..." if len(self.question) > 50 else self.question
 
+    @classmethod
+    def get_active_faqs(cls):
+        """Возвращает активные FAQ (кэшируется до изменения)"""
+        return get_cached(FAQS_KEY, lambda: list(cls.objects.filter(is_active=True).order_by('order', 'created_at')))
+
 
 class AboutSection(models.Model):
     """About page sections model"""
@@ -233,6 +240,10 @@ class ReferralRequest(models.Model):
         verbose_name = "Реферальная заявка"
         verbose_name_plural = "05. Реферальные заявки"
         ordering = ['-created_at']
+        indexes = [
+            # Order form looks up the buyer's own referral by email
+            models.Index(fields=['email'], name='website_referral_email_idx'),
+        ]
 
     def __str__(self):
         return f"{self.first_name} {self.last_name} - {self.email}"
@@ -374,8 +385,8 @@ class DiscountForReferral(models.Model):
 
     @classmethod
     def get_active_discount(cls):
-        """Возвращает активную скидку"""
-        return cls.objects.first()
+        """Возвращает активную скидку (кэшируется до изменения)"""
+        return get_cached(REFERRAL_DISCOUNT_KEY, lambda: cls.objects.first())
 
 
 class ReferralStep(models.Model):
@@ -513,8 +524,8 @@ class MainHeader(models.Model):
 
     @classmethod
     def get_active_header(cls):
-        """Возвращает активный заголовок"""
-        return cls.objects.filter(is_active=True).first()
+        """Возвращает активный заголовок (кэшируется до изменения)"""
+        return get_cached(MAIN_HEADER_KEY, lambda: cls.objects.filter(is_active=True).first())
 
 
 class Service(models.Model):
@@ -0,0 +1,23 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import FAQS_KEY, MAIN_HEADER_KEY, REFERRAL_DISCOUNT_KEY, invalidate
+from .models import FAQ, DiscountForReferral, MainHeader
+
+
+@receiver([post_save, post_delete], sender=FAQ)
+def invalidate_faqs(sender, **kwargs):
+    """Сбрасывает кэш FAQ при изменении"""
+    invalidate(FAQS_KEY)
+
+
+@receiver([post_save, post_delete], sender=DiscountForReferral)
+def invalidate_referral_discount(sender, **kwargs):
+    """Сбрасывает кэш скидки при изменении"""
+    invalidate(REFERRAL_DISCOUNT_KEY)
+
+
+@receiver([post_save, post_delete], sender=MainHeader)
+def invalidate_main_header(sender, **kwargs):
+    """Сбрасывает кэш главного заголовка при изменении"""
+    invalidate(MAIN_HEADER_KEY)
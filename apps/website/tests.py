@@ -1,3 +1,135 @@
-from django.test import TestCase
+import tempfile
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.template import Context, Template
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from config import cache_backends, settings as project_settings
+from . import cache as website_cache
+from .context_processors import discount_context, faq_context, main_header_context
+from .models import FAQ, DiscountForReferral, MainHeader
+
+
+class SingletonCacheTest(TestCase):
+    def setUp(self):
+        website_cache.cache.clear()
+        website_cache._local.clear()
+        self.addCleanup(website_cache._local.clear)
+        self.faq = FAQ.objects.create(question='Вопрос', answer='Ответ')
+
+    def test_context_is_lazy(self):
+        with self.assertNumQueries(0):
+            context = {**faq_context(None), **discount_context(None), **main_header_context(None)}
+            Template('{{ request }}').render(Context(context))
+        with self.assertNumQueries(1):
+            self.assertEqual(list(context['faqs']), [self.faq])
+
+    def test_values_are_cached(self):
+        self.assertEqual(FAQ.get_active_faqs(), [self.faq])
+        with self.assertNumQueries(0):
+            self.assertEqual(FAQ.get_active_faqs(), [self.faq])
+        # Another worker: nothing in its process memory, the shared cache answers
+        website_cache._local.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(FAQ.get_active_faqs(), [self.faq])
+
+    def test_missing_values_are_cached(self):
+        self.assertIsNone(DiscountForReferral.get_active_discount())
+        with self.assertNumQueries(0):
+            self.assertIsNone(DiscountForReferral.get_active_discount())
+
+    def test_save_and_delete_invalidate(self):
+        self.assertEqual(FAQ.get_active_faqs(), [self.faq])
+        self.faq.is_active = False
+        self.faq.save()
+        self.assertEqual(FAQ.get_active_faqs(), [])
+        self.faq.delete()
+        other = FAQ.objects.create(question='Другой вопрос', answer='Ответ')
+        self.assertEqual(FAQ.get_active_faqs(), [other])
+
+        self.assertIsNone(DiscountForReferral.get_active_discount())
+        discount = DiscountForReferral.objects.create(percentage=6)
+        self.assertEqual(DiscountForReferral.get_active_discount(), discount)
+        discount.delete()
+        self.assertIsNone(DiscountForReferral.get_active_discount())
+
+        self.assertIsNone(MainHeader.get_active_header())
+        header = MainHeader.objects.create(title='Заголовок', keywords='', image='h.jpg', image_banner_video='b.jpg')
+        self.assertEqual(MainHeader.get_active_header(), header)
+        header.is_active = False
+        header.save()
+        self.assertIsNone(MainHeader.get_active_header())
+
+    def test_local_layer_expires(self):
+        FAQ.get_active_faqs()
+        expires, _ = website_cache._local[website_cache.FAQS_KEY]
+        website_cache._local[website_cache.FAQS_KEY] = (expires - 60, [])
+        # The stale local copy is dropped, the shared cache still has the value
+        with self.assertNumQueries(0):
+            self.assertEqual(FAQ.get_active_faqs(), [self.faq])
+
+    def test_shared_timeout_follows_the_backend(self):
+        # A per-process backend cannot be invalidated from other workers
+        self.assertEqual(website_cache.get_shared_timeout(), website_cache.LOCAL_TIMEOUT)
+        with tempfile.TemporaryDirectory() as location:
+            caches = {**settings.CACHES, 'querysets': {'BACKEND': 'config.cache_backends.FileBasedCache', 'LOCATION': location}}
+            with override_settings(CACHES=caches):
+                self.assertEqual(website_cache.get_shared_timeout(), website_cache.SHARED_TIMEOUT)
+
+
+class CacheBackendTest(SimpleTestCase):
+    def test_backend_selection(self):
+        for backend, expected in (
+            ('locmem', 'config.cache_backends.LocMemCache'),
+            ('file', 'config.cache_backends.FileBasedCache'),
+            ('redis', 'config.cache_backends.RedisCache'),
+        ):
+            with mock.patch.object(project_settings, 'CACHE_BACKEND', backend):
+                cache = project_settings.build_cache('querysets', 60)
+            self.assertEqual(cache['BACKEND'], expected)
+            self.assertEqual(cache['TIMEOUT'], 60)
+            # Aliases sharing a server or a directory tree never see each other's keys
+            self.assertTrue(cache['KEY_PREFIX'].endswith(':querysets'))
+        self.assertEqual(cache['LOCATION'], project_settings.CACHE_REDIS_URL)
+
+    def test_counters(self):
+        with tempfile.TemporaryDirectory() as location:
+            for cache in (cache_backends.LocMemCache('stats-test', {}), cache_backends.FileBasedCache(location, {})):
+                cache.set('key', 1)
+                cache.get('key')
+                cache.get('missing')
+                cache.get_many(['key', 'missing', 'other'])
+                self.assertEqual(cache.get_stats(), {'hits': 2, 'misses': 3})
+                # Counters are kept out of the statistics themselves
+                self.assertEqual(cache.get_stats(), {'hits': 2, 'misses': 3})
+                cache.reset_stats()
+                self.assertEqual(cache.get_stats(), {'hits': 0, 'misses': 0})
+
+    def test_counters_are_added_across_processes(self):
+        with tempfile.TemporaryDirectory() as location:
+            first, second = cache_backends.FileBasedCache(location, {}), cache_backends.FileBasedCache(location, {})
+            first.get('missing')
+            second.get('missing')
+            second.flush_stats()
+            self.assertEqual(first.get_stats(), {'hits': 0, 'misses': 2})
+
+    def test_is_shared(self):
+        self.assertFalse(cache_backends.is_shared(cache_backends.LocMemCache('shared-test', {})))
+        with tempfile.TemporaryDirectory() as location:
+            self.assertTrue(cache_backends.is_shared(cache_backends.FileBasedCache(location, {})))
+
+    def test_cache_stats_command(self):
+        querysets = caches['querysets']
+        querysets.reset_stats()
+        querysets.set('key', 1)
+        querysets.get('key')
+        querysets.get('missing')
+        out = StringIO()
+        call_command('cache_stats', '--reset', stdout=out)
+        self.assertIn('querysets  hits: 1        misses: 1        hit rate: 50.0%', out.getvalue())
+        self.assertIn('locmem caches are per process', out.getvalue())
+        self.assertEqual(querysets.get_stats(), {'hits': 0, 'misses': 0})
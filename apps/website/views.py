@@ -1,9 +1,8 @@
 from django.shortcuts import render
 from django.http import HttpResponseNotFound, JsonResponse
 from django.core.paginator import Paginator
-from django.core.mail import send_mail
-from django.conf import settings
-from .models import FAQ, AboutSection, Blog, ReferralRequest, Document, DiscountForReferral, MainHeader, ReferralStep, ContactPage, Service
+from apps.jobs.mail import queue_template_email
+from .models import FAQ, AboutSection, Blog, ReferralRequest, Document, MainHeader, ReferralStep, ContactPage, Service
 from apps.courses.models import Categories, Courses
 
 def custom_404(request, exception=None):
@@ -24,7 +23,6 @@ def home(request):
     context = {
         'main_categories': main_categories,
         'popular_courses': popular_courses,
-        'referral_discount': DiscountForReferral.get_active_discount(),
         'main_header': main_header,
     }
     
@@ -37,7 +35,6 @@ def about(request):
     
     context = {
         'about_sections': about_sections,
-        'referral_discount': DiscountForReferral.get_active_discount(),
     }
     
     return render(request, 'about.html', context)
@@ -48,7 +45,6 @@ def services(request):
     
     context = {
         'services': services,
-        'referral_discount': DiscountForReferral.get_active_discount(),
     }
     return render(request, 'services.html', context)
 
@@ -76,17 +72,14 @@ def course_catalogue(request):
 
 def materials(request):
     """Materials page view"""
-    context = {
-        'referral_discount': DiscountForReferral.get_active_discount(),
-    }
+    context = {}
     return render(request, 'materials.html', context)
 
 def popular(request):
     """Popular courses page view"""
-    context = {
-        'referral_discount': DiscountForReferral.get_active_discount(),
-    }
-    return render(request, 'popular.html', context)
+    from apps.courses.views import popular_courses
+    
+    return popular_courses(request)
 
 def referal(request):
     """Referral program page view"""
@@ -95,7 +88,6 @@ def referal(request):
     
     context = {
         'referral_steps': referral_steps,
-        'referral_discount': DiscountForReferral.get_active_discount(),
     }
     return render(request, 'referal.html', context)
 
@@ -106,7 +98,6 @@ def contacts(request):
     
     context = {
         'contact_page': contact_page,
-        'referral_discount': DiscountForReferral.get_active_discount(),
     }
     return render(request, 'contacts.html', context)
 
@@ -117,17 +108,14 @@ def login(request):
 
 def documentation(request):
     """Documentation page view"""
-    context = {
-        'referral_discount': DiscountForReferral.get_active_discount(),
-    }
+    context = {}
     return render(request, 'documentation.html', context)
 
 def get_faqs(request):
     """FAQ page view"""
-    faqs = FAQ.objects.filter(is_active=True).order_by('order', 'created_at')
+    faqs = FAQ.get_active_faqs()
     context = {
         'faqs': faqs,
-        'referral_discount': DiscountForReferral.get_active_discount(),
     }
     return render(request, 'faq.html', context)
 
@@ -169,36 +157,15 @@ def referal_request(request):
             )
             
             # Send email with referral link and promo code
-            subject = 'Ваша реферальная ссылка и промокод - Profactive'
-            
-            message = f'''
-Здравствуйте, {first_name} {last_name}!
-
-Добро пожаловать в реферальную программу Profactive!
-
-Ваши данные:
-- Промокод: {referral.promo_code}
-- Реферальная ссылка: {referral.referral_link}
-
-Как использовать:
-1. Поделитесь ссылкой с друзьями
-2. Когда друг перейдет по ссылке и купит курс, вы получите 6% от суммы
-3. Промокод можно использовать для получения скидки при покупке курсов
-
-С уважением,
-Команда PROFACTIVE
-            '''
-            
             try:
-                send_mail(
-                    subject=subject,
-                    message=message,
-                    from_email=settings.EMAIL_HOST_USER,
-                    recipient_list=[email],
-                    fail_silently=False,
-                )
+                queue_template_email('referral_link', {
+                    'first_name': first_name,
+                    'last_name': last_name,
+                    'promo_code': referral.promo_code,
+                    'referral_link': referral.referral_link,
+                }, [email], idempotency_key=f'referral:{referral.id}:email')
             except Exception as e:
-                print(f"Error sending referral email: {e}")
+                print(f"Error queueing referral email: {e}")
             
             return JsonResponse({
                 'success': True,
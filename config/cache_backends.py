@@ -0,0 +1,101 @@
+"""Cache backends that count hits and misses per named cache.
+
+Counters are kept per process and added to the cache itself every FLUSH_EVERY
+lookups, so `manage.py cache_stats` can read totals across workers for shared
+backends (file, Redis). With locmem each process only sees its own numbers.
+"""
+import threading
+
+from django.core.cache.backends.filebased import FileBasedCache as BaseFileBasedCache
+from django.core.cache.backends.locmem import LocMemCache as BaseLocMemCache
+from django.core.cache.backends.redis import RedisCache as BaseRedisCache
+
+_MISSING = object()
+
+
+class CacheStatsMixin:
+    STATS_KEYS = {'hits': '__stats__:hits', 'misses': '__stats__:misses'}
+    FLUSH_EVERY = 100
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self._stats_guard = threading.local()
+        self._pending = {'hits': 0, 'misses': 0}
+
+    def _record(self, hits, misses):
+        with self._stats_lock:
+            self._pending['hits'] += hits
+            self._pending['misses'] += misses
+            should_flush = sum(self._pending.values()) >= self.FLUSH_EVERY
+        if should_flush:
+            self.flush_stats()
+
+    def _untracked(self):
+        return getattr(self._stats_guard, 'active', False)
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version=version)
+        if not self._untracked():
+            self._record(value is not _MISSING, value is _MISSING)
+        return default if value is _MISSING else value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        self._stats_guard.active = True
+        try:
+            values = super().get_many(keys, version=version)
+        finally:
+            self._stats_guard.active = False
+        self._record(len(values), len(keys) - len(values))
+        return values
+
+    def flush_stats(self):
+        """Add counters of this process to the totals stored in the cache"""
+        with self._stats_lock:
+            pending, self._pending = self._pending, {'hits': 0, 'misses': 0}
+        self._stats_guard.active = True
+        try:
+            for name, key in self.STATS_KEYS.items():
+                if not pending[name]:
+                    continue
+                self.add(key, 0, timeout=None)
+                try:
+                    self.incr(key, pending[name])
+                except ValueError:
+                    # Evicted between add() and incr()
+                    self.set(key, pending[name], timeout=None)
+        finally:
+            self._stats_guard.active = False
+
+    def get_stats(self):
+        """Return {'hits': ..., 'misses': ...} including not yet flushed counters"""
+        self.flush_stats()
+        self._stats_guard.active = True
+        try:
+            stored = super().get_many(self.STATS_KEYS.values())
+        finally:
+            self._stats_guard.active = False
+        return {name: stored.get(key, 0) for name, key in self.STATS_KEYS.items()}
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._pending = {'hits': 0, 'misses': 0}
+        self.delete_many(self.STATS_KEYS.values())
+
+
+def is_shared(cache):
+    """Whether every worker process sees the same entries (locmem is per process)"""
+    return not isinstance(cache, BaseLocMemCache)
+
+
+class LocMemCache(CacheStatsMixin, BaseLocMemCache):
+    pass
+
+
+class FileBasedCache(CacheStatsMixin, BaseFileBasedCache):
+    pass
+
+
+class RedisCache(CacheStatsMixin, BaseRedisCache):
+    pass
@@ -23,6 +23,7 @@ LOCAL_APPS = [
     'apps.accounts',
     'apps.courses',
     'apps.order',
+    'apps.jobs',
 ]
 
 THIRD_PARTY_APPS = [
@@ -165,6 +166,65 @@ DEFAULT_FROM_EMAIL = 'daria.milova99@gmail.com'  # Change to your email
 # Site URL for email links
 SITE_URL = 'http://31.128.43.149:8001'
 
+# Background jobs (apps/jobs, worker: `manage.py run_jobs`). Failed jobs are retried after
+# JOBS_BACKOFF_BASE * 2^(attempt - 1) seconds (at most JOBS_BACKOFF_MAX), then dead-lettered.
+# JOBS_RUN_INLINE runs jobs in the enqueueing process, for development without a worker
+JOBS_MAX_ATTEMPTS = 5
+JOBS_BACKOFF_BASE = 30
+JOBS_BACKOFF_MAX = 60 * 60
+JOBS_LOCK_TIMEOUT = 15 * 60
+JOBS_KEEP_DONE_DAYS = 7
+JOBS_RUN_INLINE = os.environ.get('JOBS_RUN_INLINE', 'False') == 'True'
+
+# Outbound mail spooler (apps/jobs/mail.py): queued emails are sent in batches over one
+# SMTP connection, MAIL_FLUSH_DELAY seconds after the first one, within a per-minute limit
+MAIL_FLUSH_DELAY = 5
+MAIL_BATCH_SIZE = 50
+MAIL_RATE_LIMIT_PER_MINUTE = int(os.environ.get('MAIL_RATE_LIMIT_PER_MINUTE', 60))
+MAIL_MAX_ATTEMPTS = 5
+
+# Copy course content for new orders in a background job after the order is committed
+ORDER_CONTENT_MATERIALIZE_ASYNC = os.environ.get('ORDER_CONTENT_MATERIALIZE_ASYNC', 'False') == 'True'
+
+# Course video streaming (apps/courses/streaming.py). MEDIA_STREAM_OFFLOAD hands the
+# transfer to the proxy after the access check: 'x-accel' (nginx internal location
+# MEDIA_STREAM_ACCEL_PREFIX aliased to MEDIA_ROOT) or 'x-sendfile' (Apache/lighttpd)
+MEDIA_STREAM_OFFLOAD = os.environ.get('MEDIA_STREAM_OFFLOAD', '')
+MEDIA_STREAM_ACCEL_PREFIX = os.environ.get('MEDIA_STREAM_ACCEL_PREFIX', '/protected-media/')
+MEDIA_STREAM_CHUNK_SIZE = 512 * 1024
+
+# Media under these prefixes is paid content: it is only served through signed,
+# expiring links (apps/courses/signed_media.py), never through /media/
+PROTECTED_MEDIA_PREFIXES = ['course_videos/', 'course_materials/']
+MEDIA_URL_TTL = int(os.environ.get('MEDIA_URL_TTL', 4 * 60 * 60))
+MEDIA_URL_EXPIRY_STEP = 5 * 60
+
+# HLS transcoding of chapter videos (apps/courses/transcoding.py), queued as jobs run by `manage.py run_jobs`.
+# Renditions taller than the source are skipped; bitrates are in kbit/s
+FFMPEG_BINARY = os.environ.get('FFMPEG_BINARY', 'ffmpeg')
+FFPROBE_BINARY = os.environ.get('FFPROBE_BINARY', 'ffprobe')
+VIDEO_RENDITIONS = [
+    {'name': '360p', 'height': 360, 'video_bitrate': 800, 'audio_bitrate': 96},
+    {'name': '480p', 'height': 480, 'video_bitrate': 1400, 'audio_bitrate': 128},
+    {'name': '720p', 'height': 720, 'video_bitrate': 2800, 'audio_bitrate': 128},
+    {'name': '1080p', 'height': 1080, 'video_bitrate': 5000, 'audio_bitrate': 192},
+]
+VIDEO_HLS_SEGMENT_SECONDS = 6
+VIDEO_POSTER_SECOND = 5
+VIDEO_TRANSCODE_TIMEOUT = int(os.environ.get('VIDEO_TRANSCODE_TIMEOUT', 4 * 60 * 60))
+
+# Player heartbeats (position, played intervals) are buffered per process and written
+# to UserVideoProgress in bulk at least every VIDEO_TELEMETRY_FLUSH_INTERVAL seconds,
+# the most a killed worker can lose (apps/order/telemetry.py)
+VIDEO_TELEMETRY_FLUSH_INTERVAL = 30
+VIDEO_TELEMETRY_MAX_BUFFER = 1000
+VIDEO_TELEMETRY_MAX_INTERVAL = 10 * 60
+VIDEO_TELEMETRY_MAX_EVENTS = 200
+# Watched-segment bitmaps and heatmaps (apps/order/segments.py): bucket length and longest video covered
+VIDEO_SEGMENT_SECONDS = 5
+VIDEO_MAX_DURATION = 12 * 60 * 60
+HEATMAP_BATCH_SIZE = 2000
+
 # Login/Logout URLs
 LOGIN_URL = '/accounts/login/'
 LOGIN_REDIRECT_URL = '/accounts/profile/'
@@ -173,6 +233,43 @@ LOGOUT_REDIRECT_URL = '/accounts/login/'
 # Session Configuration
 SESSION_COOKIE_AGE = 1209600  # 2 weeks
 SESSION_EXPIRE_AT_BROWSER_CLOSE = False
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+SESSION_CACHE_ALIAS = 'sessions'
+
+# Cache Configuration
+# CACHE_BACKEND: 'locmem' (default, per process), 'file' (shared by workers on one host)
+# or 'redis' (any Redis-compatible server, needs the `redis` package; a local
+# redis-server/valkey instance works for development)
+# Entries invalidated by signals are only kept for long on the shared backends:
+# with locmem a save in one worker cannot reach the caches of the others.
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+CACHE_DIR = os.environ.get('CACHE_DIR', os.path.join(BASE_DIR, '.cache'))
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL', 'redis://127.0.0.1:6379/1')
+CACHE_KEY_PREFIX = os.environ.get('CACHE_KEY_PREFIX', 'profactive')
+
+CACHE_ALIASES = {
+    'default': 300,
+    'fragments': 60 * 60,  # rendered template fragments and emails
+    'sessions': SESSION_COOKIE_AGE,
+    'querysets': 60 * 60,  # query results invalidated by signals
+}
+
+
+def build_cache(alias, timeout):
+    cache = {
+        'TIMEOUT': timeout,
+        'KEY_PREFIX': f'{CACHE_KEY_PREFIX}:{alias}',
+    }
+    if CACHE_BACKEND == 'redis':
+        cache.update(BACKEND='config.cache_backends.RedisCache', LOCATION=CACHE_REDIS_URL)
+    elif CACHE_BACKEND == 'file':
+        cache.update(BACKEND='config.cache_backends.FileBasedCache', LOCATION=os.path.join(CACHE_DIR, alias))
+    else:
+        cache.update(BACKEND='config.cache_backends.LocMemCache', LOCATION=alias)
+    return cache
+
+
+CACHES = {alias: build_cache(alias, timeout) for alias, timeout in CACHE_ALIASES.items()}
 
 # Custom 404 handler
 DEBUG_PROPAGATE_EXCEPTIONS = True
@@ -2,8 +2,8 @@ from django.contrib import admin
 from django.urls import path, include, re_path
 from django.conf import settings
 from django.conf.urls.static import static
-from django.views.static import serve
 from apps.website import views
+from apps.courses import views as courses_views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -19,9 +19,18 @@ urlpatterns += [
 # Serve static files - serve from staticfiles directory
 if settings.DEBUG or not settings.DEBUG:  # Always serve static files
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 
-urlpatterns += [re_path(r"^media/(?P<path>.*)$", serve, {"document_root": settings.MEDIA_ROOT, }, ), ]
+# Media: paid content (PROTECTED_MEDIA_PREFIXES) only through short-lived signed links,
+# everything else as before. In production the proxy should serve /media/ itself and
+# map MEDIA_STREAM_ACCEL_PREFIX as an internal location for the gateway.
+urlpatterns += [
+    re_path(
+        r"^secure-media/(?P<expires>\d+)/(?P<signature>[0-9a-f]{64})/(?P<path>course_videos/hls/.+)$",
+        courses_views.media_gateway_scoped, name='media_gateway_scoped',
+    ),
+    re_path(r"^secure-media/(?P<path>.+)$", courses_views.media_gateway, name='media_gateway'),
+    re_path(r"^media/(?P<path>.*)$", courses_views.public_media),
+]
 
 # Custom 404 handler
 handler404 = views.custom_404
@@ -27,3 +27,232 @@ let mainCatalogSwiper = new Swiper(".main-catalog__swiper", {
     }
   },
 });
+
+// "Show more" for paginated course lists: append the next page of cards
+// and replace the button with the one from the response
+document.addEventListener('click', function (event) {
+  const button = event.target.closest('[data-show-more] button');
+  if (!button) {
+    return;
+  }
+
+  const wrapper = button.closest('[data-show-more]');
+  const grid = wrapper.parentElement.querySelector('[data-courses-grid]');
+  button.disabled = true;
+
+  fetch(button.dataset.url, {
+    headers: {'X-Requested-With': 'XMLHttpRequest'}
+  })
+    .then(response => response.ok ? response.text() : Promise.reject(`HTTP ${response.status}`))
+    .then(html => {
+      const page = document.createElement('div');
+      page.innerHTML = html;
+
+      const nextGrid = page.querySelector('[data-courses-grid]');
+      if (grid && nextGrid) {
+        grid.append(...nextGrid.children);
+      }
+
+      const nextButton = page.querySelector('[data-show-more]');
+      if (nextButton) {
+        wrapper.replaceWith(nextButton);
+      } else {
+        wrapper.remove();
+      }
+    })
+    .catch(error => {
+      console.error('Show more error:', error);
+      button.disabled = false;
+    });
+});
+
+// Video player source: HLS renditions through hls.js (natively in Safari) once the
+// video is transcoded, the original file otherwise. A [data-video-quality] select
+// next to the player lets the viewer pin a rendition instead of automatic switching.
+let activeHls = null;
+
+function unloadVideoSource(player) {
+  stopPlaybackTelemetry();
+  if (activeHls) {
+    activeHls.destroy();
+    activeHls = null;
+  }
+  player.removeAttribute('src');
+}
+
+function loadVideoSource(player, source) {
+  unloadVideoSource(player);
+  player.poster = source.poster || '';
+
+  const qualitySelect = player.parentElement.querySelector('[data-video-quality]');
+  if (qualitySelect) {
+    qualitySelect.innerHTML = '';
+    qualitySelect.hidden = true;
+  }
+
+  if (source.hls && window.Hls && Hls.isSupported()) {
+    activeHls = new Hls();
+    activeHls.loadSource(source.hls);
+    activeHls.attachMedia(player);
+    activeHls.on(Hls.Events.MANIFEST_PARSED, function (event, data) {
+      if (!qualitySelect) {
+        return;
+      }
+      qualitySelect.add(new Option('Авто', '-1'));
+      data.levels.forEach((level, index) => qualitySelect.add(new Option(`${level.height}p`, index)));
+      qualitySelect.value = '-1';
+      qualitySelect.hidden = data.levels.length < 2;
+    });
+  } else if (source.hls && player.canPlayType('application/vnd.apple.mpegurl')) {
+    player.src = source.hls;
+  } else {
+    player.src = source.url || '';
+  }
+
+  if (source.id && player.dataset.telemetryUrl) {
+    startPlaybackTelemetry(player, source.id);
+  }
+}
+
+document.addEventListener('change', function (event) {
+  if (activeHls && event.target.matches('[data-video-quality]')) {
+    activeHls.currentLevel = parseInt(event.target.value, 10);
+  }
+});
+
+// Playback telemetry for players with data-telemetry-url: the position and the
+// intervals actually played are buffered per video and posted in one request every
+// TELEMETRY_SEND_INTERVAL ms, when the video changes and when the page is hidden.
+// The player resumes from the last position ([data-resume-position] of the video
+// row on page load, the last reported one afterwards).
+const TELEMETRY_SEND_INTERVAL = 30000;
+const TELEMETRY_CHUNK_SECONDS = 5;
+const telemetryPending = {};
+const resumePositions = {};
+let telemetry = null;
+
+function getTelemetryEvent(videoId) {
+  if (!telemetryPending[videoId]) {
+    telemetryPending[videoId] = {video_id: videoId, position: null, intervals: []};
+  }
+  return telemetryPending[videoId];
+}
+
+function closeTelemetryInterval() {
+  if (!telemetry || telemetry.intervalStart === null) {
+    return;
+  }
+  const end = telemetry.player.currentTime;
+  if (end > telemetry.intervalStart) {
+    getTelemetryEvent(telemetry.videoId).intervals.push([telemetry.intervalStart, end]);
+  }
+  telemetry.intervalStart = telemetry.player.paused ? null : end;
+}
+
+function recordTelemetryPosition() {
+  if (!telemetry || !(telemetry.player.currentTime > 0)) {
+    return;
+  }
+  const position = Math.floor(telemetry.player.currentTime);
+  getTelemetryEvent(telemetry.videoId).position = position;
+  resumePositions[telemetry.videoId] = position;
+}
+
+function sendTelemetry(url) {
+  const events = Object.values(telemetryPending);
+  if (!url || !events.length) {
+    return;
+  }
+  Object.keys(telemetryPending).forEach(key => delete telemetryPending[key]);
+
+  const csrfToken = document.querySelector('[name=csrfmiddlewaretoken]')?.value ||
+    document.querySelector('meta[name=csrf-token]')?.getAttribute('content');
+  // keepalive lets the request outlive the page on close
+  fetch(url, {
+    method: 'POST',
+    keepalive: true,
+    headers: {'Content-Type': 'application/json', 'X-CSRFToken': csrfToken},
+    body: JSON.stringify({events: events})
+  }).catch(error => console.error('Telemetry error:', error));
+}
+
+function getResumePosition(videoId) {
+  if (videoId in resumePositions) {
+    return resumePositions[videoId];
+  }
+  const row = document.querySelector(`[data-video-id="${videoId}"] [data-resume-position]`);
+  return row ? parseInt(row.dataset.resumePosition, 10) || 0 : 0;
+}
+
+function onTelemetryEvent(event) {
+  if (!telemetry || event.target !== telemetry.player) {
+    return;
+  }
+  const player = telemetry.player;
+  if (event.type === 'playing') {
+    telemetry.intervalStart = player.currentTime;
+  } else if (event.type === 'seeking') {
+    // The interval before the seek ends where playback was, not where it jumps to
+    if (telemetry.intervalStart !== null && telemetry.lastTime > telemetry.intervalStart) {
+      getTelemetryEvent(telemetry.videoId).intervals.push([telemetry.intervalStart, telemetry.lastTime]);
+    }
+    telemetry.intervalStart = player.paused ? null : player.currentTime;
+  } else if (event.type === 'timeupdate') {
+    if (!player.seeking) {
+      telemetry.lastTime = player.currentTime;
+    }
+    if (telemetry.intervalStart !== null && player.currentTime - telemetry.intervalStart >= TELEMETRY_CHUNK_SECONDS) {
+      closeTelemetryInterval();
+      recordTelemetryPosition();
+    }
+  } else {
+    // pause, ended
+    closeTelemetryInterval();
+    telemetry.intervalStart = null;
+    recordTelemetryPosition();
+  }
+}
+
+function startPlaybackTelemetry(player, videoId) {
+  if (!player.dataset.telemetryBound) {
+    ['playing', 'pause', 'ended', 'seeking', 'timeupdate'].forEach(type => player.addEventListener(type, onTelemetryEvent));
+    player.dataset.telemetryBound = '1';
+  }
+  telemetry = {
+    player: player,
+    videoId: videoId,
+    url: player.dataset.telemetryUrl,
+    intervalStart: null,
+    lastTime: 0,
+    timer: setInterval(() => sendTelemetry(player.dataset.telemetryUrl), TELEMETRY_SEND_INTERVAL)
+  };
+
+  const resumeAt = getResumePosition(videoId);
+  if (resumeAt > 0) {
+    player.addEventListener('loadedmetadata', function () {
+      // Do not resume into the closing seconds, start over instead
+      if (resumeAt < player.duration - 10) {
+        player.currentTime = resumeAt;
+      }
+    }, {once: true});
+  }
+}
+
+function stopPlaybackTelemetry() {
+  if (!telemetry) {
+    return;
+  }
+  closeTelemetryInterval();
+  recordTelemetryPosition();
+  clearInterval(telemetry.timer);
+  sendTelemetry(telemetry.url);
+  telemetry = null;
+}
+
+window.addEventListener('pagehide', function () {
+  if (telemetry) {
+    closeTelemetryInterval();
+    recordTelemetryPosition();
+    sendTelemetry(telemetry.url);
+  }
+});